@@ -1,6 +1,19 @@
 from __future__ import (absolute_import)
 
+import importlib
+
 from .version import __version__
 
-from . import analyzers as analyzers
-from . import utils as utils
+# 子包按需导入，import btplugin不加载backtrader/pandas/numpy
+_SUBMODULES = ('analyzers', 'utils')
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES))
@@ -1,4 +1,41 @@
 from __future__ import (absolute_import)
 
-from .trade import *
-from .overall import *
\ No newline at end of file
+import importlib
+
+# 对外名称所在的子模块，首次访问时导入(backtrader随之导入)
+_EXPORTS = {
+    'DailyTradeStats': 'trade',
+    'daily_trade_result': 'trade',
+    'TRADE_SCHEMA': 'trade',
+    'MarcketDataAnalyzer': 'overall',
+    'SparsePositionsValue': 'overall',
+    'SpillTimeReturn': 'overall',
+    'SpillTransactions': 'overall',
+    'RunningTimeReturn': 'overall',
+    'BktGeneraStatics': 'overall',
+    'genera_statics_result': 'overall',
+    'long_position_frame': 'overall',
+    'SWEEP_ANALYZERS': 'sweep',
+    'RESULT_FUNCTIONS': 'sweep',
+    'extract_payload': 'sweep',
+    'aggregate_results': 'sweep',
+    'compute_payload': 'sweep',
+    'SegmentAnalysis': 'segment',
+    'walk_forward_segments': 'segment',
+}
+_SUBMODULES = ('trade', 'overall', 'sweep', 'segment')
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
@@ -1,31 +1,247 @@
 import backtrader as bt
+import numpy as np
 import pandas as pd
-from ..utils import analysis_util, bt_resulst_utils
+from ..utils import analysis_util, bt_resulst_utils, profile_utils, record_utils, streaming_utils
+
+
+# BktGeneraStatics.result()中直接取自_relative的结果
+DERIVED_RESULTS = ('relative_analysis', 'rolling_beta', 'relative_drawdown')
 
 
 class MarcketDataAnalyzer(bt.Analyzer):
     """
     收集data的close value，用于计算当日市值
+    columnar=True时按列记录至预分配数组，stop时在rets['frame']中生成DataFrame
+    spill_dir不为None时按块落盘，stop时rets['spill']为record_utils.SpillBuffer
     """
     params = (
         ('headers', False),
+        ('columnar', False),
+        ('instrument', None),  # profile_utils.Instrumentation，记录next/stop耗时
+        ('spill_dir', None),  # 按块落盘的目录，True为系统临时目录(回收时删除)
+        ('chunk_rows', 65536),  # 落盘时每块的行数
     )
 
+    def __init__(self):
+        profile_utils.attach(self, self.p.instrument)
+
     def start(self):
+        headers = [d._name or 'Data%d' % i
+                   for i, d in enumerate(self.datas)]
         if self.p.headers:
-            headers = [d._name or 'Data%d' % i
-                       for i, d in enumerate(self.datas)]
             self.rets['Datetime'] = headers
 
         tf = min(d._timeframe for d in self.datas)
         self._usedate = tf >= bt.TimeFrame.Days
+        if self.p.columnar or self.p.spill_dir is not None:
+            self._headers = headers
+            self._buffer = record_utils.make_buffer([
+                ('date', 'datetime64[us]'),
+                ('close', ('float64', len(self.datas))),
+            ], self.p.spill_dir, self.p.chunk_rows, prefix='marcket_data_')
 
     def next(self):
         pvals = [d.close[0] for d in self.datas]
         if self._usedate:
-            self.rets[self.strategy.datetime.date()] = pvals
+            dt = self.strategy.datetime.date()
         else:
-            self.rets[self.strategy.datetime.datetime()] = pvals
+            dt = self.strategy.datetime.datetime()
+        if self.p.columnar or self.p.spill_dir is not None:
+            self._buffer.append(dt, pvals)
+        else:
+            self.rets[dt] = pvals
+
+    def stop(self):
+        super(MarcketDataAnalyzer, self).stop()
+        if self.p.spill_dir is not None:
+            self._buffer.flush()
+            self.rets['headers'] = self._headers
+            self.rets['spill'] = self._buffer
+        elif self.p.columnar:
+            self.rets['frame'] = self._buffer.to_frame(index='date', columns=self._headers)
+
+
+class SparsePositionsValue(bt.Analyzer):
+    """
+    只记录非零持仓的PositionsValue，长表(date, order_book_id, position)形式
+    持仓的data由notify_order维护，每bar只遍历当前持仓，现金每bar单独记录
+    stop时rets['frame']为持仓长表(按日期、data顺序排列)，rets['cash']为现金序列
+    spill_dir不为None时按块落盘，rets['spill']/rets['cash_spill']为record_utils.SpillBuffer
+    """
+    params = (
+        ('instrument', None),  # profile_utils.Instrumentation，记录next/stop耗时
+        ('spill_dir', None),  # 按块落盘的目录，True为系统临时目录(回收时删除)
+        ('chunk_rows', 65536),  # 落盘时每块的行数
+    )
+
+    def __init__(self):
+        profile_utils.attach(self, self.p.instrument)
+
+    def start(self):
+        self._headers = [d._name or 'Data%d' % i for i, d in enumerate(self.datas)]
+        self._data_index = {d: i for i, d in enumerate(self.datas)}
+        tf = min(d._timeframe for d in self.datas)
+        self._usedate = tf >= bt.TimeFrame.Days
+        self._holding = {}
+        self._buffer = record_utils.make_buffer([
+            ('date', 'datetime64[us]'),
+            ('data', 'int64'),
+            ('position', 'float64'),
+        ], self.p.spill_dir, self.p.chunk_rows, prefix='positions_')
+        self._cash = record_utils.make_buffer([
+            ('date', 'datetime64[us]'),
+            ('cash', 'float64'),
+        ], self.p.spill_dir, self.p.chunk_rows, prefix='cash_')
+
+    def notify_order(self, order):
+        if order.status not in [order.Partial, order.Completed]:
+            return
+        if self.strategy.broker.getposition(order.data).size:
+            self._holding[order.data] = self._data_index[order.data]
+        else:
+            self._holding.pop(order.data, None)
+
+    def next(self):
+        broker = self.strategy.broker
+        if self._usedate:
+            dt = self.strategy.datetime.date()
+        else:
+            dt = self.strategy.datetime.datetime()
+        rows = []
+        for d, i in self._holding.items():
+            value = broker.get_value([d])
+            if value:
+                rows.append((dt, i, value))
+        self._buffer.extend(rows)
+        self._cash.append(dt, broker.get_cash())
+
+    def stop(self):
+        super(SparsePositionsValue, self).stop()
+        self.rets['headers'] = self._headers
+        if self.p.spill_dir is not None:
+            self._buffer.flush()
+            self._cash.flush()
+            self.rets['spill'] = self._buffer
+            self.rets['cash_spill'] = self._cash
+            return
+        self.rets['frame'] = long_position_frame(self._buffer.to_frame(), self._headers)
+        cash = self._cash.to_frame(index='date')['cash']
+        cash.index = pd.DatetimeIndex(cash.index, name='date')
+        self.rets['cash'] = cash
+
+
+def long_position_frame(frame, headers) -> pd.DataFrame:
+    """
+    SparsePositionsValue记录的(date, data, position)转换为按日期、data顺序排列的持仓长表
+    """
+    order = np.lexsort((frame['data'].to_numpy(), frame['date'].to_numpy()))
+    frame = frame.iloc[order].reset_index(drop=True)
+    frame.insert(1, 'order_book_id', np.asarray(headers, dtype=object)[frame.pop('data').to_numpy()])
+    frame['date'] = pd.DatetimeIndex(frame['date'])
+    return frame
+
+
+class SpillTimeReturn(bt.analyzers.TimeReturn):
+    """
+    按块落盘的TimeReturn，每期收益在期末写入record_utils.SpillBuffer
+    stop时rets['spill']的列为date/return
+    """
+    params = (
+        ('spill_dir', None),
+        ('chunk_rows', 65536),
+    )
+
+    def start(self):
+        super(SpillTimeReturn, self).start()
+        self._buffer = record_utils.SpillBuffer([
+            ('date', 'datetime64[us]'),
+            ('return', 'float64'),
+        ], self.p.spill_dir, self.p.chunk_rows, prefix='returns_')
+        self._period = None
+
+    def on_dt_over(self):
+        if self._period is not None:
+            self._buffer.append(*self._period)
+            self._period = None
+        super(SpillTimeReturn, self).on_dt_over()
+
+    def next(self):
+        self._period = (self.dtkey, (self._value / self._value_start) - 1.0)
+        self._lastvalue = self._value
+
+    def stop(self):
+        super(SpillTimeReturn, self).stop()
+        if self._period is not None:
+            self._buffer.append(*self._period)
+            self._period = None
+        self._buffer.flush()
+        self.rets['spill'] = self._buffer
+
+
+class SpillTransactions(bt.analyzers.Transactions):
+    """
+    按块落盘的Transactions，stop时rets['spill']的列为date/amount/price/sid/value
+    """
+    params = (
+        ('spill_dir', None),
+        ('chunk_rows', 65536),
+    )
+
+    def start(self):
+        super(SpillTransactions, self).start()
+        self._buffer = record_utils.SpillBuffer([
+            ('date', 'datetime64[us]'),
+            ('amount', 'int64'),
+            ('price', 'float64'),
+            ('sid', 'int64'),
+            ('value', 'float64'),
+        ], self.p.spill_dir, self.p.chunk_rows, prefix='transactions_')
+
+    def next(self):
+        dt = None
+        rows = []
+        for i, dname in self._idnames:
+            pos = self._positions.get(dname, None)
+            if pos is not None and pos.size:
+                dt = dt or self.strategy.datetime.datetime()
+                rows.append((dt, pos.size, pos.price, i, -pos.size * pos.price))
+        self._buffer.extend(rows)
+        self._positions.clear()
+
+    def stop(self):
+        super(SpillTransactions, self).stop()
+        self._buffer.flush()
+        self.rets['headers'] = [dname for _, dname in self._idnames]
+        self.rets['spill'] = self._buffer
+
+
+class RunningTimeReturn(bt.analyzers.TimeReturn):
+    """
+    不保存历史的TimeReturn，每期收益在期末计入RunningNetvalueStats
+    """
+
+    def start(self):
+        super(RunningTimeReturn, self).start()
+        self.stats = streaming_utils.RunningNetvalueStats()
+        self._period_return = None
+
+    def on_dt_over(self):
+        if self._period_return is not None:
+            self.stats.update(self._period_return)
+            self._period_return = None
+        super(RunningTimeReturn, self).on_dt_over()
+
+    def next(self):
+        self._period_return = (self._value / self._value_start) - 1.0
+        self._lastvalue = self._value
+
+    def current_stats(self):
+        """
+        包含当前未结束周期的指标
+        """
+        if self._period_return is None:
+            return self.stats
+        return self.stats.updated(self._period_return)
 
 
 class BktGeneraStatics(bt.Analyzer):
@@ -33,24 +249,112 @@ class BktGeneraStatics(bt.Analyzer):
         ('timeframe', bt.TimeFrame.Days),
         ('compression', 1),
         ('strategy_freq', 'W'),  # 策略信号频率，用于进行交易结果分析
-        ('npv_freq', 'D'),  # 对应日度价格数据
+        ('npv_freq', 'D'),  # 对应日度价格数据，分钟/小时数据使用analysis_util.INTRADAY_BARS_PER_DAY中的频率
         ('rf', 0.),
         ('future_like', False),
-        ('mult_dict', {})
+        ('mult_dict', {}),
+        ('columnar', False),  # 行情数据按列记录
+        ('incremental', False),  # 回测中逐bar更新指标，不保存历史，result只返回analysis
+        ('instrument', None),  # profile_utils.Instrumentation，记录next/stop及result各结果的计算耗时
+        ('rolling_windows', ()),  # 滚动指标的窗口长度(期数)，如(60, 120, 250)，为空时不计算
+        ('sparse_positions', False),  # 仓位只记录非零持仓的长表，适用于大股票池
+        ('spill_dir', None),  # 收益、仓位(同sparse_positions)、交易按块落盘的目录，analysis/yearly_analysis逐块计算，True为系统临时目录(回收时删除)
+        ('spill_chunk_rows', 65536),  # 落盘时每块的行数
+        ('benchmarks', None),  # 基准: data名/data的列表，或{基准名: data名/data/价格pd.Series}
+        ('benchmark_window', 60),  # 滚动beta的窗口长度(期数)
+        ('turnover_engine', 'numpy'),  # 换手率计算内核，同analysis_util.period_turnover_stats；spill_dir时逐块计算，不使用
     )
 
     def __init__(self):
+        profile_utils.attach(self, self.p.instrument)
+        if self.p.turnover_engine not in analysis_util.TURNOVER_ENGINES:
+            raise ValueError(f"BktGeneraStatics - Invalid turnover_engine:{self.p.turnover_engine}")
         tr_param = dict(timeframe=self.p.timeframe,
                         compression=self.p.compression)
+        self._benchmark_returns = {}
+        self._benchmark_series = {}
+        for name, bench in self._iter_benchmarks():
+            if isinstance(bench, pd.Series):
+                self._benchmark_series[name] = bench
+            else:
+                self._benchmark_returns[name] = bt.analyzers.TimeReturn(data=bench, **tr_param)
+        if self.p.incremental:
+            if self.p.future_like:
+                raise ValueError("BktGeneraStatics - incremental mode does not support future_like")
+            self._returns = RunningTimeReturn(**tr_param)
+            self._turnover = streaming_utils.RunningTurnover(self.p.strategy_freq)
+            return
+        if self.p.spill_dir is not None:
+            if self.p.future_like:
+                raise ValueError("BktGeneraStatics - spill_dir does not support future_like")
+            spill_param = dict(spill_dir=self.p.spill_dir, chunk_rows=self.p.spill_chunk_rows)
+            self._returns = SpillTimeReturn(**tr_param, **spill_param)
+            self._positions = SparsePositionsValue(instrument=self.p.instrument, **spill_param)
+            self._transactions = SpillTransactions(**spill_param)
+            return
         self._returns = bt.analyzers.TimeReturn(**tr_param)
-        self._positions = bt.analyzers.PositionsValue(headers=True, cash=True)
+        if self.p.sparse_positions:
+            if self.p.future_like:
+                raise ValueError("BktGeneraStatics - sparse_positions does not support future_like")
+            self._positions = SparsePositionsValue(instrument=self.p.instrument)
+        else:
+            self._positions = bt.analyzers.PositionsValue(headers=True, cash=True)
         if self.p.future_like:
-            self._marcket_data = MarcketDataAnalyzer(headers=True)
+            self._marcket_data = MarcketDataAnalyzer(headers=True, columnar=self.p.columnar,
+                                                     instrument=self.p.instrument)
         self._transactions = bt.analyzers.Transactions(headers=True)
 
+    def _iter_benchmarks(self):
+        """
+        (基准名, data或价格序列)
+        """
+        benchmarks = self.p.benchmarks
+        if benchmarks is None:
+            return
+        if self.p.incremental:
+            raise ValueError("BktGeneraStatics - incremental mode does not support benchmarks")
+        items = benchmarks.items() if isinstance(benchmarks, dict) else ((None, b) for b in benchmarks)
+        for name, bench in items:
+            if isinstance(bench, str):
+                data = self.strategy.getdatabyname(bench)
+                yield name or bench, data
+            elif isinstance(bench, pd.Series):
+                yield name or bench.name, bench
+            else:
+                yield name or bench._name, bench
+
+    def notify_order(self, order):
+        if not self.p.incremental or order.status not in [order.Partial, order.Completed]:
+            return
+        dt = self.strategy.datetime.date()
+        for exbit in order.executed.iterpending():
+            self._turnover.add_transaction(dt, exbit.size * exbit.price)
+
+    def next(self):
+        if self.p.incremental:
+            broker = self.strategy.broker
+            self._turnover.update(self.strategy.datetime.date(), broker.getvalue() - broker.getcash())
+
+    def snapshot(self) -> pd.Series:
+        """
+        incremental模式下当前bar的指标，格式同result()['analysis']
+        """
+        if not self.p.incremental:
+            raise ValueError("BktGeneraStatics - snapshot is only available in incremental mode")
+        df_analysis = self._returns.current_stats().analysis(freq=self.p.npv_freq, rf=self.p.rf)
+        df_analysis['年化换手率'] = self._turnover.turnover()
+        return df_analysis
+
     def stop(self):
         super(BktGeneraStatics, self).stop()
+        self._result_cache = None
+        if self.p.incremental:
+            self.rets['analysis'] = self.snapshot()
+            return
         self.rets['returns'] = self._returns.get_analysis()
+        if self.p.benchmarks is not None:
+            self.rets['benchmarks'] = {name: tr.get_analysis() for name, tr in self._benchmark_returns.items()}
+            self.rets['benchmarks'].update(self._benchmark_series)
         self.rets['positions'] = self._positions.get_analysis()
         self.rets['transactions'] = self._transactions.get_analysis()
         if self.p.future_like:
@@ -58,37 +362,218 @@ class BktGeneraStatics(bt.Analyzer):
 
     def result(self):
         """
-        返回分析器的结果,包括三个Dateframe
-        1. 综合分析dataframe
-        2. 仓位表
-        3. 交易表
-        :return:
+        返回分析器的结果，各结果在首次访问时计算并缓存，直至下一次回测结束
+        npv: 净值、收益率与回撤
+        analysis: 综合分析
+        yearly_analysis: 分年度分析
+        rolling_analysis: 滚动窗口分析，未设置rolling_windows时为None
+        drawdown_episodes: 回撤区间
+        relative_analysis / rolling_beta / relative_drawdown: 相对基准的分析，未设置benchmarks时为None
+        position: 仓位表
+        transaction: 交易表，future_like时增加volume/value_with_mult列
+        spill_dir时analysis/yearly_analysis逐块计算，其余结果在访问时从磁盘读取全部数据
+        返回只读的Mapping而非dict，不支持赋值；每次访问得到缓存结果的副本，可原地修改
+        :return: bt_resulst_utils.LazyResult
+        """
+        if self.p.incremental:
+            return {'analysis': self.rets['analysis']}
+        cache = getattr(self, '_result_cache', None)
+        if cache is None:
+            cache = self._result_cache = genera_statics_result(self.p, self.rets)
+        return cache
+
+
+def genera_statics_result(p, rets):
+    """
+    由BktGeneraStatics的参数与stop()后的rets计算result()，不依赖analyzer实例，可在其他进程中调用
+    :param p: BktGeneraStatics的参数，可为具有同名属性的types.SimpleNamespace
+    :param rets: BktGeneraStatics.rets
+    :return: 同BktGeneraStatics.result()
+    """
+    if p.incremental:
+        return {'analysis': rets['analysis']}
+    return _GeneraStaticsResult(p, rets).lazy_result()
+
+
+class _GeneraStaticsResult(object):
+    """
+    BktGeneraStatics.result()中各结果的计算
+    """
+
+    def __init__(self, p, rets):
+        self.p = p
+        self.rets = rets
+
+    def lazy_result(self) -> bt_resulst_utils.LazyResult:
+        return bt_resulst_utils.LazyResult({
+            '_returns': self._build_returns,
+            '_npv': lambda res: (1 + res['_returns']).cumprod(),
+            '_positions': self._build_positions,
+            '_cash': self._build_cash,
+            '_transactions': self._build_transactions,
+            '_market_value': self._build_market_value,
+            '_turnover': self._build_turnover,
+            'npv': self._build_npv,
+            'analysis': self._build_analysis,
+            'yearly_analysis': self._build_yearly_analysis,
+            'rolling_analysis': self._build_rolling_analysis,
+            'drawdown_episodes': lambda res: analysis_util.get_drawdown_episodes(res['_npv']),
+            '_relative': self._build_relative,
+            'relative_analysis': lambda res: self._relative_part(res, 'analysis'),
+            'rolling_beta': lambda res: self._relative_part(res, 'rolling_beta'),
+            'relative_drawdown': lambda res: self._relative_part(res, 'relative_drawdown'),
+            'position': self._build_position,
+            'transaction': self._build_transaction,
+        }, stage=self._result_stage)
+
+    def _result_stage(self, key):
+        """
+        result各结果的耗时统计，以key区分中间结果与对外结果；只从已缓存结果中取值的key不单独统计
         """
-        # Returns
+        instrument = None if key in DERIVED_RESULTS else self.p.instrument
+        return profile_utils.stage(instrument, 'BktGeneraStatics.result.' + key)
+
+    def _spill(self):
+        return self.p.spill_dir is not None
+
+    def _build_returns(self, res):
+        if self._spill():
+            returns = self.rets['returns']['spill'].to_frame(index='date')['return']
+            returns.index = pd.DatetimeIndex(returns.index, name='index')
+            return returns
         cols = ['index', 'return']
         returns = pd.DataFrame.from_records(iter(self.rets['returns'].items()), index=cols[0], columns=cols)
         returns.index = pd.to_datetime(returns.index)
-        rets = returns['return']
-        # _npv
-        _npv = (1 + rets).cumprod()
-        # Position value
-        p_df = bt_resulst_utils.build_position_value(self.rets['positions'])
-        # Transaction value
-        t_df = bt_resulst_utils.build_transaction(self.rets['transactions'])
-        # Turnover value
-        if self.p.future_like:
-            df_macket_data = bt_resulst_utils.build_market_data(self.rets['marcket_data'])
-            p_df = bt_resulst_utils.patch_future_position(p_df, t_df, df_macket_data, self.p.mult_dict)
-            turnover = analysis_util.future_average_turnover(p_df, t_df, mult_dict=self.p.mult_dict)
+        return returns['return']
+
+    def _build_positions(self, res):
+        """
+        sparse_positions/spill_dir时为SparsePositionsValue的持仓长表，否则为宽表
+        """
+        if self._spill():
+            positions = self.rets['positions']
+            return long_position_frame(positions['spill'].to_frame(), positions['headers'])
+        if self.p.sparse_positions:
+            return self.rets['positions']['frame']
+        return bt_resulst_utils.build_position_value(self.rets['positions'])
+
+    def _build_cash(self, res):
+        """
+        SparsePositionsValue记录的现金
+        """
+        if self._spill():
+            cash = self.rets['positions']['cash_spill'].to_frame(index='date')['cash']
+            cash.index = pd.DatetimeIndex(cash.index, name='date')
+            return cash
+        return self.rets['positions']['cash']
+
+    def _build_transactions(self, res):
+        if not self._spill():
+            return bt_resulst_utils.build_transaction(self.rets['transactions'])
+        transactions = self.rets['transactions']
+        t_df = transactions['spill'].to_frame(index='date')
+        t_df.index = pd.DatetimeIndex(t_df.index, name='date')
+        t_df.insert(3, 'symbol', np.asarray(transactions['headers'], dtype=object)[t_df['sid'].to_numpy()])
+        return t_df
+
+    def _build_market_value(self, res):
+        """
+        期货按行情计算的持仓市值，与保证金合并的仓位表
+        """
+        if 'frame' in self.rets['marcket_data']:
+            df_macket_data = self.rets['marcket_data']['frame']
         else:
-            turnover = analysis_util.average_turnover(p_df, t_df, self.p.strategy_freq)
-        df_analysis = analysis_util.get_netvalue_analysis(_npv, freq=self.p.npv_freq, rf=self.p.rf)
-        df_analysis['年化换手率'] = turnover
-        df_npv = pd.DataFrame({
+            df_macket_data = bt_resulst_utils.build_market_data(self.rets['marcket_data'])
+        return bt_resulst_utils.patch_future_position(
+            res['_positions'], res['_transactions'], df_macket_data, self.p.mult_dict)
+
+    def _build_turnover(self, res):
+        if self.p.future_like:
+            return analysis_util.future_average_turnover(
+                res['_market_value'], res['_transactions'], mult_dict=self.p.mult_dict, engine=self.p.turnover_engine)
+        if self._spill():
+            positions, transactions = self.rets['positions'], self.rets['transactions']
+            return streaming_utils.chunked_average_turnover(
+                (c['date'] for c in positions['cash_spill'].chunks(['date'])),
+                ((c['date'], c['position']) for c in positions['spill'].chunks(['date', 'position'])),
+                ((c['date'], c['value']) for c in transactions['spill'].chunks(['date', 'value'])),
+                self.p.strategy_freq)
+        if self.p.sparse_positions:
+            return analysis_util.long_average_turnover(res['_positions'], res['_cash'].index, res['_transactions'],
+                                                       self.p.strategy_freq, engine=self.p.turnover_engine)
+        return analysis_util.average_turnover(res['_positions'], res['_transactions'], self.p.strategy_freq,
+                                              engine=self.p.turnover_engine)
+
+    def _build_npv(self, res):
+        _npv = res['_npv']
+        return pd.DataFrame({
             'npv': _npv,
-            'r': rets,
+            'r': res['_returns'],
             'maxdrawdowns': analysis_util.get_maxdrawdown(_npv)
         })
+
+    def _intraday(self):
+        """
+        日内净值降采样为日度后统计，回撤使用全分辨率净值
+        """
+        return self.p.npv_freq.upper() in analysis_util.INTRADAY_BARS_PER_DAY
+
+    def _return_chunks(self):
+        return ((c['date'], c['return']) for c in self.rets['returns']['spill'].chunks())
+
+    def _build_analysis(self, res):
+        if self._spill():
+            df_analysis = streaming_utils.chunked_netvalue_analysis(
+                self._return_chunks(), freq=self.p.npv_freq, rf=self.p.rf)
+        elif self._intraday():
+            df_analysis = analysis_util.get_intraday_analysis(res['_npv'], freq=self.p.npv_freq, rf=self.p.rf)
+        else:
+            df_analysis = analysis_util.get_netvalue_analysis(res['_npv'], freq=self.p.npv_freq, rf=self.p.rf)
+        df_analysis['年化换手率'] = res['_turnover']
+        return df_analysis
+
+    def _build_yearly_analysis(self, res):
+        if self._spill():
+            return streaming_utils.chunked_netvalue_analysis(
+                self._return_chunks(), freq=self.p.npv_freq, rf=self.p.rf, period='Y')
+        if self._intraday():
+            return analysis_util.get_intraday_analysis(res['_npv'], freq=self.p.npv_freq, rf=self.p.rf, period='Y')
+        return analysis_util.get_yearly_analysis(res['_npv'], freq=self.p.npv_freq, rf=self.p.rf)
+
+    def _build_rolling_analysis(self, res):
+        if not self.p.rolling_windows:
+            return None
+        if self._intraday():
+            # 日内净值的滚动窗口以日为单位
+            return analysis_util.get_rolling_analysis(
+                analysis_util.resample_netvalue(res['_npv']), freq='D', rf=self.p.rf, windows=self.p.rolling_windows)
+        return analysis_util.get_rolling_analysis(
+            res['_npv'], freq=self.p.npv_freq, rf=self.p.rf, windows=self.p.rolling_windows)
+
+    def _build_relative(self, res):
+        if self.p.benchmarks is None:
+            return None
+        _npv = res['_npv']
+        benchmarks, prices = {}, []
+        for name, bench in self.rets['benchmarks'].items():
+            if isinstance(bench, pd.Series):
+                benchmarks[name] = bench
+                prices.append(name)
+            else:
+                # TimeReturn的收益率与策略收益率的key一致
+                returns = pd.Series(list(bench.values()), index=pd.to_datetime(list(bench.keys())), dtype='float64')
+                benchmarks[name] = (1 + returns).cumprod()
+        return analysis_util.get_relative_analysis(_npv, benchmarks, freq=self.p.npv_freq, rf=self.p.rf,
+                                                   window=self.p.benchmark_window, normalize=prices)
+
+    def _relative_part(self, res, key):
+        relative = res['_relative']
+        return None if relative is None else relative[key]
+
+    def _build_position(self, res):
+        if self.p.sparse_positions or self._spill():
+            return bt_resulst_utils.build_long_position(res['_positions'], res['_cash'])
+        p_df = res['_market_value'] if self.p.future_like else res['_positions']
         p_df = p_df.reset_index()
         cols = []
         for c in p_df.columns:
@@ -97,11 +582,12 @@ class BktGeneraStatics(bt.Analyzer):
             cols.append(c)
         df_p_record = pd.melt(p_df, id_vars=['date'], value_vars=cols, var_name='order_book_id',
                               value_name='position').dropna(how="any")
-        df_yearly_analysis = analysis_util.get_yearly_analysis(_npv, freq=self.p.npv_freq, rf=self.p.rf)
-        return {
-            'npv': df_npv,
-            'analysis': df_analysis,
-            'yearly_analysis': df_yearly_analysis,
-            'position': df_p_record[df_p_record['position'] > 0].copy().sort_values(by='date'),
-            'transaction': t_df
-        }
+        return df_p_record[df_p_record['position'] > 0].copy().sort_values(by='date')
+
+    def _build_transaction(self, res):
+        t_df = res['_transactions']
+        if not self.p.future_like:
+            # LazyResult对外返回副本
+            return t_df
+        return t_df.assign(volume=bt_resulst_utils.future_volume(t_df),
+                           value_with_mult=analysis_util.value_with_mult(t_df, self.p.mult_dict))
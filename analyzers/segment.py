@@ -0,0 +1,302 @@
+import numpy as np
+import pandas as pd
+
+from ..utils import analysis_util, bt_resulst_utils
+
+
+class SegmentAnalysis(object):
+    """
+    由一次回测的记录对任意日期区间进行分析，不重新回测
+    构造时将收益率、持仓市值与成交额对齐到回测日期并计算累计净值，各区间只做位置查找
+    日线的成交与交易时间为bar时间(如GenericCSVData的23:59:59.999989)，区间边界与所有映射均按日进行
+    所有区间的综合/分年度指标与换手率在一次向量化计算中完成，区间净值以区间开始前一期为1
+    """
+
+    def __init__(self, stat, trade=None):
+        """
+        :param stat: 回测结束后的BktGeneraStatics
+        :param trade: 回测结束后的DailyTradeStats，为None时不计算收益贡献
+        """
+        p = stat.p
+        if p.incremental:
+            raise ValueError("SegmentAnalysis - incremental BktGeneraStatics does not record history")
+        if p.npv_freq.upper() in analysis_util.INTRADAY_BARS_PER_DAY:
+            raise ValueError(f"SegmentAnalysis - intraday npv_freq is not supported:{p.npv_freq}")
+        res = stat.result()
+        self.freq = p.npv_freq.upper()
+        self.rf = p.rf
+        returns = res['_returns']
+        self.dates = pd.DatetimeIndex(returns.index)
+        self._days = self.dates.normalize()
+        self._returns = returns.to_numpy(dtype='float64')
+        self._nav = np.cumprod(1 + self._returns)
+        self._prev_nav = np.r_[1., self._nav[:-1]]
+        self._year_codes, self._years = pd.factorize(
+            np.asarray(self.dates.strftime(analysis_util.FREQ_TIME_FORMAT_REF['Y'])))
+        if p.future_like:
+            self._turnover = _future_turnover_arrays(res, p.mult_dict)
+        else:
+            self._turnover = _turnover_arrays(p, res)
+        self._trades = None
+        if trade is not None:
+            df_trade = trade.result()['df_daily_pnl']
+            mask = (df_trade['date'] == df_trade['dtclose']) | (df_trade['status'] == 'Open')
+            # 交易按时间稳定排序，同一笔交易内保持原有顺序
+            self._trades = df_trade[mask].sort_values(by='date', kind='mergesort').reset_index(drop=True)
+            self._trade_dates = pd.DatetimeIndex(self._trades['date'])
+            self._trade_days = self._trade_dates.normalize()
+            self.contribution_freq = trade.p.contribution_freq
+            self.k = int(trade.p.k_largest)
+            period_codes, period_uniques = pd.factorize(
+                analysis_util.period_index(self._trade_dates, self.contribution_freq), sort=True)
+            self._trade_period_codes = period_codes
+            self._trade_period_keys = np.asarray(period_uniques.end_time.strftime(
+                analysis_util.FREQ_TIME_FORMAT_REF[self.contribution_freq]), dtype=object)
+
+    def bounds(self, segments):
+        """
+        :param segments: [(开始日期, 结束日期)] / {区间名: (开始日期, 结束日期)}，首尾均包含，None为回测首/末日
+        :return: (区间名pd.Index, 开始位置, 结束位置(不含))
+        """
+        if isinstance(segments, dict):
+            names = pd.Index(list(segments), name='segment')
+            segments = list(segments.values())
+        else:
+            segments = list(segments)
+            names = pd.RangeIndex(len(segments), name='segment')
+        starts = np.empty(len(segments), dtype=np.intp)
+        ends = np.empty(len(segments), dtype=np.intp)
+        for i, (start, end) in enumerate(segments):
+            starts[i] = 0 if start is None else self._days.searchsorted(pd.Timestamp(start).normalize(), side='left')
+            ends[i] = len(self.dates) if end is None else \
+                self._days.searchsorted(pd.Timestamp(end).normalize(), side='right')
+        empty = ends <= starts
+        if empty.any():
+            raise ValueError(f"SegmentAnalysis - no bars in segments:{list(names[empty])}")
+        return names, starts, ends
+
+    def npv(self, start=None, end=None) -> pd.DataFrame:
+        """
+        区间净值，列同BktGeneraStatics.result()['npv']
+        """
+        _, starts, ends = self.bounds([(start, end)])
+        s = slice(starts[0], ends[0])
+        npv = pd.Series(self._nav[s] / self._prev_nav[starts[0]], index=self.dates[s])
+        return pd.DataFrame({
+            'npv': npv,
+            'r': pd.Series(self._returns[s], index=npv.index),
+            'maxdrawdowns': analysis_util.get_maxdrawdown(npv),
+        })
+
+    def analyze(self, segments) -> dict:
+        """
+        :param segments: 同bounds
+        :return: {
+            'segments': pd.DataFrame, 行为区间, 列为start/end(区间内首末bar)/bars
+            'analysis': pd.DataFrame, 行为区间, 列为指标(同BktGeneraStatics的analysis)
+            'yearly_analysis': pd.DataFrame, 行为(区间, 指标), 列为年度
+            'df_top_k' / 'df_bottom_k': pd.DataFrame, 以(区间, 原index)为index，未传入DailyTradeStats时为None
+        }
+        """
+        names, starts, ends = self.bounds(segments)
+        idx, seg = _concat_ranges(starts, ends)
+        base = self._prev_nav[starts][seg]
+        values = self._nav[idx] / base
+        prev = self._prev_nav[idx] / base
+        oneyear = analysis_util.FREQ_ONEYEAR_MAP[self.freq]
+        labels = analysis_util._analysis_labels(self.freq)
+        n_seg = len(names)
+
+        metrics = analysis_util._netvalue_metrics(values, seg, n_seg, oneyear, self.rf, prev=prev)
+        df_analysis = pd.DataFrame(metrics.T, index=names, columns=labels)
+        df_analysis['年化换手率'] = self._segment_turnover(starts, ends)
+
+        # 区间内的年度在时间上连续，(区间, 年度)按出现顺序编号
+        n_years = len(self._years)
+        codes, uniques = pd.factorize(seg * n_years + self._year_codes[idx])
+        yearly_metrics = analysis_util._netvalue_metrics(values, codes, len(uniques), oneyear, self.rf, prev=prev)
+        yearly = np.full((n_seg, len(labels), n_years), np.nan)
+        yearly[uniques // n_years, :, uniques % n_years] = yearly_metrics.T
+        df_yearly = pd.DataFrame(
+            yearly.reshape(-1, n_years), index=pd.MultiIndex.from_product([names, labels], names=['segment', 'metric']),
+            columns=pd.Index(self._years, dtype=object))
+
+        df_top_k = df_bottom_k = None
+        if self._trades is not None:
+            df_top_k, df_bottom_k = self._contribution(names, starts, ends)
+        return {
+            'segments': pd.DataFrame({
+                'start': self.dates[starts],
+                'end': self.dates[ends - 1],
+                'bars': ends - starts,
+            }, index=names),
+            'analysis': df_analysis,
+            'yearly_analysis': df_yearly,
+            'df_top_k': df_top_k,
+            'df_bottom_k': df_bottom_k,
+        }
+
+    def _segment_turnover(self, starts, ends) -> np.ndarray:
+        """
+        区间内的平均换手率，口径同analysis_util.average_turnover / future_average_turnover
+        """
+        turnover = self._turnover
+        day_starts, day_ends = self._day_bounds(turnover['dates'], starts, ends)
+        n_seg = len(starts)
+        rates = np.full(n_seg, np.nan)
+        valid = day_ends > day_starts
+        if not valid.any():
+            return rates
+        idx, seg = _concat_ranges(day_starts[valid], day_ends[valid])
+        n_periods = turnover['n_periods']
+        group_key = seg * n_periods + turnover['period_codes'][idx]
+        # 区间内的周期在时间上连续
+        group_starts = np.flatnonzero(np.r_[True, group_key[1:] != group_key[:-1]])
+        group_ends = np.r_[group_starts[1:], len(idx)] - 1
+        group_seg = seg[group_starts]
+        traded = np.add.reduceat(turnover['traded'][idx], group_starts)
+        days = group_ends - group_starts + 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if turnover['future_like']:
+                group_rates = traded / turnover['position'][idx][group_starts] / days * 250
+            else:
+                group_rates = traded / turnover['position'][idx][group_ends] / turnover['days_in_period'] * 252
+                # 区间内首笔成交之前与末笔成交之后的周期不参与平均
+                has_trade = np.add.reduceat(turnover['counts'][idx], group_starts) > 0
+                group_pos = np.arange(len(group_starts))
+                first_trade = np.full(n_seg, len(group_starts))
+                np.minimum.at(first_trade, group_seg[has_trade], group_pos[has_trade])
+                last_trade = np.full(n_seg, -1)
+                np.maximum.at(last_trade, group_seg[has_trade], group_pos[has_trade])
+                outside = (group_pos < first_trade[group_seg]) | (group_pos > last_trade[group_seg])
+                group_rates[outside] = np.nan
+            counted = ~np.isnan(group_rates)
+            total = np.bincount(group_seg, np.where(counted, group_rates, 0.), minlength=valid.sum())
+            rates[valid] = total / np.bincount(group_seg, counted, minlength=valid.sum())
+        return rates
+
+    def _contribution(self, names, starts, ends):
+        """
+        各区间的收益贡献排名，所有区间的交易拼接后按(区间, 周期)分组一次计算，口径同DailyTradeStats
+        """
+        trades = self._trades
+        trade_starts, trade_ends = self._day_bounds(self._trade_days, starts, ends)
+        idx, seg = _concat_ranges(trade_starts, trade_ends)
+        if not len(idx):
+            empty = pd.DataFrame(columns=bt_resulst_utils.CONTRIBUTION_COLUMNS,
+                                 index=pd.MultiIndex.from_arrays([names[:0], []], names=['segment', None]))
+            return empty, empty.copy()
+        period_codes = self._trade_period_codes
+        n_periods = len(self._trade_period_keys)
+        group_codes, group_uniques = pd.factorize(seg * n_periods + period_codes[idx], sort=True)
+        group_keys = self._trade_period_keys[group_uniques % n_periods]
+        df_top_k, df_bottom_k, top_groups, bottom_groups = bt_resulst_utils.contribution_rank(
+            trades.iloc[idx], group_codes, group_keys, self.k)
+        df_top_k.index = pd.MultiIndex.from_arrays(
+            [names[group_uniques[top_groups] // n_periods], df_top_k.index], names=['segment', None])
+        df_bottom_k.index = pd.MultiIndex.from_arrays(
+            [names[group_uniques[bottom_groups] // n_periods], df_bottom_k.index], names=['segment', None])
+        return df_top_k, df_bottom_k
+
+    def _day_bounds(self, days, starts, ends):
+        """
+        区间在按日排序的days上的位置[开始, 结束)
+        区间从上一个bar之后的一日开始，至末个bar当日结束；首/末区间包含days中更早/更晚的全部日期
+        """
+        day_starts = days.searchsorted(self._days[np.maximum(starts - 1, 0)], side='right')
+        day_starts[starts == 0] = 0
+        day_ends = days.searchsorted(self._days[ends - 1], side='right')
+        day_ends[ends == len(self._days)] = len(days)
+        return day_starts, day_ends
+
+
+def walk_forward_segments(dates, train, test, step=None, anchored=False) -> dict:
+    """
+    滚动样本内/样本外区间
+    :param dates: 回测日期，如SegmentAnalysis.dates
+    :param train: 样本内的bar数
+    :param test: 样本外的bar数
+    :param step: 每次前移的bar数，默认为test
+    :param anchored: True为样本内起点固定在首个bar
+    :return: {'is_0': (开始日期, 结束日期), 'oos_0': (...), 'is_1': ...}，可直接传入SegmentAnalysis.analyze
+    """
+    dates = pd.DatetimeIndex(dates)
+    step = test if step is None else step
+    if train <= 0 or test <= 0 or step <= 0:
+        raise ValueError('walk_forward_segments -- Not Right train/test/step : ', (train, test, step))
+    segments = {}
+    for i, start in enumerate(range(0, len(dates) - train - test + 1, step)):
+        train_start = 0 if anchored else start
+        segments[f'is_{i}'] = (dates[train_start], dates[start + train - 1])
+        segments[f'oos_{i}'] = (dates[start + train], dates[start + train + test - 1])
+    return segments
+
+
+def _concat_ranges(starts, ends):
+    """
+    多个[start, end)区间的位置拼接
+    :return: (位置, 所属区间编号)
+    """
+    lengths = ends - starts
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    idx = np.arange(lengths.sum()) - offsets[seg] + starts[seg]
+    return idx, seg
+
+
+def _turnover_arrays(p, res) -> dict:
+    """
+    逐日的持仓市值(不含现金)、成交额与成交笔数，成交按日归入当日的持仓
+    """
+    freq = p.strategy_freq
+    if freq not in analysis_util.DAYS_IN_PERIOD or freq not in analysis_util.FREQ_GROUPER_MAP:
+        raise ValueError('SegmentAnalysis -- Not Right strategy_freq : ', freq)
+    positions = res['_positions']
+    if p.sparse_positions or p.spill_dir is not None:
+        position_dates = pd.DatetimeIndex(res['_cash'].index)
+        position = np.bincount(position_dates.get_indexer(positions['date']),
+                               weights=positions['position'].to_numpy(dtype='float64'), minlength=len(position_dates))
+    else:
+        position_dates = pd.DatetimeIndex(positions.index)
+        position = (positions.sum(axis=1) - positions['cash']).to_numpy(dtype='float64')
+    position_days = position_dates.normalize()
+    transactions = res['_transactions']
+    # 当日的成交计入当日最后一个持仓记录，早于首个持仓日的成交计入首日
+    t_codes = position_days.searchsorted(pd.DatetimeIndex(transactions.index).normalize(), side='right') - 1
+    t_codes = np.maximum(t_codes, 0)
+    traded = np.bincount(t_codes, weights=np.abs(transactions['value'].to_numpy(dtype='float64')),
+                         minlength=len(position_dates))
+    counts = np.bincount(t_codes, minlength=len(position_dates))
+    period_codes, period_uniques = pd.factorize(analysis_util.period_index(position_dates, freq), sort=True)
+    return {
+        'future_like': False,
+        'dates': position_days,
+        'position': position,
+        'traded': traded,
+        'counts': counts,
+        'period_codes': period_codes,
+        'n_periods': len(period_uniques),
+        'days_in_period': analysis_util.DAYS_IN_PERIOD[freq],
+    }
+
+
+def _future_turnover_arrays(res, mult_dict) -> dict:
+    """
+    逐日的平均持仓市值与计入乘数的成交额，口径同future_average_turnover(按年)
+    """
+    position_df = res['_market_value']
+    column_mask = [c for c in position_df.columns if 'market_value' in c]
+    position_sum = position_df[column_mask].abs().sum(axis=1).replace(0.0, np.nan)
+    daily_position = position_sum.groupby(position_sum.index.normalize()).mean().dropna()
+    transactions = res['_transactions']
+    traded = analysis_util.value_with_mult(transactions, mult_dict).abs()
+    daily_traded = traded.groupby(traded.index.normalize()).sum().reindex(index=daily_position.index)
+    period_codes, period_uniques = pd.factorize(analysis_util.period_index(daily_position.index, 'Y'), sort=True)
+    return {
+        'future_like': True,
+        'dates': pd.DatetimeIndex(daily_position.index),
+        'position': daily_position.to_numpy(dtype='float64'),
+        'traded': np.nan_to_num(daily_traded.to_numpy(dtype='float64')),
+        'period_codes': period_codes,
+        'n_periods': len(period_uniques),
+    }
@@ -0,0 +1,149 @@
+import collections
+import concurrent.futures
+import types
+
+import numpy as np
+import pandas as pd
+
+from ..utils import record_utils
+from .overall import BktGeneraStatics, genera_statics_result
+from .trade import DailyTradeStats, daily_trade_result
+
+# analyzer类及由(参数, rets)计算其result()的函数
+RESULT_FUNCTIONS = {
+    BktGeneraStatics: genera_statics_result,
+    DailyTradeStats: daily_trade_result,
+}
+SWEEP_ANALYZERS = tuple(RESULT_FUNCTIONS)
+
+
+def extract_payload(strategy) -> dict:
+    """
+    从回测结果(Strategy/OptReturn)中提取可序列化的analyzer原始数据
+    数值型的逐bar记录转换为np.ndarray，交易记录转换为DataFrame，减小进程间传输的体积
+    落盘的数据以SpillBuffer.view()传输，只读取原analyzer的目录，不负责删除
+    :param strategy: cerebro.run()返回的策略
+    :return: {'params': 策略参数, 'analyzers': {name: (analyzer类, analyzer参数, 压缩后的rets)}}
+    """
+    analyzers = {}
+    for name in strategy.analyzers.getnames():
+        analyzer = getattr(strategy.analyzers, name)
+        if not isinstance(analyzer, SWEEP_ANALYZERS):
+            continue
+        params = dict(analyzer.p._getkwargs())
+        # 耗时统计只在回测进程中有效，不随结果传输
+        params['instrument'] = None
+        analyzers[name] = (type(analyzer), params, _pack_rets(analyzer.rets))
+    return {
+        'params': dict(strategy.p._getkwargs()),
+        'analyzers': analyzers,
+    }
+
+
+def aggregate_results(runs, max_workers=None, chunksize=1) -> dict:
+    """
+    多进程计算参数优化中每组参数的BktGeneraStatics/DailyTradeStats结果
+    :param runs: cerebro.run()的返回(支持optstrategy的二维列表)，或extract_payload的结果列表
+    :param max_workers: 进程数，None为cpu核数，1为在当前进程中计算
+    :param chunksize: 每个进程一次处理的run数
+    :return: {
+        'summary': pd.DataFrame, 以run为index，包含策略参数及BktGeneraStatics的analysis指标
+        'results': list, 每个run的{analyzer名: result()}
+    }
+    """
+    payloads = [r if isinstance(r, dict) else extract_payload(r) for r in _flatten(runs)]
+    if max_workers == 1:
+        results = [compute_payload(p) for p in payloads]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(compute_payload, payloads, chunksize=chunksize))
+    return {
+        'summary': _build_summary(payloads, results),
+        'results': results,
+    }
+
+
+def compute_payload(payload) -> dict:
+    """
+    由extract_payload的结果计算各analyzer的result()
+    :return: {analyzer名: result()}
+    """
+    res = {}
+    for name, (analyzer_cls, params, packed) in payload['analyzers'].items():
+        result_function = next(f for cls, f in RESULT_FUNCTIONS.items() if issubclass(analyzer_cls, cls))
+        res[name] = dict(result_function(types.SimpleNamespace(**params), _unpack_rets(packed)))
+    return res
+
+
+def _build_summary(payloads, results) -> pd.DataFrame:
+    rows = []
+    for payload, result in zip(payloads, results):
+        row = dict(payload['params'])
+        names = [n for n, (cls, _, _) in payload['analyzers'].items() if issubclass(cls, BktGeneraStatics)]
+        for name in names:
+            prefix = '' if len(names) == 1 else name + '.'
+            for k, v in result[name]['analysis'].items():
+                row[prefix + k] = v
+        rows.append(row)
+    return pd.DataFrame(rows, index=pd.RangeIndex(len(rows), name='run'))
+
+
+def _flatten(runs):
+    for r in runs:
+        if isinstance(r, (list, tuple)):
+            yield from _flatten(r)
+        else:
+            yield r
+
+
+_WIDE_KEYS = {
+    'returns': None,
+    'positions': 'Datetime',
+    'marcket_data': 'Datetime',
+}
+
+
+def _pack_rets(rets):
+    packed = {}
+    for k, v in rets.items():
+        if k in _WIDE_KEYS and isinstance(v, dict) and 'frame' not in v and 'spill' not in v:
+            packed[k] = ('wide', _WIDE_KEYS[k]) + _pack_wide(v, _WIDE_KEYS[k])
+        elif k == 'data' and 'frame' not in rets and 'spill' not in rets:
+            # DailyTradeStats的逐bar交易记录，转为列式DataFrame
+            packed['frame'] = pd.DataFrame([r for rows in v.values() for r in rows])
+        else:
+            packed[k] = _view_spills(v)
+    return packed
+
+
+def _view_spills(value):
+    """
+    SpillBuffer(及dict中的SpillBuffer)替换为不负责删除目录的view
+    """
+    if isinstance(value, record_utils.SpillBuffer):
+        return value.view()
+    if isinstance(value, dict) and any(isinstance(v, record_utils.SpillBuffer) for v in value.values()):
+        return collections.OrderedDict((k, _view_spills(v)) for k, v in value.items())
+    return value
+
+
+def _pack_wide(ordered_list, header_key):
+    header = ordered_list.get(header_key) if header_key is not None else None
+    keys = [k for k in ordered_list.keys() if k != header_key]
+    values = np.asarray([ordered_list[k] for k in keys], dtype='float64')
+    return header, np.asarray(keys, dtype='datetime64[us]'), values
+
+
+def _unpack_rets(packed):
+    rets = collections.OrderedDict()
+    for k, v in packed.items():
+        if isinstance(v, tuple) and v and v[0] == 'wide':
+            _, header_key, header, keys, values = v
+            ordered_list = collections.OrderedDict()
+            if header_key is not None:
+                ordered_list[header_key] = header
+            ordered_list.update(zip(keys.astype(object), values.tolist()))
+            rets[k] = ordered_list
+        else:
+            rets[k] = v
+    return rets
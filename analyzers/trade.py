@@ -1,109 +1,196 @@
 import datetime
-import logging
 
 import backtrader as bt
+import numpy as np
 import pandas as pd
-from btplugin.utils import analysis_util, bt_resulst_utils
+from btplugin.utils import analysis_util, bt_resulst_utils, profile_utils, record_utils
+
+# 时间列记录backtrader的float时间，stop时统一转换
+TRADE_SCHEMA = [
+    ('date', 'float64'),
+    ('order_book_id', 'object'),
+    ('pnl', 'float64'),
+    ('pnlcomm', 'float64'),
+    ('commission', 'float64'),
+    ('value', 'float64'),
+    ('size', 'int64'),
+    ('price', 'float64'),
+    ('status', 'object'),
+    ('ref', 'int64'),
+    ('dtopen', 'float64'),
+    ('dtclose', 'float64'),
+    ('open', 'float64'),
+    ('close', 'float64'),
+]
 
 
 class DailyTradeStats(bt.Analyzer):
     params = (
         ('contribution_freq', 'Y'),  # 贡献分析的频率
         ('k_largest', '10'),  # top 票
+        ('columnar', False),  # 按列记录交易，stop时在rets['frame']中生成DataFrame
+        ('track_open', False),  # 由notify_trade维护未平仓交易，每bar只记录未平仓及当bar平仓的交易
+        ('instrument', None),  # profile_utils.Instrumentation，记录next/stop及result各阶段耗时
+        ('spill_dir', None),  # 按列记录并按块落盘的目录，时间列在落盘时转换；True为系统临时目录(回收时删除)
+        ('chunk_rows', 65536),  # 落盘时每块的行数
     )
 
+    def __init__(self):
+        profile_utils.attach(self, self.p.instrument)
+
     def start(self):
         self.rets['data'] = {}
+        if self.p.spill_dir is not None:
+            self._buffer = record_utils.SpillBuffer(TRADE_SCHEMA, self.p.spill_dir, self.p.chunk_rows,
+                                                    transform=self._convert_times, prefix='trades_')
+        elif self.p.columnar:
+            self._buffer = record_utils.ColumnBuffer(TRADE_SCHEMA)
+        if self.p.track_open:
+            self._open_trades = {}
+            self._closed_trades = {}
 
-    def next(self):
+    def notify_trade(self, trade):
+        if not self.p.track_open:
+            return
+        # notify_trade收到的是副本，需记录strategy中持续更新的trade
+        trade = self._live_trade(trade)
+        if trade.isclosed:
+            # 同一bar内开平的交易会收到多次通知，按ref只记录一次
+            self._open_trades.pop(trade.ref, None)
+            self._closed_trades[trade.ref] = trade
+        elif trade.isopen:
+            self._open_trades[trade.ref] = trade
+
+    def _live_trade(self, trade):
+        datatrades = self.strategy._trades[trade.data][trade.tradeid]
+        for live in reversed(datatrades):
+            if live.ref == trade.ref:
+                return live
+        return trade
+
+    def _iter_trades(self):
+        """
+        本bar需要记录的(data, trade)
+        track_open模式下为未平仓及当bar平仓的交易，否则为strategy中的全部交易
+        """
+        if self.p.track_open:
+            closed, self._closed_trades = self._closed_trades, {}
+            for trade in self._open_trades.values():
+                yield trade.data, trade
+            for trade in closed.values():
+                yield trade.data, trade
+            return
         trade_dict = self.strategy._trades
-        trade_list = []
-        ts = self.strategy.datetime.datetime()
-        t_date = ts.date()
+        if not trade_dict:
+            return
         for d in self.datas:
-            if not trade_dict:
-                continue
             if d not in trade_dict:
                 continue
             for trade in trade_dict[d][0]:
-                trade_info = {
-                    'date': ts,
-                    'order_book_id': d._name,
-                    'pnl': trade.pnl,
-                    'pnlcomm': trade.pnlcomm,
-                    'commission': trade.commission,
-                    'value': trade.value,
-                    'size': trade.size,
-                    'price': trade.price,
-                    'status': trade.status_names[trade.status],
-                    'ref': trade.ref,
-                    'dtopen': trade.open_datetime(),
-                    'dtclose': trade.close_datetime() if trade.dtclose >= 1 else None,
-                    'open': d.open[0],
-                    'close': d.close[0],
-
-                }
-                trade_list.append(trade_info)
+                yield d, trade
+
+    def next(self):
+        if self.p.columnar or self.p.spill_dir is not None:
+            self._next_columnar()
+            return
+        trade_list = []
+        ts = self.strategy.datetime.datetime()
+        t_date = ts.date()
+        for d, trade in self._iter_trades():
+            trade_info = {
+                'date': ts,
+                'order_book_id': d._name,
+                'pnl': trade.pnl,
+                'pnlcomm': trade.pnlcomm,
+                'commission': trade.commission,
+                'value': trade.value,
+                'size': trade.size,
+                'price': trade.price,
+                'status': trade.status_names[trade.status],
+                'ref': trade.ref,
+                'dtopen': trade.open_datetime(),
+                'dtclose': trade.close_datetime() if trade.dtclose >= 1 else None,
+                'open': d.open[0],
+                'close': d.close[0],
+
+            }
+            trade_list.append(trade_info)
         self.rets['data'][t_date] = trade_list
         # self.rets['data'].extend(trade_list)
 
+    def _next_columnar(self):
+        ts = self.strategy.datetime[0]
+        rows = []
+        for d, trade in self._iter_trades():
+            rows.append((
+                ts, d._name, trade.pnl, trade.pnlcomm, trade.commission, trade.value, trade.size,
+                trade.price, trade.status_names[trade.status], trade.ref, trade.dtopen, trade.dtclose,
+                d.open[0], d.close[0],
+            ))
+        self._buffer.extend(rows)
+
+    def stop(self):
+        super(DailyTradeStats, self).stop()
+        if self.p.spill_dir is not None:
+            self._buffer.flush()
+            self.rets['spill'] = self._buffer
+        elif self.p.columnar:
+            self.rets['frame'] = pd.DataFrame(self._convert_times(
+                {n: self._buffer.column(n) for n in self._buffer.names}), columns=self._buffer.names)
+
+    def _convert_times(self, columns):
+        """
+        时间列由backtrader float时间转换为datetime64
+        """
+        columns = dict(columns)
+        for c in ('date', 'dtopen', 'dtclose'):
+            columns[c] = self._num2datetime(np.asarray(columns[c]))
+        return columns
+
+    def _num2datetime(self, nums):
+        """
+        backtrader float时间批量转换为datetime64，每个不同的时间只转换一次，小于1(未平仓)为NaT
+        """
+        uniques, inverse = np.unique(nums, return_inverse=True)
+        dts = np.array([self.strategy.data.num2date(x) if x >= 1 else None for x in uniques],
+                       dtype='datetime64[us]')
+        return dts[inverse]
+
     def result(self):
         """
         获得收益贡献统计
         :return: df_top_k, df_bottom_k
         """
-        self.rets['data_list'] = []
-        for _,v in self.rets['data'].values():
-            self.rets['data_list'].extend(v)
-        df_daily_trade = pd.DataFrame(self.rets['data_list'])
-        df_daily_trade = bt_resulst_utils.build_trade_history(df_daily_trade)
-        if self.p.contribution_freq not in analysis_util.FREQ_GROUPER_MAP:
-            raise ValueError(f"DailyTradeStats - Invalid contribution_freq:{self.p.contribution_freq}")
-        df_daily_trade['date'] = pd.to_datetime(df_daily_trade['date'])
-        grouper_key = analysis_util.FREQ_GROUPER_MAP[self.p.contribution_freq]
-        time_format = analysis_util.FREQ_TIME_FORMAT_REF[self.p.contribution_freq]
-        k = int(self.p.k_largest)
-        groups = df_daily_trade.groupby(pd.Grouper(key='date', freq=grouper_key))
-        top_k_list = []
-        bottom_k_list = []
-        for date_key, group in groups:
-            trade_groups = group.groupby(by=['ref'])
-            res_list = []
-            for trade_key, trade_group in trade_groups:
-                mask = (trade_group['date'] == trade_group['dtclose']) | (trade_group['status'] == 'Open')
-                df_t = trade_group[mask]
-                if df_t.empty:
-                    continue
-                pnlcomm_change_0 = df_t['overall_pnlcomm_change'].iloc[0]
-                pnl_change_0 = df_t['overall_pnl_change'].iloc[0]
-                if pd.isna(pnlcomm_change_0):
-                    # 本季度首次建仓
-                    pnlcomm_change = df_t['overall_pnlcomm'].iloc[-1]
-                    pnl_change = df_t['overall_pnl'].iloc[-1]
-                else:
-                    pnlcomm_change = df_t['overall_pnlcomm'].iloc[-1] - df_t['overall_pnlcomm'].iloc[
-                        0] + pnlcomm_change_0
-                    pnl_change = df_t['overall_pnl'].iloc[-1] - df_t['overall_pnl'].iloc[0] + pnl_change_0
-                res_list.append({
-                    'period_key ': date_key.strftime(time_format),
-                    'order_book_id': df_t.iloc[0, 1],
-                    'pnl_change': pnl_change,
-                    'pnlcomm_change': pnlcomm_change,
-                })
-            if not res_list:
-                logging.info("period_key:" + date_key.strftime(time_format) + "的交易为空")
-                continue
-            df_period_pnl = pd.DataFrame(res_list).sort_values(by='pnlcomm_change', ascending=False)
-            top_k_df = df_period_pnl.head(k).copy()
-            bottom_k_df = df_period_pnl.tail(k).copy()
-            top_k_df['rank'] = top_k_df['pnlcomm_change'].rank(ascending=False)
-            top_k_df['rank_str'] = top_k_df['rank'].apply(lambda x: f"top_{int(x)}")
-            bottom_k_df['rank'] = bottom_k_df['pnlcomm_change'].rank(ascending=True)
-            bottom_k_df['rank_str'] = bottom_k_df['rank'].apply(lambda x: f"bottom_{int(x)}")
-            top_k_list.append(top_k_df)
-            bottom_k_list.append(bottom_k_df)
-        df_top_k = pd.concat(top_k_list, axis=0)
-        df_bottom_k = pd.concat(bottom_k_list, axis=0)
+        return daily_trade_result(self.p, self.rets)
+
+
+def daily_trade_result(p, rets) -> dict:
+    """
+    由DailyTradeStats的参数与stop()后的rets计算result()，不依赖analyzer实例，可在其他进程中调用
+    :param p: DailyTradeStats的参数，可为具有同名属性的types.SimpleNamespace
+    :param rets: DailyTradeStats.rets
+    :return: 同DailyTradeStats.result()
+    """
+    instrument = p.instrument
+    with profile_utils.stage(instrument, 'DailyTradeStats.result'):
+        with profile_utils.stage(instrument, 'DailyTradeStats.result.build_frames'):
+            if 'spill' in rets:
+                df_daily_trade = rets['spill'].to_frame()
+            elif 'frame' in rets:
+                df_daily_trade = rets['frame'].copy()
+            else:
+                data_list = []
+                for v in rets['data'].values():
+                    data_list.extend(v)
+                df_daily_trade = pd.DataFrame(data_list)
+        with profile_utils.stage(instrument, 'DailyTradeStats.result.trade_history'):
+            df_daily_trade = bt_resulst_utils.build_trade_history(df_daily_trade)
+        if p.contribution_freq not in analysis_util.FREQ_GROUPER_MAP:
+            raise ValueError(f"DailyTradeStats - Invalid contribution_freq:{p.contribution_freq}")
+        with profile_utils.stage(instrument, 'DailyTradeStats.result.contribution_rank'):
+            df_daily_trade['date'] = pd.to_datetime(df_daily_trade['date'])
+            df_top_k, df_bottom_k = bt_resulst_utils.build_contribution_rank(
+                df_daily_trade, p.contribution_freq, int(p.k_largest))
         return {
             'df_top_k': df_top_k,
             'df_bottom_k': df_bottom_k,
@@ -0,0 +1,43 @@
+"""
+回撤计算耗时基准，验证get_maxdrawdown / get_drawdown_episodes随序列长度线性增长
+运行: python -m btplugin.benchmarks.drawdown
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..utils import analysis_util
+
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def make_netvalue(n, seed=0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2000-01-01', periods=n, freq='min')
+    return pd.Series(np.cumprod(1 + rng.normal(0, 1e-3, n)), index=index)
+
+
+def run(sizes=SIZES, repeat=3):
+    res = []
+    for n in sizes:
+        netvalue = make_netvalue(n)
+        for func in (analysis_util.get_maxdrawdown, analysis_util.get_drawdown_episodes):
+            cost = min(_timeit(func, netvalue) for _ in range(repeat))
+            res.append({
+                'func': func.__name__,
+                'n': n,
+                'seconds': cost,
+                'ns_per_point': cost / n * 1e9,
+            })
+    return pd.DataFrame(res)
+
+
+def _timeit(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    print(run().to_string(index=False))
@@ -0,0 +1,81 @@
+"""
+基准测试用的合成回测数据与策略
+"""
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+
+class RandomRebalanceStrategy(bt.Strategy):
+    """
+    每rebalance_bars个bar随机调整持仓的策略
+    """
+    params = (
+        ('rebalance_bars', 5),
+        ('hold_ratio', 0.5),
+        ('seed', 0),
+    )
+
+    def __init__(self):
+        self._rng = np.random.default_rng(self.p.seed)
+        self._count = 0
+
+    def next(self):
+        self._count += 1
+        if self._count % self.p.rebalance_bars:
+            return
+        weights = self._rng.random(len(self.datas)) * (self._rng.random(len(self.datas)) < self.p.hold_ratio)
+        total = weights.sum()
+        if total > 0:
+            weights = weights / total * 0.9
+        for d, w in zip(self.datas, weights):
+            self.order_target_percent(d, target=w)
+
+
+TIMEFRAMES = {
+    'daily': ('B', bt.TimeFrame.Days),
+    'minute': ('min', bt.TimeFrame.Minutes),
+}
+
+
+def make_price_frames(n_instruments, n_bars, timeframe='daily', seed=0):
+    """
+    生成随机游走的OHLCV行情
+    :param timeframe: daily / minute
+    :return: [(name, pd.DataFrame)]
+    """
+    rng = np.random.default_rng(seed)
+    freq, _ = TIMEFRAMES[timeframe]
+    index = pd.date_range('2010-01-01', periods=n_bars, freq=freq)
+    vol = 0.02 if timeframe == 'daily' else 0.002
+    closes = 10 * np.exp(np.cumsum(rng.normal(0, vol, (n_bars, n_instruments)), axis=0))
+    res = []
+    for i in range(n_instruments):
+        close = closes[:, i]
+        res.append(('S%05d' % i, pd.DataFrame({
+            'open': close,
+            'high': close * 1.01,
+            'low': close * 0.99,
+            'close': close,
+            'volume': 1e6,
+            'openinterest': 0,
+        }, index=index)))
+    return res
+
+
+def make_cerebro(n_instruments, n_bars, timeframe='daily', rebalance_bars=5, hold_ratio=0.5, seed=0):
+    """
+    构建合成回测
+    :param n_instruments: 标的数
+    :param n_bars: bar数
+    :param timeframe: daily / minute
+    :param rebalance_bars: 调仓间隔(bar)，与hold_ratio共同决定成交频率
+    :param hold_ratio: 每次调仓时持有的标的比例
+    """
+    _, bt_timeframe = TIMEFRAMES[timeframe]
+    cerebro = bt.Cerebro(stdstats=False)
+    for name, df in make_price_frames(n_instruments, n_bars, timeframe=timeframe, seed=seed):
+        cerebro.adddata(bt.feeds.PandasData(dataname=df, timeframe=bt_timeframe), name=name)
+    cerebro.broker.setcash(1e8)
+    cerebro.addstrategy(RandomRebalanceStrategy, rebalance_bars=rebalance_bars, hold_ratio=hold_ratio, seed=seed)
+    return cerebro
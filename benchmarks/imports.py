@@ -0,0 +1,72 @@
+"""
+导入耗时基准：在新的解释器中分别导入各入口，记录耗时及是否加载了backtrader/pandas/numpy
+运行: python -m btplugin.benchmarks.imports
+"""
+import json
+import subprocess
+import sys
+
+import pandas as pd
+
+TARGETS = (
+    'btplugin',
+    'btplugin.utils',
+    'btplugin.utils.profile_utils',
+    'btplugin.utils.analysis_util',
+    'btplugin.analyzers',
+    'btplugin.analyzers.BktGeneraStatics',
+)
+HEAVY_MODULES = ('backtrader', 'pandas', 'numpy')
+# 导入时不应加载HEAVY_MODULES的入口
+LIGHT_TARGETS = ('btplugin', 'btplugin.utils', 'btplugin.utils.profile_utils', 'btplugin.analyzers')
+
+# 子进程中执行，target为模块或模块属性
+_SCRIPT = """
+import importlib, json, sys, time
+target = sys.argv[1]
+start = time.perf_counter()
+module, _, attr = target.rpartition('.')
+try:
+    importlib.import_module(target)
+except ImportError:
+    getattr(importlib.import_module(module), attr)
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def measure(target, repeat=5) -> dict:
+    """
+    :return: {'target', 'seconds': 最短耗时, 以及HEAVY_MODULES中各模块是否被加载}
+    """
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _SCRIPT, target, *HEAVY_MODULES],
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    res = {'target': target, 'seconds': min(r['seconds'] for r in runs)}
+    for m in HEAVY_MODULES:
+        res[m] = m in runs[-1]['loaded']
+    return res
+
+
+def run(targets=TARGETS, repeat=5) -> pd.DataFrame:
+    return pd.DataFrame([measure(t, repeat) for t in targets])
+
+
+def check(res) -> list:
+    """
+    :param res: run()的结果
+    :return: LIGHT_TARGETS中加载了重依赖的入口
+    """
+    light = res[res['target'].isin(LIGHT_TARGETS)]
+    return light.loc[light[list(HEAVY_MODULES)].any(axis=1), 'target'].tolist()
+
+
+if __name__ == '__main__':
+    res = run()
+    print(res.to_string(index=False))
+    heavy = check(res)
+    if heavy:
+        print('heavy dependencies loaded by:', ', '.join(heavy))
+        sys.exit(1)
@@ -0,0 +1,66 @@
+"""
+记录模式基准：比较MarcketDataAnalyzer / DailyTradeStats在dict与columnar模式下的峰值内存与每bar开销
+每种模式在独立子进程中运行，以获得独立的峰值RSS
+运行: python -m btplugin.benchmarks.recording --instruments 300 --bars 2500
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from . import fixtures
+from ..analyzers import MarcketDataAnalyzer, DailyTradeStats
+
+MODES = ('none', 'dict', 'columnar')
+
+
+def run_mode(mode, n_instruments, n_bars):
+    cerebro = fixtures.make_cerebro(n_instruments, n_bars)
+    if mode != 'none':
+        columnar = mode == 'columnar'
+        cerebro.addanalyzer(MarcketDataAnalyzer, headers=True, columnar=columnar)
+        cerebro.addanalyzer(DailyTradeStats, columnar=columnar)
+    start = time.perf_counter()
+    cerebro.run()
+    cost = time.perf_counter() - start
+    return {
+        'mode': mode,
+        'instruments': n_instruments,
+        'bars': n_bars,
+        'seconds': cost,
+        # linux下ru_maxrss单位为KB
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run(n_instruments, n_bars):
+    res = []
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, '-m', __spec__.name, '--mode', mode,
+             '--instruments', str(n_instruments), '--bars', str(n_bars)],
+            check=True, capture_output=True, text=True).stdout
+        res.append(json.loads(out.strip().splitlines()[-1]))
+    base = res[0]
+    for r in res:
+        r['per_bar_overhead_us'] = (r['seconds'] - base['seconds']) / n_bars * 1e6
+        r['rss_overhead_mb'] = r['peak_rss_mb'] - base['peak_rss_mb']
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--instruments', type=int, default=300)
+    parser.add_argument('--bars', type=int, default=2500)
+    parser.add_argument('--mode', choices=MODES)
+    args = parser.parse_args()
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.instruments, args.bars)))
+    else:
+        print(json.dumps(run(args.instruments, args.bars), indent=2))
+
+
+if __name__ == '__main__':
+    main()
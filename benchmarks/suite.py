@@ -0,0 +1,214 @@
+"""
+插件整体基准：合成回测下各analyzer的回测开销、result()耗时，以及analysis_util / bt_resulst_utils / portfolio_utils / resample_utils / SegmentAnalysis各函数的耗时与内存峰值
+结果以json输出，便于不同版本间比较
+运行: python -m btplugin.benchmarks.suite --instruments 50 --bars 1000 --output bench.json
+比较: python -m btplugin.benchmarks.suite --compare base.json bench.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from . import fixtures
+from ..analyzers import BktGeneraStatics, DailyTradeStats, MarcketDataAnalyzer, SegmentAnalysis, walk_forward_segments
+from ..utils import analysis_util, bt_resulst_utils, portfolio_utils, resample_utils
+
+
+def measure(func, *args, repeat=3, trace_memory=True, **kwargs):
+    """
+    :return: {'seconds': 最短耗时, 'peak_mb': tracemalloc内存峰值}
+    """
+    costs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        costs.append(time.perf_counter() - start)
+    res = {'seconds': min(costs), 'peak_mb': None}
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            res['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return res
+
+
+def run(n_instruments=50, n_bars=1000, timeframe='daily', rebalance_bars=5, hold_ratio=0.5,
+        repeat=3, trace_memory=True) -> dict:
+    config = dict(n_instruments=n_instruments, n_bars=n_bars, timeframe=timeframe,
+                  rebalance_bars=rebalance_bars, hold_ratio=hold_ratio)
+    results = []
+
+    def record(name, func, *args, repeat=repeat, **kwargs):
+        res = measure(func, *args, repeat=repeat, trace_memory=trace_memory, **kwargs)
+        res['name'] = name
+        results.append(res)
+
+    # 回测开销：相对于不加analyzer的回测，与其他项相同取repeat次中的最短耗时
+    analyzers = {
+        'none': [],
+        'BktGeneraStatics': [(BktGeneraStatics, {})],
+        'BktGeneraStatics(future_like)': [(BktGeneraStatics, {'future_like': True})],
+        'BktGeneraStatics(sparse_positions)': [(BktGeneraStatics, {'sparse_positions': True})],
+        'MarcketDataAnalyzer': [(MarcketDataAnalyzer, {'headers': True})],
+        'DailyTradeStats': [(DailyTradeStats, {})],
+    }
+    strategies = {}
+    for name, analyzer_list in analyzers.items():
+        def backtest():
+            cerebro = fixtures.make_cerebro(**config)
+            for analyzer_cls, kwargs in analyzer_list:
+                cerebro.addanalyzer(analyzer_cls, _name='target', **kwargs)
+            strategies[name] = cerebro.run()[0]
+        record('backtest.' + name, backtest)
+    base_seconds = results[0]['seconds']
+    for r in results:
+        r['overhead_seconds'] = r['seconds'] - base_seconds
+
+    # result()
+    stat = strategies['BktGeneraStatics'].analyzers.target
+    future_stat = strategies['BktGeneraStatics(future_like)'].analyzers.target
+    sparse_stat = strategies['BktGeneraStatics(sparse_positions)'].analyzers.target
+    trade = strategies['DailyTradeStats'].analyzers.target
+    record('BktGeneraStatics.result', _full_result, stat)
+    record('BktGeneraStatics(future_like).result', _full_result, future_stat)
+    record('BktGeneraStatics(sparse_positions).result', _full_result, sparse_stat)
+    record('DailyTradeStats.result', trade.result)
+
+    # 各工具函数
+    stat_result = stat.result()
+    npv = stat_result['npv']['npv']
+    freq = stat.p.npv_freq
+    for func in (analysis_util.get_maxdrawdown, analysis_util.get_drawdown_episodes):
+        record(func.__name__, func, npv)
+    record('get_netvalue_analysis', analysis_util.get_netvalue_analysis, npv, freq, 0.)
+    record('get_yearly_analysis', analysis_util.get_yearly_analysis, npv, freq)
+    record('get_period_analysis(M)', analysis_util.get_period_analysis, npv, freq, period='M')
+    record('get_rolling_analysis', analysis_util.get_rolling_analysis, npv, freq)
+    # 日内净值：每日240个分钟bar，共n_bars日
+    minute_close = fixtures.make_price_frames(
+        1, n_bars * analysis_util.INTRADAY_BARS_PER_DAY['MIN'], timeframe='minute')[0][1]['close']
+    minute_npv = minute_close / minute_close.iloc[0]
+    record('get_intraday_analysis', analysis_util.get_intraday_analysis, minute_npv, 'MIN')
+    record('get_intraday_analysis(M)', analysis_util.get_intraday_analysis, minute_npv, 'MIN', period='M')
+    benchmark = fixtures.make_price_frames(n_instruments, n_bars, timeframe=timeframe)[0][1]['close']
+    record('get_relative_analysis', analysis_util.get_relative_analysis, npv, {'bench': benchmark}, freq,
+           normalize=True)
+    record('bootstrap_analysis', resample_utils.bootstrap_analysis, stat_result, freq, n_samples=1000,
+           chunksize=250, seed=0)
+    segment_analysis = SegmentAnalysis(stat)
+    segments = walk_forward_segments(segment_analysis.dates, max(n_bars // 4, 1), max(n_bars // 20, 1))
+    record('SegmentAnalysis.analyze', segment_analysis.analyze, segments)
+
+    rets = stat.rets
+    record('build_position_value', bt_resulst_utils.build_position_value, rets['positions'])
+    record('build_transaction', bt_resulst_utils.build_transaction, rets['transactions'])
+    p_df = bt_resulst_utils.build_position_value(rets['positions'])
+    t_df = bt_resulst_utils.build_transaction(rets['transactions'])
+    record('average_turnover', lambda: analysis_util.average_turnover(p_df.copy(), t_df, stat.p.strategy_freq))
+
+    sparse_positions = sparse_stat.rets['positions']
+    st_df = bt_resulst_utils.build_transaction(sparse_stat.rets['transactions'])
+    record('long_average_turnover', analysis_util.long_average_turnover, sparse_positions['frame'],
+           sparse_positions['cash'].index, st_df, sparse_stat.p.strategy_freq)
+    record('build_long_position', bt_resulst_utils.build_long_position, sparse_positions['frame'],
+           sparse_positions['cash'])
+
+    future_rets = future_stat.rets
+    record('build_market_data', bt_resulst_utils.build_market_data, future_rets['marcket_data'])
+    fp_df = bt_resulst_utils.build_position_value(future_rets['positions'])
+    ft_df = bt_resulst_utils.build_transaction(future_rets['transactions'])
+    market_df = bt_resulst_utils.build_market_data(future_rets['marcket_data'])
+    record('patch_future_position',
+           lambda: bt_resulst_utils.patch_future_position(fp_df, ft_df.copy(), market_df, {}))
+    patched = bt_resulst_utils.patch_future_position(fp_df, ft_df.copy(), market_df, {})
+    record('future_average_turnover', lambda: analysis_util.future_average_turnover(patched, ft_df.copy()))
+
+    returns = portfolio_utils.align_returns({'stock': stat_result, 'future': future_stat.result()})
+    weights = np.random.default_rng(0).random((256, returns.shape[1]))
+    record('get_portfolio_analysis', portfolio_utils.get_portfolio_analysis, returns,
+           weights / weights.sum(axis=1, keepdims=True), freq)
+
+    trade_rows = [r for v in trade.rets['data'].values() for r in v]
+    record('build_trade_history', lambda: bt_resulst_utils.build_trade_history(pd.DataFrame(trade_rows)))
+    df_trade = bt_resulst_utils.build_trade_history(pd.DataFrame(trade_rows))
+    record('build_contribution_rank', bt_resulst_utils.build_contribution_rank, df_trade,
+           trade.p.contribution_freq, int(trade.p.k_largest))
+    return {
+        'meta': {
+            'config': config,
+            'trade_rows': len(trade_rows),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def _full_result(analyzer) -> dict:
+    """
+    清空缓存后计算BktGeneraStatics.result()的全部结果
+    """
+    analyzer._result_cache = None
+    return dict(analyzer.result())
+
+
+def compare(base, current, threshold=1.2) -> list:
+    """
+    比较两次基准结果，返回耗时超过base * threshold的项
+    :param base: run()的结果
+    :param current: run()的结果
+    """
+    base_map = {r['name']: r for r in base['results']}
+    regressions = []
+    for r in current['results']:
+        b = base_map.get(r['name'])
+        if b is None or b['seconds'] <= 0:
+            continue
+        ratio = r['seconds'] / b['seconds']
+        if ratio > threshold:
+            regressions.append({'name': r['name'], 'base': b['seconds'], 'current': r['seconds'], 'ratio': ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--instruments', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=1000)
+    parser.add_argument('--timeframe', choices=sorted(fixtures.TIMEFRAMES), default='daily')
+    parser.add_argument('--rebalance-bars', type=int, default=5)
+    parser.add_argument('--hold-ratio', type=float, default=0.5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--output')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CURRENT'))
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(base, current, args.threshold)
+        print(json.dumps(regressions, indent=2, ensure_ascii=False))
+        sys.exit(1 if regressions else 0)
+    res = run(args.instruments, args.bars, args.timeframe, args.rebalance_bars, args.hold_ratio,
+              repeat=args.repeat, trace_memory=not args.no_memory)
+    out = json.dumps(res, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+交易贡献统计耗时基准：build_trade_history与build_contribution_rank
+运行: python -m btplugin.benchmarks.trade_history
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..utils import bt_resulst_utils
+
+SIZES = (10_000, 100_000, 1_000_000)
+
+
+def make_trade_frame(n_rows, bars_per_trade=20, n_instruments=500, seed=0) -> pd.DataFrame:
+    """
+    生成DailyTradeStats格式的逐bar交易记录，每笔交易持续bars_per_trade个bar，最后一个bar平仓
+    """
+    rng = np.random.default_rng(seed)
+    n_trades = max(n_rows // bars_per_trade, 1)
+    n_rows = n_trades * bars_per_trade
+    ref = np.repeat(np.arange(n_trades), bars_per_trade)
+    step = np.tile(np.arange(bars_per_trade), n_trades)
+    open_day = rng.integers(0, 2500, n_trades)
+    dates = pd.Timestamp('2010-01-01') + pd.to_timedelta(np.repeat(open_day, bars_per_trade) + step, unit='D')
+    closed = step == bars_per_trade - 1
+    price = np.repeat(rng.uniform(5, 50, n_trades), bars_per_trade)
+    size = np.repeat(rng.integers(1, 100, n_trades) * 100, bars_per_trade)
+    close = price * np.exp(rng.normal(0, 0.02, n_rows).cumsum() * 0.1)
+    pnl = np.where(closed, (close - price) * size, 0.)
+    return pd.DataFrame({
+        'date': dates,
+        'order_book_id': np.repeat(rng.integers(0, n_instruments, n_trades), bars_per_trade).astype(str),
+        'pnl': pnl,
+        'pnlcomm': pnl * 0.999,
+        'commission': np.abs(pnl) * 0.001,
+        'value': np.where(closed, 0., price * size),
+        'size': np.where(closed, 0, size),
+        'price': price,
+        'status': np.where(closed, 'Closed', 'Open'),
+        'ref': ref,
+        'dtopen': dates[np.repeat(np.arange(n_trades) * bars_per_trade, bars_per_trade)],
+        'dtclose': dates.where(closed),
+        'open': close,
+        'close': close,
+    })
+
+
+def run(sizes=SIZES, freq='M', k=10):
+    res = []
+    for n in sizes:
+        df = make_trade_frame(n)
+        start = time.perf_counter()
+        df_trade = bt_resulst_utils.build_trade_history(df)
+        history_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        bt_resulst_utils.build_contribution_rank(df_trade, freq, k)
+        rank_cost = time.perf_counter() - start
+        res.append({
+            'rows': len(df),
+            'build_trade_history': history_cost,
+            'build_contribution_rank': rank_cost,
+        })
+    return pd.DataFrame(res)
+
+
+if __name__ == '__main__':
+    print(run().to_string(index=False))
@@ -0,0 +1,48 @@
+"""
+测试公共设置：仓库根目录即btplugin包，未安装时按包名注册；提供合成回测的fixture
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import btplugin  # noqa: F401
+except ImportError:
+    _spec = importlib.util.spec_from_file_location(
+        'btplugin', os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT])
+    _module = importlib.util.module_from_spec(_spec)
+    sys.modules['btplugin'] = _module
+    _spec.loader.exec_module(_module)
+
+
+@pytest.fixture(scope='session')
+def price_frames():
+    from btplugin.benchmarks import fixtures
+    return fixtures.make_price_frames(4, 300, seed=1)
+
+
+@pytest.fixture(scope='session')
+def run_backtest(price_frames):
+    """
+    :return: run(feeds=None, rebalance_bars=5, **analyzers)，analyzers为{名称: (analyzer类, 参数)}，返回strategy
+    """
+    import backtrader as bt
+    from btplugin.benchmarks import fixtures
+
+    def run(feeds=None, rebalance_bars=5, **analyzers):
+        cerebro = bt.Cerebro(stdstats=False)
+        if feeds is None:
+            feeds = [(name, bt.feeds.PandasData(dataname=df)) for name, df in price_frames]
+        for name, feed in feeds:
+            cerebro.adddata(feed, name=name)
+        cerebro.broker.setcash(1e7)
+        cerebro.addstrategy(fixtures.RandomRebalanceStrategy, rebalance_bars=rebalance_bars, seed=1)
+        for name, (analyzer_cls, kwargs) in analyzers.items():
+            cerebro.addanalyzer(analyzer_cls, _name=name, **kwargs)
+        return cerebro.run()[0]
+
+    return run
@@ -0,0 +1,350 @@
+"""
+analysis_util的向量化实现与原逐期pandas实现的一致性
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.utils import analysis_util
+
+
+def _base_maxdrawdown(netvalue):
+    """
+    原get_maxdrawdown，逐期取前高
+    """
+    maxdrawdowns = pd.Series(index=netvalue.index, dtype='float64')
+    for i in np.arange(len(netvalue.index)):
+        highpoint = netvalue.iloc[0:(i + 1)].max()
+        if highpoint == netvalue.iloc[i]:
+            maxdrawdowns.iloc[i] = 0
+        else:
+            maxdrawdowns.iloc[i] = netvalue.iloc[i] / highpoint - 1
+    return maxdrawdowns
+
+
+def _loop_drawdown_episodes(netvalue):
+    """
+    逐期遍历的回撤区间
+    """
+    netvalue = netvalue.dropna()
+    drawdowns = _base_maxdrawdown(netvalue)
+    rows, start = [], None
+    for i in range(len(drawdowns) + 1):
+        underwater = i < len(drawdowns) and drawdowns.iloc[i] < 0
+        if underwater and start is None:
+            start = i
+        elif not underwater and start is not None:
+            part = drawdowns.iloc[start:i]
+            trough = start + int(np.argmin(part.to_numpy()))
+            recovered = i < len(drawdowns)
+            rows.append({
+                'peak_date': netvalue.index[start - 1],
+                'trough_date': netvalue.index[trough],
+                'recovery_date': netvalue.index[i] if recovered else pd.NaT,
+                'depth': drawdowns.iloc[trough],
+                'duration': (i if recovered else len(drawdowns) - 1) - (start - 1),
+            })
+            start = None
+    return pd.DataFrame(rows, columns=['peak_date', 'trough_date', 'recovery_date', 'depth', 'duration'])
+
+
+def _netvalue(n, seed=0, start='2020-01-01', freq='B'):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(start, periods=n, freq=freq)
+    return pd.Series(np.cumprod(1 + rng.normal(0.0005, 0.01, n)), index=index)
+
+
+NETVALUES = {
+    'random': _netvalue(300),
+    'single': _netvalue(1),
+    'flat': pd.Series(1., index=pd.bdate_range('2020-01-01', periods=20)),
+    'rising': pd.Series(np.linspace(1.01, 1.2, 20), index=pd.bdate_range('2020-01-01', periods=20)),
+    'unrecovered': pd.Series([1., 1.1, 1.05, 1.2, 1.1, 1.0, 1.15], index=pd.bdate_range('2020-01-01', periods=7)),
+    'nan': _netvalue(60, seed=1).mask(lambda s: s.index.day % 7 == 0),
+    'inf': pd.Series([1., 1.1, np.inf, 1.05, 1.2, 0.9], index=pd.bdate_range('2020-01-01', periods=6)),
+}
+
+
+@pytest.mark.parametrize('name', list(NETVALUES))
+def test_maxdrawdown_matches_base(name):
+    netvalue = NETVALUES[name]
+    pd.testing.assert_series_equal(analysis_util.get_maxdrawdown(netvalue), _base_maxdrawdown(netvalue),
+                                   rtol=1e-12)
+
+
+@pytest.mark.parametrize('name', list(NETVALUES))
+def test_drawdown_episodes_match_loop(name):
+    netvalue = NETVALUES[name]
+    episodes = analysis_util.get_drawdown_episodes(netvalue)
+    expected = _loop_drawdown_episodes(netvalue)
+    assert len(episodes) == len(expected)
+    if len(expected):
+        pd.testing.assert_frame_equal(episodes, expected, rtol=1e-12)
+
+
+def _base_netvalue_analysis(netvalue, freq, rf):
+    """
+    原get_netvalue_analysis
+    """
+    freq = freq.upper()
+    labels = analysis_util._analysis_labels(freq)
+    if len(netvalue) == 0:
+        return pd.Series(dict.fromkeys(labels, np.nan), name='analysis')
+    oneyear = analysis_util.FREQ_ONEYEAR_MAP[freq]
+    tradeslen = netvalue.shape[0]
+    tmp = netvalue.shift()
+    tmp.iloc[0] = 1
+    returns = netvalue / tmp - 1
+    totalreturn = netvalue.iloc[-1] - 1
+    return_yr = (1 + totalreturn) ** (oneyear / tradeslen) - 1
+    volatility_yr = np.std(returns, ddof=0) * np.sqrt(oneyear)
+    if volatility_yr == 0.0:
+        return pd.Series(dict.fromkeys(labels, np.nan), name='analysis')
+    sharpe = (return_yr - rf) / volatility_yr
+    maxdrawdown = min(_base_maxdrawdown(netvalue))
+    if maxdrawdown == 0:
+        profit_risk_ratio = np.inf
+    else:
+        profit_risk_ratio = return_yr / np.abs(maxdrawdown)
+    win_count = (returns > 0).sum()
+    lose_count = (returns < 0).sum()
+    win_rate = win_count / (win_count + lose_count)
+    p_over_l = returns[returns > 0].mean() / np.abs(returns[returns < 0].mean())
+    return pd.Series(dict(zip(labels, [totalreturn, return_yr, volatility_yr, maxdrawdown, win_rate, p_over_l,
+                                       sharpe, profit_risk_ratio])), name='analysis')
+
+
+def _base_period_analysis(netvalue, freq, rf, period):
+    """
+    原get_yearly_analysis的逐周期循环，周期净值以上一周期末净值为基准
+    """
+    keys = netvalue.index.strftime(analysis_util.FREQ_TIME_FORMAT_REF[period])
+    ret = pd.DataFrame()
+    init_npv = 1
+    for key in keys.unique():
+        npv = netvalue[keys == key]
+        ret[key] = _base_netvalue_analysis(npv / init_npv, freq=freq, rf=rf)
+        init_npv = npv.iloc[-1]
+    return ret
+
+
+ANALYSIS_NETVALUES = {
+    'random': _netvalue(300),
+    'single': _netvalue(1),
+    'flat': pd.Series(1., index=pd.bdate_range('2020-01-01', periods=20)),
+    'rising': pd.Series(np.linspace(1.01, 1.2, 20), index=pd.bdate_range('2020-01-01', periods=20)),
+    'no_loss': pd.Series([1., 1., 1.1, 1.1, 1.2], index=pd.bdate_range('2020-01-01', periods=5)),
+    'to_zero': pd.Series([1., 1.1, 0.5, 0.], index=pd.bdate_range('2020-01-01', periods=4)),
+    'nan': NETVALUES['nan'],
+    'nan_first': _netvalue(30, seed=2).mask(lambda s: s.index.day <= 2),
+    'inf': NETVALUES['inf'],
+}
+
+
+@pytest.mark.parametrize('name', list(ANALYSIS_NETVALUES))
+def test_netvalue_analysis_matches_base(name):
+    netvalue = ANALYSIS_NETVALUES[name]
+    pd.testing.assert_series_equal(analysis_util.get_netvalue_analysis(netvalue, 'D', 0.02),
+                                   _base_netvalue_analysis(netvalue, 'D', 0.02), rtol=1e-10)
+
+
+@pytest.mark.parametrize('period', ['D', 'W', 'M', 'Y'])
+@pytest.mark.parametrize('name', list(ANALYSIS_NETVALUES))
+def test_period_analysis_matches_base(name, period):
+    netvalue = ANALYSIS_NETVALUES[name]
+    res = analysis_util.get_period_analysis(netvalue, 'D', 0.02, period=period)
+    expected = _base_period_analysis(netvalue, 'D', 0.02, period)
+    pd.testing.assert_frame_equal(res, expected, check_column_type=False, rtol=1e-10)
+
+
+def test_single_bar_periods():
+    # 月末单期构成一个周期
+    index = pd.DatetimeIndex(['2020-01-30', '2020-01-31', '2020-02-03', '2020-02-04', '2020-03-02'])
+    netvalue = pd.Series([1.01, 1.03, 1.0, 1.02, 1.05], index=index)
+    res = analysis_util.get_period_analysis(netvalue, 'D', 0., period='M')
+    pd.testing.assert_frame_equal(res, _base_period_analysis(netvalue, 'D', 0., 'M'), check_column_type=False,
+                                  rtol=1e-10)
+    assert res['2020-03'].isna().all()
+
+
+def test_yearly_analysis_matches_base():
+    netvalue = _netvalue(800)
+    pd.testing.assert_frame_equal(analysis_util.get_yearly_analysis(netvalue, 'D', 0.02),
+                                  _base_period_analysis(netvalue, 'D', 0.02, 'Y'), check_column_type=False,
+                                  rtol=1e-10)
+
+
+def _loop_rolling_analysis(netvalue, freq, rf, window):
+    """
+    逐窗口调用原get_netvalue_analysis，窗口净值以窗口前一期净值为基准
+    """
+    labels = analysis_util._analysis_labels(freq)
+    res = pd.DataFrame(np.nan, index=netvalue.index, columns=labels)
+    prev = netvalue.shift()
+    prev.iloc[0] = 1.
+    for end in range(window - 1, len(netvalue)):
+        start = end - window + 1
+        res.iloc[end] = _base_netvalue_analysis(netvalue.iloc[start:end + 1] / prev.iloc[start], freq, rf)
+    return res
+
+
+@pytest.mark.parametrize('window', [1, 2, 5, 21, 300, 301])
+@pytest.mark.parametrize('name', list(ANALYSIS_NETVALUES))
+def test_rolling_analysis_matches_loop(name, window):
+    netvalue = ANALYSIS_NETVALUES[name]
+    res = analysis_util.get_rolling_analysis(netvalue, 'D', 0.02, windows=[window])
+    expected = _loop_rolling_analysis(netvalue, 'D', 0.02, window)
+    pd.testing.assert_frame_equal(res[window], expected, check_names=False, rtol=1e-8, atol=1e-12)
+
+
+def test_rolling_window_longer_than_series():
+    netvalue = _netvalue(10)
+    res = analysis_util.get_rolling_analysis(netvalue, 'D', windows=[5, 11])
+    assert res[5].iloc[4:].notna().all().all()
+    assert res[11].isna().all().all()
+
+
+@pytest.mark.parametrize('window', [1, 3, 7, 20])
+@pytest.mark.parametrize('name', ['random', 'flat', 'nan', 'nan_first', 'inf', 'to_zero'])
+def test_rolling_worst_ratio_matches_loop(name, window):
+    values = ANALYSIS_NETVALUES[name].to_numpy()
+    res = analysis_util._rolling_worst_ratio(values, window)
+    for end in range(window - 1, len(values)):
+        part = pd.Series(values[end - window + 1:end + 1])
+        expected = 1 + np.nanmin(_base_maxdrawdown(part).to_numpy()) if part.notna().any() else np.nan
+        np.testing.assert_allclose(res[end], expected, rtol=1e-12)
+
+
+def _loop_intraday_analysis(netvalue, rf, period=None):
+    """
+    每日取最后一个bar按原实现做日度统计，最大回撤与Calmar比由原get_maxdrawdown在全分辨率净值上计算
+    """
+    days = netvalue.index.normalize()
+    daily = netvalue.groupby(days).nth(-1)
+    if period is None:
+        res = _base_netvalue_analysis(daily, 'D', rf).to_frame()
+        groups = {res.columns[0]: netvalue}
+    else:
+        res = _base_period_analysis(daily, 'D', rf, period)
+        keys = days.strftime(analysis_util.FREQ_TIME_FORMAT_REF[period])
+        groups = {key: netvalue[keys == key] for key in res.columns}
+    for key, bars in groups.items():
+        if res[key].isna().all():
+            continue
+        maxdrawdown = min(_base_maxdrawdown(bars))
+        res.loc['最大回撤率', key] = maxdrawdown
+        res.loc['Calmar比', key] = np.inf if maxdrawdown == 0 else res.loc['年化收益率', key] / np.abs(maxdrawdown)
+    return res.iloc[:, 0] if period is None else res
+
+
+def _intraday_netvalue(days, bars, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(day + pd.Timedelta(hours=9, minutes=30), periods=bars, freq='min')
+        for day in pd.bdate_range('2020-01-27', periods=days)]))
+    return pd.Series(np.cumprod(1 + rng.normal(0, 0.001, len(index))), index=index)
+
+
+INTRADAY_NETVALUES = {
+    'random': _intraday_netvalue(30, 40),
+    'single_day': _intraday_netvalue(1, 40),
+    'single_bar': _intraday_netvalue(1, 1),
+    'one_bar_per_day': _intraday_netvalue(10, 1),
+    'nan': _intraday_netvalue(30, 40, seed=1).mask(lambda s: s.index.minute % 17 == 0),
+    'nan_day_end': _intraday_netvalue(30, 40, seed=2).mask(lambda s: (s.index.day % 5 == 0) & (s.index.minute == 9)),
+    'inf': _intraday_netvalue(10, 20, seed=3).mask(lambda s: (s.index.day == 29) & (s.index.minute == 40), np.inf),
+}
+
+
+@pytest.mark.parametrize('period', [None, 'D', 'W', 'M'])
+@pytest.mark.parametrize('name', list(INTRADAY_NETVALUES))
+def test_intraday_analysis_matches_loop(name, period):
+    netvalue = INTRADAY_NETVALUES[name]
+    res = analysis_util.get_intraday_analysis(netvalue, 'min', 0.02, period=period)
+    expected = _loop_intraday_analysis(netvalue, 0.02, period)
+    if period is None:
+        pd.testing.assert_series_equal(res, expected, check_names=False, rtol=1e-10)
+    else:
+        pd.testing.assert_frame_equal(res, expected, check_column_type=False, rtol=1e-10)
+
+
+def _pandas_relative_analysis(netvalue, benchmarks, freq, rf, window, normalize):
+    """
+    逐基准以pandas计算的相对指标，缺失的策略收益率不参与统计
+    """
+    oneyear = analysis_util.FREQ_ONEYEAR_MAP[freq]
+    bench = pd.DataFrame({name: s.sort_index().reindex(netvalue.index, method='ffill')
+                          for name, s in benchmarks.items()}, index=netvalue.index)
+    if normalize:
+        bench = bench / bench.apply(lambda s: s.dropna().iloc[0] if s.notna().any() else 1.)
+    bench = bench.fillna(1.)
+    prev = netvalue.shift()
+    prev.iloc[0] = 1.
+    returns = netvalue / prev - 1
+    analysis, rolling_beta, relative_drawdown = {}, {}, {}
+    for name in bench.columns:
+        nav = bench[name]
+        bench_prev = nav.shift()
+        bench_prev.iloc[0] = 1.
+        bench_returns = nav / bench_prev - 1
+        valid = returns.notna()
+        r, b = returns[valid], bench_returns[valid]
+        excess = r - b
+        cov = ((r - r.mean()) * (b - b.mean())).mean()
+        var_b = b.var(ddof=0)
+        beta = cov / var_b if var_b > 0 else np.nan
+        tracking_error = excess.std(ddof=0) * np.sqrt(oneyear)
+        totalreturn, bench_totalreturn = netvalue.iloc[-1] - 1, nav.iloc[-1] - 1
+        n = len(netvalue)
+        drawdowns = _base_maxdrawdown(netvalue / nav)
+        analysis[name] = {
+            '超额收益率': totalreturn - bench_totalreturn,
+            '年化超额收益率': (1 + totalreturn) ** (oneyear / n) - (1 + bench_totalreturn) ** (oneyear / n),
+            'Alpha': (r.mean() - rf / oneyear - beta * (b.mean() - rf / oneyear)) * oneyear,
+            'Beta': beta,
+            '相关系数': cov / np.sqrt(r.var(ddof=0) * var_b),
+            '跟踪误差': tracking_error,
+            '信息比率': excess.mean() * oneyear / tracking_error if tracking_error > 0 else np.nan,
+            '相对最大回撤': drawdowns.min(),
+        }
+        beta = returns.rolling(window).cov(bench_returns) / bench_returns.rolling(window).var()
+        rolling_beta[name] = beta.where(bench_returns.rolling(window).var() > 1e-12) if window > 1 else beta * np.nan
+        relative_drawdown[name] = drawdowns
+    return {
+        'analysis': pd.DataFrame(analysis),
+        'rolling_beta': pd.DataFrame(rolling_beta, index=netvalue.index),
+        'relative_drawdown': pd.DataFrame(relative_drawdown, index=netvalue.index),
+    }
+
+
+def _benchmarks(netvalue, seed=0):
+    rng = np.random.default_rng(seed)
+    index = netvalue.index
+    late = pd.Series(np.cumprod(1 + rng.normal(0, 0.01, len(index))), index=index)
+    return {
+        'market': pd.Series(np.cumprod(1 + rng.normal(0, 0.01, len(index))), index=index),
+        # 晚于策略开始，且有缺失日期
+        'late': late.iloc[len(index) // 3:].iloc[::2] if len(index) > 3 else late,
+        'flat': pd.Series(1., index=index),
+    }
+
+
+RELATIVE_NETVALUES = {
+    'random': _netvalue(300),
+    'single': _netvalue(1),
+    'short': _netvalue(8),
+    'nan': NETVALUES['nan'],
+    'inf': NETVALUES['inf'],
+}
+
+
+@pytest.mark.parametrize('window', [1, 2, 20, 301])
+@pytest.mark.parametrize('name', list(RELATIVE_NETVALUES))
+def test_relative_analysis_matches_pandas(name, window):
+    netvalue = RELATIVE_NETVALUES[name]
+    benchmarks = _benchmarks(netvalue)
+    res = analysis_util.get_relative_analysis(netvalue, benchmarks, 'D', 0.02, window=window, normalize=True)
+    expected = _pandas_relative_analysis(netvalue, benchmarks, 'D', 0.02, window, normalize=True)
+    pd.testing.assert_frame_equal(res['analysis'], expected['analysis'], rtol=1e-8)
+    pd.testing.assert_frame_equal(res['rolling_beta'], expected['rolling_beta'], rtol=1e-6)
+    pd.testing.assert_frame_equal(res['relative_drawdown'], expected['relative_drawdown'], rtol=1e-10)
@@ -0,0 +1,98 @@
+"""
+patch_future_position / future_average_turnover与原逐行实现的一致性
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.utils import analysis_util, bt_resulst_utils
+
+MULT_DICT = {'S00000': 10., 'S00001': 5., 'S00002': 300.}
+
+
+def _loop_patch_future_position(p_df, t_df, market_data_df, mult_dict):
+    t_df = t_df.copy()
+    t_df['volume'] = t_df.groupby(['symbol'])['amount'].cumsum()
+    holding_df = t_df[['symbol', 'volume']].copy().reset_index()
+    holding_pivot_df = pd.pivot_table(holding_df, index=['date'], values=['volume'], columns=['symbol'], dropna=False)
+    holding_pivot_df.columns = holding_pivot_df.columns.droplevel()
+    market_value_df = holding_pivot_df * market_data_df
+    market_value_df = market_value_df.copy()
+    for c in market_value_df.columns:
+        mult = mult_dict[c] if c in mult_dict else 1
+        market_value_df[c] = market_value_df[c] * mult
+    margin_column_map = {c: f"{c}_margin" for c in p_df.columns if c != 'cash'}
+    column_map = {c: f"{c}_market_value" for c in market_value_df.columns}
+    p_df = p_df.rename(columns=margin_column_map)
+    market_value_df = market_value_df.rename(columns=column_map)
+    return pd.concat([market_value_df, p_df], axis=1)
+
+
+def _loop_future_average_turnover(position_df, transaction_df, freq, mult_dict):
+    grouper_key = analysis_util.FREQ_GROUPER_MAP[freq]
+    transaction_df = transaction_df.copy()
+    column_mask = [c for c in position_df.columns if 'market_value' in c]
+    position_df = position_df[column_mask].copy()
+    position_df['sum'] = position_df.apply(lambda x: x.abs().sum(), axis=1)
+    position_df['sum'] = position_df['sum'].replace(0.0, np.nan)
+    transaction_df['value_with_mult'] = transaction_df.apply(
+        lambda x: x['value'] * mult_dict.get(x['symbol'], 1.), axis=1)
+    position_df = position_df.groupby(pd.Grouper(freq='D'))[['sum']].mean().dropna()
+    transaction_df = transaction_df.groupby(pd.Grouper(freq='D')).agg(
+        total_value=pd.NamedAgg(column='value_with_mult', aggfunc=lambda x: x.abs().sum()),
+    ).reindex(index=position_df.index)
+    position_df = position_df.reset_index()
+    transaction_df = transaction_df.reset_index()
+    transaction_info = transaction_df.groupby(pd.Grouper(key='date', freq=grouper_key)).agg(
+        total_value=pd.NamedAgg(column='total_value', aggfunc=lambda x: x.abs().sum()),
+    )
+    position_info = position_df.groupby(pd.Grouper(key='date', freq=grouper_key)).agg(
+        mean_position_value=pd.NamedAgg(column='sum', aggfunc='first'),
+        total_days=pd.NamedAgg(column='date', aggfunc='nunique'),
+    )
+    merged_df = position_info.join(transaction_info)
+    merged_df = merged_df[~merged_df['mean_position_value'].isna()].copy()
+    merged_df['turnover_rate'] = merged_df['total_value'] / merged_df['mean_position_value'] \
+        / merged_df['total_days'] * 250
+    return merged_df['turnover_rate'].mean()
+
+
+@pytest.fixture(scope='module')
+def future_stat(run_backtest):
+    from btplugin.analyzers import BktGeneraStatics
+    strategy = run_backtest(stat=(BktGeneraStatics, {'future_like': True, 'mult_dict': MULT_DICT}))
+    return strategy.analyzers.stat
+
+
+@pytest.fixture(scope='module')
+def future_frames(future_stat):
+    res = future_stat.result()
+    market_data = bt_resulst_utils.build_market_data(future_stat.rets['marcket_data'])
+    return res['_positions'], res['_transactions'], market_data
+
+
+def test_patch_future_position_matches_loop(future_frames):
+    p_df, t_df, market_data = future_frames
+    assert t_df['symbol'].nunique() > 1
+    t_before = t_df.copy()
+    expected = _loop_patch_future_position(p_df, t_df, market_data, MULT_DICT)
+    result = bt_resulst_utils.patch_future_position(p_df, t_df, market_data, MULT_DICT)
+    pd.testing.assert_frame_equal(result, expected, check_names=False)
+    pd.testing.assert_frame_equal(t_df, t_before)
+
+
+@pytest.mark.parametrize('freq', ['D', 'W', 'M', 'Y'])
+def test_future_average_turnover_matches_loop(future_frames, freq):
+    p_df, t_df, market_data = future_frames
+    market_value = bt_resulst_utils.patch_future_position(p_df, t_df, market_data, MULT_DICT)
+    expected = _loop_future_average_turnover(market_value, t_df, freq, MULT_DICT)
+    assert np.isfinite(expected)
+    result = analysis_util.future_average_turnover(market_value, t_df, freq, MULT_DICT)
+    assert result == pytest.approx(expected, rel=1e-12)
+
+
+def test_future_turnover_in_analysis(future_stat, future_frames):
+    p_df, t_df, market_data = future_frames
+    market_value = _loop_patch_future_position(p_df, t_df, market_data, MULT_DICT)
+    expected = _loop_future_average_turnover(market_value, t_df, 'Y', MULT_DICT)
+    assert future_stat.result()['analysis']['年化换手率'] == pytest.approx(expected, rel=1e-12)
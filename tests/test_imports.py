@@ -0,0 +1,22 @@
+"""
+包与utils的子模块按需导入，星号导入的名称同原有的直接导入
+"""
+import importlib
+
+
+def test_star_import_exports_submodules():
+    namespace = {}
+    exec('from btplugin import *', namespace)
+    assert namespace['analyzers'] is importlib.import_module('btplugin.analyzers')
+    assert namespace['utils'] is importlib.import_module('btplugin.utils')
+    namespace = {}
+    exec('from btplugin.utils import *', namespace)
+    for name in ('analysis_util', 'bt_resulst_utils', 'record_utils', 'streaming_utils', 'result_store'):
+        assert namespace[name] is importlib.import_module('btplugin.utils.' + name)
+
+
+def test_analyzers_star_import():
+    namespace = {}
+    exec('from btplugin.analyzers import *', namespace)
+    assert namespace['BktGeneraStatics'].__name__ == 'BktGeneraStatics'
+    assert namespace['DailyTradeStats'].__module__ == 'btplugin.analyzers.trade'
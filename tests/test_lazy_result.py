@@ -0,0 +1,77 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+from btplugin.utils import bt_resulst_utils, profile_utils
+
+
+@pytest.fixture(scope='module')
+def instrumented(run_backtest):
+    from btplugin.analyzers import BktGeneraStatics
+    instrument = profile_utils.Instrumentation()
+    strategy = run_backtest(stat=(BktGeneraStatics, {'instrument': instrument, 'benchmarks': ['S00000']}))
+    return strategy.analyzers.stat, instrument
+
+
+def test_lazy_result_builds_once():
+    calls = []
+
+    def build(res):
+        calls.append(1)
+        return 1
+
+    res = bt_resulst_utils.LazyResult({'_a': build, 'b': lambda r: r['_a'] + 1})
+    assert list(res) == ['b'] and '_a' not in res
+    assert res['b'] == 2 and res['b'] == 2
+    assert len(calls) == 1
+    assert res.computed() == ['_a', 'b']
+
+
+def test_stage_names_use_exact_keys(instrumented):
+    stat, instrument = instrumented
+    instrument.reset()
+    stat._result_cache = None
+    res = stat.result()
+    res['npv']
+    res['relative_analysis']
+    res['rolling_beta']
+    report = instrument.report()
+    names = set(report.index)
+    assert {'BktGeneraStatics.result._npv', 'BktGeneraStatics.result.npv',
+            'BktGeneraStatics.result._returns', 'BktGeneraStatics.result._relative'} <= names
+    assert 'BktGeneraStatics.result.relative_analysis' not in names
+    assert 'BktGeneraStatics.result.rolling_beta' not in names
+    assert (report['calls'] == 1).all()
+
+
+def test_result_pickles_to_dict(instrumented):
+    stat, _ = instrumented
+    res = stat.result()
+    loaded = pickle.loads(pickle.dumps(res))
+    assert type(loaded) is dict
+    assert set(loaded) == set(res)
+    pd.testing.assert_series_equal(loaded['analysis'], res['analysis'])
+
+
+def test_result_values_are_copies(instrumented):
+    stat, _ = instrumented
+    res = stat.result()
+    npv = res['npv']
+    expected = npv.copy()
+    npv['npv'] = 0.
+    res['transaction'].drop(res['transaction'].index, inplace=True)
+    pd.testing.assert_frame_equal(res['npv'], expected)
+    assert len(res['transaction']) > 0
+    assert stat.result()['npv'] is not res['npv']
+    assert res['_npv'] is res['_npv']
+
+
+def test_result_is_read_only(instrumented):
+    stat, _ = instrumented
+    res = stat.result()
+    with pytest.raises(TypeError):
+        res['npv'] = None
+    mutable = dict(res)
+    mutable['npv'] = None
+    assert res['npv'] is not None
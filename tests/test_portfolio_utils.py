@@ -0,0 +1,63 @@
+"""
+多组权重的组合净值及指标与逐个组合计算的一致性
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.utils import analysis_util, portfolio_utils
+
+
+@pytest.fixture(scope='module')
+def returns():
+    rng = np.random.default_rng(5)
+    index = pd.bdate_range('2019-01-01', periods=400)
+    results = {
+        'a': pd.Series(rng.normal(0.0005, 0.01, 400), index=index),
+        # 晚开始的策略，之前的日期收益率为0
+        'b': pd.DataFrame({'r': rng.normal(0.0002, 0.02, 300)}, index=index[100:]),
+        'c': {'npv': pd.DataFrame({'r': rng.normal(0., 0.005, 400)}, index=index)},
+    }
+    return portfolio_utils.align_returns(results)
+
+
+def test_align_returns(returns):
+    assert list(returns.columns) == ['a', 'b', 'c']
+    assert len(returns) == 400
+    assert (returns['b'].iloc[:100] == 0).all()
+
+
+def test_combine_npv(returns):
+    weights = pd.DataFrame({'a': [0.5, 1.], 'b': [0.3, 0.]}, index=['mix', 'single'])
+    rebalanced = portfolio_utils.combine_npv(returns, weights)
+    expected = (1 + returns['a'] * 0.5 + returns['b'] * 0.3).cumprod()
+    np.testing.assert_allclose(rebalanced['mix'], expected)
+    np.testing.assert_allclose(rebalanced['single'], (1 + returns['a']).cumprod())
+    held = portfolio_utils.combine_npv(returns, weights, rebalance=False)
+    expected = 0.5 * (1 + returns['a']).cumprod() + 0.3 * (1 + returns['b']).cumprod() + 0.2
+    np.testing.assert_allclose(held['mix'], expected)
+    assert list(held.columns) == ['mix', 'single']
+
+
+@pytest.mark.parametrize('rebalance', [True, False])
+def test_portfolio_analysis(returns, rebalance):
+    rng = np.random.default_rng(6)
+    weights = rng.dirichlet(np.ones(3), size=10)
+    res = portfolio_utils.get_portfolio_analysis(returns, weights, 'D', rf=0.01, rebalance=rebalance, chunksize=3)
+    navs = portfolio_utils.combine_npv(returns, weights, rebalance=rebalance)
+    assert res['analysis'].shape == (10, 8)
+    for i in navs.columns:
+        pd.testing.assert_series_equal(res['analysis'].loc[i], analysis_util.get_netvalue_analysis(navs[i], 'D', 0.01),
+                                       check_names=False, rtol=1e-10)
+        pd.testing.assert_frame_equal(res['yearly_analysis'].loc[i],
+                                      analysis_util.get_yearly_analysis(navs[i], 'D', 0.01),
+                                      check_names=False, rtol=1e-10)
+
+
+def test_weights_errors(returns):
+    with pytest.raises(ValueError):
+        portfolio_utils.combine_npv(returns, pd.Series({'a': 0.5, 'z': 0.5}))
+    with pytest.raises(ValueError):
+        portfolio_utils.combine_npv(returns, [0.5, 0.5])
+    with pytest.raises(ValueError):
+        portfolio_utils.get_portfolio_analysis(returns, [0.3, 0.3, 0.3], 'X')
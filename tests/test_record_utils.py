@@ -0,0 +1,154 @@
+"""
+ColumnBuffer / SpillBuffer的记录与落盘，以及临时目录的删除
+"""
+import gc
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.utils import record_utils
+
+SCHEMA = [('date', 'float64'), ('symbol', 'object'), ('value', 'float64')]
+
+
+def _rows(n):
+    return [(float(i), f"S{i % 3}", i * 0.5) for i in range(n)]
+
+
+@pytest.fixture
+def tmp_tempdir(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+
+def test_column_buffer_append_extend_to_frame():
+    buffer = record_utils.ColumnBuffer(SCHEMA, capacity=2)
+    rows = _rows(7)
+    for row in rows[:3]:
+        buffer.append(*row)
+    buffer.extend(rows[3:])
+    expected = pd.DataFrame(rows, columns=['date', 'symbol', 'value']).set_index('date')
+    assert len(buffer) == 7
+    pd.testing.assert_frame_equal(buffer.to_frame(index='date'), expected)
+    buffer.clear()
+    assert len(buffer) == 0
+
+
+def test_spill_buffer_round_trip(tmp_tempdir):
+    buffer = record_utils.SpillBuffer(SCHEMA, chunk_rows=4)
+    rows = _rows(10)
+    buffer.extend(rows[:5])
+    for row in rows[5:]:
+        buffer.append(*row)
+    assert len(buffer) == 10
+    assert buffer.directory.startswith(str(tmp_tempdir))
+    expected = pd.DataFrame(rows, columns=['date', 'symbol', 'value'])
+    pd.testing.assert_frame_equal(buffer.to_frame(), expected)
+    assert [len(c['value']) for c in buffer.chunks(['value'])] == [5, 4, 1]
+
+
+def test_spill_buffer_transform(tmp_tempdir):
+    buffer = record_utils.SpillBuffer(SCHEMA, chunk_rows=3, transform=lambda c: {**c, 'value': c['value'] * 2})
+    buffer.extend(_rows(5))
+    np.testing.assert_allclose(buffer.column('value'), np.arange(5.))
+
+
+def test_temporary_directory_removed(tmp_tempdir):
+    buffer = record_utils.SpillBuffer(SCHEMA, chunk_rows=2)
+    buffer.extend(_rows(5))
+    buffer.flush()
+    assert buffer.cleanup and os.listdir(buffer.directory)
+    buffer.remove()
+    assert not os.path.exists(buffer.directory)
+    assert len(buffer) == 0
+
+    buffer = record_utils.SpillBuffer(SCHEMA, chunk_rows=2)
+    buffer.extend(_rows(5))
+    directory = buffer.directory
+    del buffer
+    gc.collect()
+    assert not os.path.exists(directory)
+
+
+def test_explicit_directory_kept(tmp_path):
+    buffer = record_utils.SpillBuffer(SCHEMA, str(tmp_path), chunk_rows=2)
+    buffer.extend(_rows(5))
+    buffer.flush()
+    directory = buffer.directory
+    assert not buffer.cleanup
+    del buffer
+    gc.collect()
+    assert sorted(os.listdir(directory)) == ['000000_date.npy', '000000_symbol.npy', '000000_value.npy']
+
+
+def test_pickled_copy_does_not_remove(tmp_tempdir):
+    buffer = record_utils.SpillBuffer(SCHEMA, chunk_rows=2)
+    buffer.extend(_rows(5))
+    buffer.flush()
+    copy = pickle.loads(pickle.dumps(buffer))
+    assert buffer.owner and not copy.owner
+    copy.remove()
+    del copy
+    gc.collect()
+    assert os.path.exists(buffer.directory)
+    pd.testing.assert_frame_equal(buffer.to_frame(), pd.DataFrame(_rows(5), columns=['date', 'symbol', 'value']))
+    # pickle过的SpillBuffer回收时保留目录，remove()仍可删除
+    directory = buffer.directory
+    buffer.remove()
+    assert not os.path.exists(directory)
+
+
+def test_view_does_not_remove(tmp_tempdir):
+    buffer = record_utils.SpillBuffer(SCHEMA, chunk_rows=2)
+    buffer.extend(_rows(5))
+    buffer.flush()
+    view = buffer.view()
+    view.remove()
+    del view
+    gc.collect()
+    pd.testing.assert_frame_equal(buffer.view().to_frame(), buffer.to_frame())
+    directory = buffer.directory
+    del buffer
+    gc.collect()
+    assert not os.path.exists(directory)
+
+
+def test_make_buffer():
+    assert isinstance(record_utils.make_buffer(SCHEMA), record_utils.ColumnBuffer)
+    buffer = record_utils.make_buffer(SCHEMA, True)
+    assert isinstance(buffer, record_utils.SpillBuffer) and buffer.cleanup
+    buffer.remove()
+
+
+def test_daily_trade_stats_spill(run_backtest, tmp_tempdir):
+    from btplugin.analyzers.trade import DailyTradeStats
+    strategy = run_backtest(plain=(DailyTradeStats, {}),
+                            spill=(DailyTradeStats, {'spill_dir': True, 'chunk_rows': 64}))
+    spill = strategy.analyzers.spill
+    directory = spill.rets['spill'].directory
+    keys = list(spill.rets)
+    expected = strategy.analyzers.plain.result()
+    # result不修改rets，也不删除落盘文件
+    for _ in range(2):
+        result = spill.result()
+        assert list(spill.rets) == keys
+        assert os.listdir(directory)
+        for key in ('df_top_k', 'df_bottom_k'):
+            pd.testing.assert_frame_equal(result[key], expected[key])
+        pd.testing.assert_series_equal(result['df_daily_pnl'].dtypes, expected['df_daily_pnl'].dtypes)
+    del strategy, spill
+    gc.collect()
+    assert not os.path.exists(directory)
+
+
+def test_spill_transactions_dtypes(run_backtest, tmp_tempdir):
+    from btplugin.analyzers import BktGeneraStatics
+    strategy = run_backtest(plain=(BktGeneraStatics, {}),
+                            spill=(BktGeneraStatics, {'spill_dir': True}))
+    expected = strategy.analyzers.plain.result()['transaction']
+    transaction = strategy.analyzers.spill.result()['transaction']
+    pd.testing.assert_series_equal(transaction[expected.columns].dtypes, expected.dtypes)
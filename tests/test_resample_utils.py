@@ -0,0 +1,73 @@
+"""
+bootstrap_analysis的指标口径、确定性及重抽样位置
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.utils import analysis_util, resample_utils
+
+
+@pytest.fixture(scope='module')
+def returns():
+    rng = np.random.default_rng(3)
+    index = pd.bdate_range('2020-01-01', periods=500)
+    return pd.Series(rng.normal(0.0005, 0.01, len(index)), index=index)
+
+
+def test_sample_metrics_match_netvalue_analysis(returns):
+    values = returns.to_numpy()
+    samples = np.vstack([values, values[::-1], np.roll(values, 7)])
+    metrics = resample_utils._sample_metrics(samples, analysis_util.FREQ_ONEYEAR_MAP['D'], 0.02)
+    for i, row in enumerate(samples):
+        expected = analysis_util.get_netvalue_analysis(pd.Series(np.cumprod(1 + row)), 'D', 0.02)
+        np.testing.assert_allclose(metrics[:, i], expected.to_numpy(dtype='float64'), rtol=1e-10)
+
+
+def test_bootstrap_analysis(returns):
+    res = resample_utils.bootstrap_analysis(returns, 'd', rf=0.02, n_samples=300, seed=5, chunksize=70,
+                                            return_samples=True)
+    labels = analysis_util._analysis_labels('D')
+    expected = analysis_util.get_netvalue_analysis((1 + returns).cumprod(), 'D', 0.02)
+    np.testing.assert_allclose(res['analysis']['estimate'].to_numpy(dtype='float64'),
+                               expected.to_numpy(dtype='float64'))
+    assert list(res['analysis'].index) == list(labels)
+    assert list(res['analysis'].columns) == ['estimate', 'mean', 'std', 0.05, 0.5, 0.95]
+    assert res['samples'].shape == (300, len(labels))
+
+
+def test_bootstrap_deterministic(returns):
+    kwargs = dict(n_samples=200, seed=11, chunksize=50, return_samples=True)
+    single = resample_utils.bootstrap_analysis(returns, 'D', max_workers=1, **kwargs)
+    again = resample_utils.bootstrap_analysis(returns, 'D', max_workers=1, **kwargs)
+    parallel = resample_utils.bootstrap_analysis(returns, 'D', max_workers=2, **kwargs)
+    pd.testing.assert_frame_equal(single['samples'], again['samples'])
+    pd.testing.assert_frame_equal(single['samples'], parallel['samples'])
+    assert resample_utils.bootstrap_analysis(returns, 'D', n_samples=200, seed=11)['samples'] is None
+
+
+@pytest.mark.parametrize('method', resample_utils.RESAMPLE_METHODS)
+def test_resample_index(method):
+    idx = resample_utils.resample_index(50, 20, block_size=5, method=method, rng=0)
+    assert idx.shape == (20, 50)
+    assert idx.min() >= 0 and idx.max() < 50
+    if method == 'block':
+        # 块内连续，超出末尾回到开头
+        steps = np.diff(idx, axis=1)
+        assert (steps[:, np.arange(49) % 5 != 4] % 50 == 1).all()
+
+
+def test_resample_index_single_period_blocks():
+    idx = resample_utils.resample_index(30, 4, block_size=1, method='block', rng=1)
+    assert idx.shape == (4, 30)
+
+
+def test_bootstrap_errors(returns):
+    with pytest.raises(ValueError):
+        resample_utils.bootstrap_analysis(returns, 'X')
+    with pytest.raises(ValueError):
+        resample_utils.bootstrap_analysis(returns, 'D', method='jackknife')
+    with pytest.raises(ValueError):
+        resample_utils.bootstrap_analysis(pd.Series(dtype='float64'), 'D')
+    with pytest.raises(ValueError):
+        resample_utils.resample_index(10, 2, method='jackknife')
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from btplugin.utils.result_store import ResultStore  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def results(run_backtest):
+    from btplugin.analyzers import BktGeneraStatics, DailyTradeStats
+    strategy = run_backtest(
+        stat=(BktGeneraStatics, {'rolling_windows': (20, 60), 'benchmarks': ['S00000']}),
+        trade=(DailyTradeStats, {}))
+    return {**strategy.analyzers.stat.result(), **strategy.analyzers.trade.result()}
+
+
+@pytest.fixture(params=['feather', 'parquet'])
+def store(request, tmp_path):
+    return ResultStore(str(tmp_path), fmt=request.param)
+
+
+def test_write_and_load_all_results(store, results, caplog):
+    store.write('run0', results, params={'window': 20, 'names': ['a', 'b']})
+    store.write('run1', results, params={'window': 60, 'names': ['c']})
+    assert 'no layout' not in caplog.text
+    assert set(store.keys()) == {k for k, v in results.items() if v is not None}
+    assert store.run_ids() == ['run0', 'run1']
+
+    analysis = store.load('analysis', run_ids=['run1'])
+    assert analysis['run_id'].tolist() == ['run1']
+    np.testing.assert_allclose(analysis[results['analysis'].index].to_numpy(dtype='float64')[0],
+                               results['analysis'].to_numpy(dtype='float64'))
+
+    runs = store.runs()
+    assert runs.set_index('run_id').loc['run0', 'window'] == 20
+    assert runs.set_index('run_id').loc['run1', 'names'] == '["c"]'
+
+
+def test_default_integer_index_not_stored(store, results):
+    store.write('run0', results)
+    for key in ('position', 'df_top_k', 'df_bottom_k', 'df_daily_pnl', 'drawdown_episodes'):
+        columns = store.load(key).columns
+        assert 'index' not in columns and 'level_0' not in columns, key
+    position = store.load('position', columns=['date', 'order_book_id', 'position'])
+    expected = results['position'].reset_index(drop=True)
+    pd.testing.assert_frame_equal(position.drop(columns='run_id'), expected, check_dtype=False)
+
+
+def test_rolling_and_relative_layouts(store, results):
+    store.write('run0', results)
+    rolling = store.load('rolling_analysis')
+    assert '20_' + results['rolling_analysis'][20].columns[0] in rolling.columns
+    assert len(rolling) == len(results['rolling_analysis'])
+    relative = store.load('relative_analysis')
+    assert relative['benchmark'].tolist() == ['S00000']
+    assert 'Beta' in relative.columns
+    assert 'S00000' in store.load('rolling_beta').columns
+    assert 'S00000' in store.load('relative_drawdown').columns
+    yearly = store.load('yearly_analysis')
+    assert yearly['period'].tolist() == [str(c) for c in results['yearly_analysis'].columns]
+
+
+def test_unknown_key_warns(store, caplog):
+    store.write('run0', {'unknown': pd.DataFrame({'a': [1]})})
+    assert 'unknown' in caplog.text
+    assert store.keys() == []
@@ -0,0 +1,114 @@
+"""
+SegmentAnalysis与BktGeneraStatics/DailyTradeStats的一致性，行情使用GenericCSVData(日线时间为23:59:59.999989)
+"""
+import backtrader as bt
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.benchmarks import fixtures
+from btplugin.analyzers import BktGeneraStatics, DailyTradeStats, SegmentAnalysis, walk_forward_segments
+from btplugin.utils import analysis_util
+
+MULT_DICT = {'S00000': 10., 'S00001': 5., 'S00002': 300.}
+
+
+@pytest.fixture(scope='module')
+def csv_feeds(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('csv')
+    paths = []
+    # 标的较多时每期都有持仓，换手率有限
+    for name, df in fixtures.make_price_frames(12, 300, seed=1):
+        path = directory / f'{name}.csv'
+        df.assign(openinterest=0).to_csv(path, index_label='datetime', date_format='%Y-%m-%d')
+        paths.append((name, str(path)))
+
+    def make():
+        return [(name, bt.feeds.GenericCSVData(
+            dataname=path, dtformat='%Y-%m-%d', datetime=0, open=1, high=2, low=3, close=4, volume=5,
+            openinterest=6, time=-1)) for name, path in paths]
+
+    return make
+
+
+@pytest.fixture(scope='module', params=[{}, {'sparse_positions': True},
+                                        {'future_like': True, 'mult_dict': MULT_DICT}],
+                ids=['positions', 'sparse', 'future'])
+def strategy(request, run_backtest, csv_feeds):
+    return run_backtest(csv_feeds(), stat=(BktGeneraStatics, request.param),
+                        trade=(DailyTradeStats, {'contribution_freq': 'M', 'k_largest': '5'}))
+
+
+def test_transactions_are_stamped_at_end_of_day(strategy):
+    res = strategy.analyzers.stat.result()
+    transactions = res['_transactions'].index
+    assert (transactions != transactions.normalize()).all()
+    assert res['_returns'].index.isin(transactions.normalize()).sum() > 0
+
+
+def test_full_segment_matches_analyzers(strategy):
+    stat, trade = strategy.analyzers.stat, strategy.analyzers.trade
+    res, trade_res = stat.result(), trade.result()
+    sa = SegmentAnalysis(stat, trade)
+    first, last = sa.dates[0].strftime('%Y-%m-%d'), sa.dates[-1].strftime('%Y-%m-%d')
+    out = sa.analyze({'all': (None, None), 'dates': (first, last)})
+    for name in ('all', 'dates'):
+        pd.testing.assert_series_equal(out['analysis'].loc[name], res['analysis'], check_names=False, rtol=1e-10)
+        yearly = out['yearly_analysis'].loc[name].dropna(axis=1, how='all')
+        pd.testing.assert_frame_equal(yearly, res['yearly_analysis'], check_names=False, rtol=1e-10)
+        pd.testing.assert_frame_equal(out['df_top_k'].loc[name], trade_res['df_top_k'])
+        pd.testing.assert_frame_equal(out['df_bottom_k'].loc[name], trade_res['df_bottom_k'])
+    assert out['segments'].loc['dates', 'bars'] == len(sa.dates)
+
+
+def test_sub_segment(strategy):
+    stat, trade = strategy.analyzers.stat, strategy.analyzers.trade
+    res = stat.result()
+    sa = SegmentAnalysis(stat, trade)
+    # 区间末日有成交
+    trade_days = res['_transactions'].index.normalize()
+    end_pos = int(sa.dates.get_indexer(trade_days[trade_days >= sa.dates[180]][:1])[0])
+    start, end = sa.dates[40], sa.dates[end_pos]
+    out = sa.analyze([(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))])
+    assert out['segments'].loc[0, 'bars'] == end_pos - 39
+    npv = sa.npv(start, end)
+    np.testing.assert_allclose(npv['npv'].to_numpy(),
+                               res['_npv'][40:end_pos + 1].to_numpy() / res['_npv'].iloc[39])
+    expected = analysis_util.get_netvalue_analysis(npv['npv'], 'D', 0.)
+    pd.testing.assert_series_equal(out['analysis'].iloc[0].drop('年化换手率'), expected, check_names=False,
+                                   rtol=1e-10)
+    lo, hi = start.normalize(), end.normalize() + pd.Timedelta(days=1)
+    transactions = res['_transactions']
+    transactions = transactions[(transactions.index >= lo) & (transactions.index < hi)]
+    if stat.p.future_like:
+        mv = res['_market_value']
+        turnover = analysis_util.future_average_turnover(mv[(mv.index >= lo) & (mv.index < hi)], transactions,
+                                                         mult_dict=MULT_DICT)
+    elif stat.p.sparse_positions:
+        positions, cash = res['_positions'], res['_cash']
+        turnover = analysis_util.long_average_turnover(
+            positions[(positions['date'] >= lo) & (positions['date'] < hi)],
+            cash.index[(cash.index >= lo) & (cash.index < hi)], transactions, stat.p.strategy_freq)
+    else:
+        positions = res['_positions']
+        turnover = analysis_util.average_turnover(positions[(positions.index >= lo) & (positions.index < hi)],
+                                                  transactions, stat.p.strategy_freq)
+    assert out['analysis'].iloc[0]['年化换手率'] == pytest.approx(turnover, rel=1e-10, nan_ok=True)
+
+
+def test_walk_forward_segments(strategy):
+    sa = SegmentAnalysis(strategy.analyzers.stat)
+    segments = walk_forward_segments(sa.dates, 100, 50, step=25)
+    assert list(segments)[:4] == ['is_0', 'oos_0', 'is_1', 'oos_1']
+    assert len(segments) == 2 * ((len(sa.dates) - 150) // 25 + 1)
+    out = sa.analyze(segments)
+    bars = out['segments']['bars']
+    assert (bars[bars.index.str.startswith('is_')] == 100).all()
+    assert (bars[bars.index.str.startswith('oos_')] == 50).all()
+    assert out['df_top_k'] is None
+    anchored = walk_forward_segments(sa.dates, 100, 50, anchored=True)
+    assert all(start == sa.dates[0] for name, (start, _) in anchored.items() if name.startswith('is_'))
+    with pytest.raises(ValueError):
+        walk_forward_segments(sa.dates, 0, 50)
+    with pytest.raises(ValueError):
+        sa.analyze([('2000-01-01', '2000-02-01')])
@@ -0,0 +1,127 @@
+"""
+逐期/逐块计算的指标与换手率与analysis_util全量计算的一致性
+"""
+import backtrader as bt
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.analyzers import BktGeneraStatics
+from btplugin.benchmarks import fixtures
+from btplugin.utils import analysis_util, streaming_utils
+
+
+@pytest.fixture(scope='module')
+def returns():
+    rng = np.random.default_rng(7)
+    index = pd.bdate_range('2019-06-03', periods=600)
+    return pd.Series(rng.normal(0.0003, 0.01, len(index)), index=index)
+
+
+def _chunks(series, sizes):
+    bounds = np.r_[0, np.cumsum(sizes)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        part = series.iloc[start:end]
+        yield part.index.to_numpy(), part.to_numpy()
+
+
+def test_running_stats(returns):
+    expected = analysis_util.get_netvalue_analysis((1 + returns).cumprod(), 'D', 0.02)
+    single = streaming_utils.RunningNetvalueStats()
+    for r in returns:
+        single.update(r)
+    batched = streaming_utils.RunningNetvalueStats()
+    for start in range(0, len(returns), 97):
+        batched.update_many(returns.to_numpy()[start:start + 97])
+    pd.testing.assert_series_equal(single.analysis('d', 0.02), expected, rtol=1e-10)
+    pd.testing.assert_series_equal(batched.analysis('D', 0.02), expected, rtol=1e-10)
+    assert streaming_utils.RunningNetvalueStats().analysis('D').isna().all()
+
+
+def test_updated_leaves_original(returns):
+    stats = streaming_utils.RunningNetvalueStats()
+    stats.update_many(returns.to_numpy()[:-1])
+    before = stats.analysis('D')
+    after = stats.updated(returns.iloc[-1]).analysis('D')
+    pd.testing.assert_series_equal(stats.analysis('D'), before)
+    pd.testing.assert_series_equal(after, analysis_util.get_netvalue_analysis((1 + returns).cumprod(), 'D', 0.),
+                                   rtol=1e-10)
+
+
+def test_chunked_netvalue_analysis(returns):
+    sizes = [1, 130, 250, 219]
+    netvalue = (1 + returns).cumprod()
+    pd.testing.assert_series_equal(
+        streaming_utils.chunked_netvalue_analysis(_chunks(returns, sizes), 'D', 0.01),
+        analysis_util.get_netvalue_analysis(netvalue, 'D', 0.01), rtol=1e-10)
+    pd.testing.assert_frame_equal(
+        streaming_utils.chunked_netvalue_analysis(_chunks(returns, sizes), 'D', period='Y'),
+        analysis_util.get_period_analysis(netvalue, 'D', period='Y'), check_names=False, rtol=1e-10)
+
+
+def test_chunked_intraday_analysis():
+    rng = np.random.default_rng(8)
+    days = pd.bdate_range('2021-01-04', periods=30)
+    index = pd.DatetimeIndex([d + pd.Timedelta(minutes=30 * (i + 1)) for d in days for i in range(8)])
+    returns = pd.Series(rng.normal(0, 0.003, len(index)), index=index)
+    # 块边界不与日边界对齐
+    sizes = [5, 60, 3, 100, 72]
+    pd.testing.assert_series_equal(
+        streaming_utils.chunked_netvalue_analysis(_chunks(returns, sizes), '30MIN'),
+        analysis_util.get_intraday_analysis((1 + returns).cumprod(), '30MIN'), check_names=False, rtol=1e-10)
+
+
+def test_chunked_netvalue_analysis_errors(returns):
+    with pytest.raises(ValueError):
+        streaming_utils.chunked_netvalue_analysis(_chunks(returns, [10]), 'X')
+    with pytest.raises(ValueError):
+        streaming_utils.chunked_netvalue_analysis(_chunks(returns, [10]), 'D', period='Q')
+
+
+@pytest.fixture(scope='module')
+def strategy(run_backtest):
+    # 标的较多时每期都有持仓，换手率有限
+    feeds = [(name, bt.feeds.PandasData(dataname=df)) for name, df in fixtures.make_price_frames(12, 300, seed=1)]
+    return run_backtest(feeds, stat=(BktGeneraStatics, {}), incremental=(BktGeneraStatics, {'incremental': True}))
+
+
+def test_incremental_analysis(strategy):
+    incremental = strategy.analyzers.incremental
+    expected = strategy.analyzers.stat.result()['analysis']
+    pd.testing.assert_series_equal(incremental.result()['analysis'], expected, rtol=1e-10)
+    pd.testing.assert_series_equal(incremental.snapshot(), expected, rtol=1e-10)
+
+
+@pytest.mark.parametrize('freq', ['W', 'M', 'Y'])
+def test_turnover(strategy, freq):
+    res = strategy.analyzers.stat.result()
+    positions, transactions = res['_positions'], res['_transactions']
+    expected = analysis_util.average_turnover(positions, transactions, freq)
+    assert np.isfinite(expected)
+    position_value = positions.sum(axis=1) - positions['cash']
+
+    chunked = streaming_utils.chunked_average_turnover(
+        _chunk_dates(positions.index, 70), _chunks(position_value, [70] * 5),
+        _chunks(transactions['value'], [len(transactions) // 2, len(transactions)]), freq)
+    assert chunked == pytest.approx(expected, rel=1e-10)
+
+    running = streaming_utils.RunningTurnover(freq)
+    values = transactions['value']
+    for dt, value in position_value.items():
+        for t_value in values[values.index.normalize() == dt]:
+            running.add_transaction(dt, t_value)
+        running.update(dt, value)
+    assert running.turnover() == pytest.approx(expected, rel=1e-10)
+
+
+def _chunk_dates(dates, size):
+    for start in range(0, len(dates), size):
+        yield dates[start:start + size].to_numpy()
+
+
+def test_period_key():
+    dt = pd.Timestamp('2021-03-03 10:30').to_pydatetime()
+    assert streaming_utils.period_key(dt, 'D') == dt.date()
+    assert streaming_utils.period_key(dt, 'W') == pd.Timestamp('2021-03-05').date()
+    assert streaming_utils.period_key(dt, 'M') == (2021, 3)
+    assert streaming_utils.period_key(dt, 'Y') == 2021
@@ -0,0 +1,108 @@
+"""
+aggregate_results与各run直接调用result()的一致性
+"""
+import os
+import types
+
+import backtrader as bt
+import pandas as pd
+import pytest
+
+from btplugin.analyzers import (BktGeneraStatics, DailyTradeStats, RESULT_FUNCTIONS, aggregate_results,
+                                 extract_payload)
+from btplugin.benchmarks import fixtures
+
+
+def _assert_equal(x, y):
+    if x is None:
+        assert y is None
+    elif isinstance(x, pd.DataFrame):
+        pd.testing.assert_frame_equal(x, y)
+    elif isinstance(x, pd.Series):
+        pd.testing.assert_series_equal(x, y)
+    else:
+        assert x == y
+
+
+@pytest.fixture(scope='module', params=[{}, {'future_like': True}, {'sparse_positions': True}],
+                ids=['positions', 'future', 'sparse'])
+def runs(request, price_frames):
+    cerebro = bt.Cerebro(stdstats=False, optreturn=True, maxcpus=1)
+    for name, df in price_frames:
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name=name)
+    cerebro.broker.setcash(1e7)
+    cerebro.optstrategy(fixtures.RandomRebalanceStrategy, seed=range(3))
+    cerebro.addanalyzer(BktGeneraStatics, _name='stat', **request.param)
+    cerebro.addanalyzer(DailyTradeStats, _name='trade')
+    return cerebro.run()
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_aggregate_matches_direct_results(runs, max_workers):
+    res = aggregate_results(runs, max_workers=max_workers)
+    assert len(res['results']) == 3
+    assert list(res['summary']['seed']) == [0, 1, 2]
+    for run, result in zip(runs, res['results']):
+        strategy = run[0]
+        for name in ('stat', 'trade'):
+            direct = getattr(strategy.analyzers, name).result()
+            assert set(result[name]) == set(direct)
+            for key in direct:
+                _assert_equal(direct[key], result[name][key])
+        expected = strategy.analyzers.stat.result()['analysis']
+        pd.testing.assert_series_equal(res['summary'].loc[strategy.p.seed, list(expected.index)], expected,
+                                       check_names=False, check_dtype=False)
+
+
+def test_payloads_are_accepted(runs):
+    payloads = [extract_payload(run[0]) for run in runs]
+    assert all(p['analyzers']['stat'][1]['instrument'] is None for p in payloads)
+    pd.testing.assert_frame_equal(aggregate_results(payloads, max_workers=1)['summary'],
+                                  aggregate_results(runs, max_workers=1)['summary'])
+
+
+@pytest.fixture(scope='module')
+def spill_runs(price_frames, tmp_path_factory):
+    cerebro = bt.Cerebro(stdstats=False, optreturn=True, maxcpus=1)
+    for name, df in price_frames:
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name=name)
+    cerebro.broker.setcash(1e7)
+    cerebro.optstrategy(fixtures.RandomRebalanceStrategy, seed=range(2))
+    cerebro.addanalyzer(BktGeneraStatics, _name='stat', spill_dir=True, spill_chunk_rows=64)
+    cerebro.addanalyzer(DailyTradeStats, _name='trade', spill_dir=True, chunk_rows=64)
+    cerebro.addanalyzer(DailyTradeStats, _name='plain')
+    return cerebro.run()
+
+
+def test_aggregate_spilled_results(spill_runs):
+    for max_workers in (1, 2, 1):
+        res = aggregate_results(spill_runs, max_workers=max_workers)
+        for run, result in zip(spill_runs, res['results']):
+            strategy = run[0]
+            expected = strategy.analyzers.plain.result()
+            assert len(result['trade']['df_daily_pnl']) == len(expected['df_daily_pnl']) > 0
+            for key in ('df_top_k', 'df_bottom_k'):
+                pd.testing.assert_frame_equal(result['trade'][key], expected[key])
+            pd.testing.assert_series_equal(result['stat']['analysis'], strategy.analyzers.stat.result()['analysis'])
+            # 汇总后原analyzer的落盘数据仍可读取
+            assert os.listdir(strategy.analyzers.trade.rets['spill'].directory)
+            _assert_equal(strategy.analyzers.trade.result()['df_top_k'], result['trade']['df_top_k'])
+
+
+def test_result_functions(runs):
+    strategy = runs[0][0]
+    for name in ('stat', 'trade'):
+        analyzer = getattr(strategy.analyzers, name)
+        params = types.SimpleNamespace(**dict(analyzer.p._getkwargs()))
+        result = RESULT_FUNCTIONS[type(analyzer)](params, analyzer.rets)
+        for key, value in analyzer.result().items():
+            _assert_equal(value, result[key])
+
+
+def test_payload_views_spills(spill_runs):
+    payload = extract_payload(spill_runs[0][0])
+    trade_rets = payload['analyzers']['trade'][2]
+    stat_rets = payload['analyzers']['stat'][2]
+    assert not trade_rets['spill'].owner
+    assert not stat_rets['positions']['spill'].owner
+    assert spill_runs[0][0].analyzers.trade.rets['spill'].owner
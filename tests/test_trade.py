@@ -0,0 +1,62 @@
+"""
+DailyTradeStats各记录方式的结果与逐bar遍历全部交易的结果一致
+"""
+import backtrader as bt
+import pandas as pd
+import pytest
+
+from btplugin.analyzers import DailyTradeStats
+
+
+class RoundTripStrategy(bt.Strategy):
+    """
+    包含同一bar内开平、反手及跨bar持有的交易
+    """
+
+    def __init__(self):
+        self._count = 0
+
+    def next(self):
+        self._count += 1
+        d0, d1 = self.datas[0], self.datas[1]
+        if self._count % 3 == 0:
+            # 下一bar内先开后平
+            self.buy(d0, size=100)
+            self.sell(d0, size=100)
+        if self._count % 7 == 0:
+            # 反手：平掉原有交易并开一笔反向交易
+            size = self.getposition(d1).size
+            self.sell(d1, size=size + 50) if size > 0 else self.buy(d1, size=-size + 50)
+        if self._count % 11 == 0:
+            self.buy(d0, size=30)
+        if self._count % 17 == 0:
+            self.close(d0)
+
+
+@pytest.fixture(scope='module')
+def strategy(price_frames):
+    cerebro = bt.Cerebro(stdstats=False)
+    for name, df in price_frames[:2]:
+        cerebro.adddata(bt.feeds.PandasData(dataname=df), name=name)
+    cerebro.broker.setcash(1e7)
+    cerebro.addstrategy(RoundTripStrategy)
+    kwargs = {'contribution_freq': 'M', 'k_largest': '3'}
+    cerebro.addanalyzer(DailyTradeStats, _name='full', **kwargs)
+    cerebro.addanalyzer(DailyTradeStats, _name='track_open', track_open=True, **kwargs)
+    cerebro.addanalyzer(DailyTradeStats, _name='columnar_track_open', track_open=True, columnar=True, **kwargs)
+    return cerebro.run()[0]
+
+
+@pytest.mark.parametrize('name', ['track_open', 'columnar_track_open'])
+def test_track_open_matches_full_scan(strategy, name):
+    expected = strategy.analyzers.full.result()
+    res = getattr(strategy.analyzers, name).result()
+    daily = res['df_daily_pnl']
+    # 同一bar内开平的交易只记录一次
+    assert not daily.duplicated(['date', 'ref']).any()
+    same_bar = daily[(daily['status'] == 'Closed') & (daily['dtopen'] == daily['dtclose'])]
+    assert len(same_bar) > 0
+    if name == 'track_open':
+        pd.testing.assert_frame_equal(daily.reset_index(drop=True), expected['df_daily_pnl'].reset_index(drop=True))
+    for key in ('df_top_k', 'df_bottom_k'):
+        pd.testing.assert_frame_equal(res[key], expected[key])
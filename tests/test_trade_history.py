@@ -0,0 +1,107 @@
+"""
+build_trade_history / build_contribution_rank与原groupby/apply实现的一致性
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.utils import analysis_util, bt_resulst_utils
+
+
+def _loop_build_trade_history(df_in):
+    df_in['unrealized_pnl'] = (df_in['close'] - df_in['price']) * df_in['size']
+    res = []
+    for _, group in df_in.groupby(by='ref'):
+        mask = (group['date'] == group['dtclose']) | (group['status'] == 'Open')
+        group = group[mask].copy()
+        group['overall_pnl'] = group['pnl'] + group['unrealized_pnl']
+        group['overall_pnlcomm'] = group['overall_pnl'] - group['commission']
+        group['overall_pnl_change'] = group['overall_pnl'] - group['overall_pnl'].shift(1)
+        group['overall_pnlcomm_change'] = group['overall_pnlcomm'] - group['overall_pnlcomm'].shift(1)
+        res.append(group)
+    return pd.concat(res, axis=0)
+
+
+def _loop_build_contribution_rank(df_daily_trade, freq, k, kind='quicksort'):
+    time_format = analysis_util.FREQ_TIME_FORMAT_REF[freq]
+    groups = df_daily_trade.groupby(pd.Grouper(key='date', freq=analysis_util.FREQ_GROUPER_MAP[freq]))
+    top_k_list, bottom_k_list = [], []
+    for date_key, group in groups:
+        res_list = []
+        for _, trade_group in group.groupby(by='ref'):
+            mask = (trade_group['date'] == trade_group['dtclose']) | (trade_group['status'] == 'Open')
+            df_t = trade_group[mask]
+            if df_t.empty:
+                continue
+            pnlcomm_change_0 = df_t['overall_pnlcomm_change'].iloc[0]
+            pnl_change_0 = df_t['overall_pnl_change'].iloc[0]
+            if pd.isna(pnlcomm_change_0):
+                pnlcomm_change = df_t['overall_pnlcomm'].iloc[-1]
+                pnl_change = df_t['overall_pnl'].iloc[-1]
+            else:
+                pnlcomm_change = df_t['overall_pnlcomm'].iloc[-1] - df_t['overall_pnlcomm'].iloc[0] + pnlcomm_change_0
+                pnl_change = df_t['overall_pnl'].iloc[-1] - df_t['overall_pnl'].iloc[0] + pnl_change_0
+            res_list.append({
+                'period_key ': date_key.strftime(time_format),
+                'order_book_id': df_t.iloc[0, 1],
+                'pnl_change': pnl_change,
+                'pnlcomm_change': pnlcomm_change,
+            })
+        if not res_list:
+            continue
+        df_period_pnl = pd.DataFrame(res_list).sort_values(by='pnlcomm_change', ascending=False, kind=kind)
+        top_k_df = df_period_pnl.head(k).copy()
+        bottom_k_df = df_period_pnl.tail(k).copy()
+        top_k_df['rank'] = top_k_df['pnlcomm_change'].rank(ascending=False)
+        top_k_df['rank_str'] = top_k_df['rank'].apply(lambda x: f"top_{int(x)}")
+        bottom_k_df['rank'] = bottom_k_df['pnlcomm_change'].rank(ascending=True)
+        bottom_k_df['rank_str'] = bottom_k_df['rank'].apply(lambda x: f"bottom_{int(x)}")
+        top_k_list.append(top_k_df)
+        bottom_k_list.append(bottom_k_df)
+    return pd.concat(top_k_list, axis=0), pd.concat(bottom_k_list, axis=0)
+
+
+@pytest.fixture(scope='module')
+def daily_trade():
+    """
+    整数收益，同期内大量相同贡献
+    """
+    rng = np.random.default_rng(0)
+    n = 600
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 60, n), 'D')
+    df = pd.DataFrame({
+        'date': dates,
+        'order_book_id': rng.choice(['A', 'B', 'C', 'D', 'E'], n),
+        'pnl': rng.integers(-2, 3, n).astype(float),
+        'pnlcomm': 0.,
+        'commission': rng.integers(0, 2, n).astype(float),
+        'value': 1.,
+        'size': rng.integers(-2, 3, n),
+        'price': 10.,
+        'status': rng.choice(['Open', 'Closed'], n),
+        'ref': rng.integers(0, 80, n),
+        'dtopen': dates,
+        'dtclose': np.where(rng.random(n) < 0.5, dates, pd.NaT),
+        'open': 10.,
+        'close': rng.integers(9, 12, n).astype(float),
+    })
+    return df.sort_values('date', kind='mergesort').reset_index(drop=True)
+
+
+def test_trade_history(daily_trade):
+    pd.testing.assert_frame_equal(bt_resulst_utils.build_trade_history(daily_trade.copy()),
+                                  _loop_build_trade_history(daily_trade.copy()))
+
+
+@pytest.mark.parametrize('freq', ['W', 'M', 'Y'])
+@pytest.mark.parametrize('k', [3, 1000])
+def test_contribution_rank(daily_trade, freq, k):
+    history = bt_resulst_utils.build_trade_history(daily_trade.copy())
+    res = bt_resulst_utils.build_contribution_rank(history, freq, k)
+    # 相同贡献按ref顺序，即原实现使用稳定排序时的结果
+    for df, expected in zip(res, _loop_build_contribution_rank(history, freq, k, kind='mergesort')):
+        pd.testing.assert_frame_equal(df, expected)
+    # 原实现的快速排序只改变相同贡献之间的先后
+    columns = ['period_key ', 'pnlcomm_change', 'rank', 'rank_str']
+    for df, expected in zip(res, _loop_build_contribution_rank(history, freq, k)):
+        pd.testing.assert_frame_equal(df[columns].reset_index(drop=True), expected[columns].reset_index(drop=True))
@@ -0,0 +1,83 @@
+"""
+换手率各计算内核的一致性，numba未安装时跳过JIT内核
+"""
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from btplugin.analyzers import BktGeneraStatics
+from btplugin.utils import analysis_util
+
+HAS_NUMBA = importlib.util.find_spec('numba') is not None
+ENGINES = ['numpy', 'auto',
+           pytest.param('numba', marks=pytest.mark.skipif(not HAS_NUMBA, reason='numba not installed'))]
+
+
+@pytest.fixture(scope='module')
+def kernel_inputs():
+    rng = np.random.default_rng(2)
+    n_periods = 40
+    # 编号无序、含NaN持仓及无持仓/无成交的周期
+    position_codes = rng.integers(0, n_periods - 5, 500).astype(np.intp)
+    position = rng.normal(100, 10, 500)
+    position[rng.random(500) < 0.1] = np.nan
+    trade_codes = rng.integers(3, n_periods, 200).astype(np.intp)
+    traded = rng.random(200) * 10
+    return position_codes, position, trade_codes, traded, n_periods
+
+
+def test_loop_kernel_matches_numpy(kernel_inputs):
+    for expected, value in zip(analysis_util._period_stats_numpy(*kernel_inputs),
+                               analysis_util._period_stats_loop(*kernel_inputs)):
+        np.testing.assert_allclose(value, expected, rtol=1e-12)
+
+
+@pytest.mark.skipif(not HAS_NUMBA, reason='numba not installed')
+def test_jit_kernel_matches_numpy(kernel_inputs):
+    kernel = analysis_util._jit_period_stats(True)
+    for expected, value in zip(analysis_util._period_stats_numpy(*kernel_inputs), kernel(*kernel_inputs)):
+        np.testing.assert_allclose(value, expected, rtol=1e-12)
+
+
+@pytest.mark.skipif(HAS_NUMBA, reason='numba installed')
+def test_numba_engine_requires_numba(run_backtest):
+    dates = pd.bdate_range('2020-01-01', periods=5)
+    with pytest.raises(ImportError):
+        analysis_util.period_turnover_stats(dates, np.ones(5), dates[:2], np.ones(2), 'W', engine='numba')
+    # analyzer的参数传入换手率内核
+    strategy = run_backtest(stat=(BktGeneraStatics, {'turnover_engine': 'numba'}))
+    with pytest.raises(ImportError):
+        strategy.analyzers.stat.result()['analysis']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_period_turnover_stats(engine):
+    rng = np.random.default_rng(4)
+    dates = pd.bdate_range('2020-01-01', periods=300)
+    position = rng.normal(1e6, 1e5, len(dates))
+    position[:7] = np.nan
+    trade_dates = dates[rng.integers(0, len(dates), 150)].sort_values()
+    traded = rng.random(150) * 1e5
+    expected = analysis_util.period_turnover_stats(dates, position, trade_dates, traded, 'M')
+    pd.testing.assert_frame_equal(
+        analysis_util.period_turnover_stats(dates, position, trade_dates, traded, 'M', engine=engine), expected)
+    with pytest.raises(ValueError):
+        analysis_util.period_turnover_stats(dates, position, trade_dates, traded, 'M', engine='cython')
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('params', [{}, {'sparse_positions': True},
+                                    {'future_like': True, 'mult_dict': {'S00000': 10.}}], ids=['positions', 'sparse', 'future'])
+def test_analyzer_turnover_engine(run_backtest, engine, params):
+    strategy = run_backtest(numpy=(BktGeneraStatics, params),
+                            engine=(BktGeneraStatics, dict(params, turnover_engine=engine)))
+    assert strategy.analyzers.engine.p.turnover_engine == engine
+    pd.testing.assert_series_equal(strategy.analyzers.engine.result()['analysis'],
+                                   strategy.analyzers.numpy.result()['analysis'])
+
+
+def test_analyzer_invalid_engine(run_backtest):
+    with pytest.raises(ValueError):
+        run_backtest(stat=(BktGeneraStatics, {'turnover_engine': 'cython'}))
@@ -1,4 +1,26 @@
 from __future__ import (absolute_import)
 
-from . import analysis_util as analysis_util
-from . import bt_resulst_utils as bt_resulst_utils
+import importlib
+
+# 各工具模块按需导入，只使用其中一个时不加载其余模块的依赖
+_SUBMODULES = (
+    'analysis_util',
+    'bt_resulst_utils',
+    'record_utils',
+    'streaming_utils',
+    'result_store',
+    'profile_utils',
+    'portfolio_utils',
+    'resample_utils',
+)
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES))
@@ -28,6 +28,27 @@ DAYS_IN_PERIOD = {
     'HD': 126,
     'Y': 252
 }
+# 日内频率每日的bar数(A股每日交易240分钟)
+INTRADAY_BARS_PER_DAY = {
+    'MIN': 240,
+    '1MIN': 240,
+    '5MIN': 48,
+    '15MIN': 16,
+    '30MIN': 8,
+    '60MIN': 4,
+    'H': 4,
+    '1H': 4,
+}
+FREQ_ONEYEAR_MAP.update({k: FREQ_ONEYEAR_MAP['D'] * v for k, v in INTRADAY_BARS_PER_DAY.items()})
+# 与FREQ_GROUPER_MAP分组一致的pd.Period频率
+FREQ_PERIOD_MAP = {
+    'D': 'D',
+    '1D': 'D',
+    "W": 'W-FRI',
+    '1W': 'W-FRI',
+    'M': 'M',
+    'Y': 'Y'
+}
 FREQ_TIME_FORMAT_REF = {
     'D': '%Y-%m-%d',
     '1D': '%Y-%m-%d',
@@ -49,72 +70,436 @@ def get_netvalue_analysis(netvalue, freq, rf) -> pd.Series:
     freq = freq.upper()
 
     if len(netvalue) == 0 or netvalue is None:
-        return pd.Series({
-            '累计收益率': np.nan,
-            '年化收益率': np.nan,
-            '年化波动率': np.nan,
-            '最大回撤率': np.nan,
-            '胜率(' + freq + ')': np.nan,
-            '盈亏比': np.nan,
-            '夏普比率': np.nan,
-            'Calmar比': np.nan,
-        }, name='analysis')
+        return pd.Series(dict.fromkeys(_analysis_labels(freq), np.nan), name='analysis')
     if freq not in FREQ_ONEYEAR_MAP:
         raise ValueError('get_netvalue_analysis -- Not Right freq : ', freq)
-    oneyear = FREQ_ONEYEAR_MAP[freq]
+    values = np.asarray(netvalue, dtype='float64')
+    metrics = _netvalue_metrics(values, np.zeros(len(values), dtype=np.intp), 1, FREQ_ONEYEAR_MAP[freq], rf)
+    return pd.Series(dict(zip(_analysis_labels(freq), metrics[:, 0])), name='analysis')
+
+
+def get_period_analysis(netvalue, freq, rf=0, period='Y') -> pd.DataFrame:
+    """
+    按周期分组进行指标统计，所有周期在一次向量化计算中完成
+    每个周期的净值以上一周期末净值为基准
+    :param netvalue: pd.Series
+    :param freq: 收益率频率
+    :param rf: 无风险利率
+    :param period: 分组周期, FREQ_TIME_FORMAT_REF中的频率(D/W/M/Y), 或与netvalue等长的分组标签
+                   分组需在时间上连续
+    :return: pd.DataFrame, 行为指标, 列为周期
+    """
+    freq = freq.upper()
+    if len(netvalue) == 0 or netvalue is None:
+        return pd.DataFrame()
+    if freq not in FREQ_ONEYEAR_MAP:
+        raise ValueError('get_period_analysis -- Not Right freq : ', freq)
+    if isinstance(period, str):
+        if period not in FREQ_TIME_FORMAT_REF:
+            raise ValueError('get_period_analysis -- Not Right period : ', period)
+        keys = pd.DatetimeIndex(netvalue.index).strftime(FREQ_TIME_FORMAT_REF[period])
+    else:
+        keys = period
+    codes, uniques = pd.factorize(np.asarray(keys))
+    values = np.asarray(netvalue, dtype='float64')
+    metrics = _netvalue_metrics(values, codes, len(uniques), FREQ_ONEYEAR_MAP[freq], rf)
+    return pd.DataFrame(metrics, index=_analysis_labels(freq), columns=pd.Index(uniques, dtype=object))
+
+
+def _analysis_labels(freq):
+    return ['累计收益率', '年化收益率', '年化波动率', '最大回撤率', '胜率(' + freq + ')', '盈亏比', '夏普比率', 'Calmar比']
+
+
+def _netvalue_metrics(values, codes, n_groups, oneyear, rf, prev=None) -> np.ndarray:
+    """
+    分组指标计算内核
+    :param values: np.ndarray, 净值
+    :param codes: np.ndarray, 每期所属分组编号(0..n_groups-1)，分组在时间上连续
+    :param n_groups: 分组数
+    :param oneyear: 年化期数
+    :param rf: 无风险利率
+    :param prev: np.ndarray, 每期的上一期净值，默认为values右移一期、首期为1
+    :return: np.ndarray, shape为(指标数, n_groups), 指标顺序同_analysis_labels
+    """
+    n = len(values)
+    positions = np.arange(n)
+    # 收益率序列，首期以1为基准
+    if prev is None:
+        prev = np.empty(n)
+        prev[0] = 1.
+        prev[1:] = values[:-1]
+    returns = values / prev - 1
+    # 分组首末位置
+    first_pos = np.full(n_groups, n, dtype=np.intp)
+    np.minimum.at(first_pos, codes, positions)
+    last_pos = np.zeros(n_groups, dtype=np.intp)
+    np.maximum.at(last_pos, codes, positions)
     # 交易次数
-    tradeslen = netvalue.shape[0]
-    # 收益率序列
-    tmp = netvalue.shift()
-    tmp[0] = 1
-    returns = netvalue / tmp - 1
-    # 累计收益率
-    totalreturn = netvalue.iloc[-1] - 1
+    tradeslen = np.bincount(codes, minlength=n_groups)
+    # 累计收益率，以上一期末净值为基准
+    init = prev[first_pos]
+    totalreturn = values[last_pos] / init - 1
     # 年化收益率
     return_yr = (1 + totalreturn) ** (oneyear / tradeslen) - 1
-    # 年化波动率
-    volatility_yr = np.std(returns, ddof=0) * np.sqrt(oneyear)
-    if volatility_yr == 0.0:
-        return pd.Series({
-            '累计收益率': np.nan,
-            '年化收益率': np.nan,
-            '年化波动率': np.nan,
-            '最大回撤率': np.nan,
-            '胜率(' + freq + ')': np.nan,
-            '盈亏比': np.nan,
-            '夏普比率': np.nan,
-            'Calmar比': np.nan,
-        }, name='analysis')
-    else:
+    # 年化波动率，缺失的收益率不参与统计
+    valid = ~np.isnan(returns)
+    valid_count = np.bincount(codes, valid, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(codes, np.where(valid, returns, 0.), minlength=n_groups) / valid_count
+        var = np.bincount(codes, np.where(valid, (returns - mean[codes]) ** 2, 0.), minlength=n_groups) / valid_count
+    volatility_yr = np.sqrt(var) * np.sqrt(oneyear)
+    # 分组内回撤，缺失的净值不参与统计；分组首期净值缺失时为NaN
+    highpoints = pd.Series(values).groupby(codes, sort=False).cummax().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = values / highpoints - 1
+    drawdowns[values == highpoints] = 0
+    maxdrawdown = np.zeros(n_groups)
+    np.fmin.at(maxdrawdown, codes, drawdowns)
+    maxdrawdown[np.isnan(drawdowns[first_pos])] = np.nan
+    # 盈亏次数与平均盈亏
+    win = returns > 0
+    lose = returns < 0
+    win_count = np.bincount(codes, win, minlength=n_groups)
+    lose_count = np.bincount(codes, lose, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_mean = np.bincount(codes, np.where(win, returns, 0.), minlength=n_groups) / win_count
+        lose_mean = np.bincount(codes, np.where(lose, returns, 0.), minlength=n_groups) / lose_count
         # 夏普比率
         sharpe = (return_yr - rf) / volatility_yr
-        # 回撤
-        drawdowns = get_maxdrawdown(netvalue)
-        # 最大回撤
-        maxdrawdown = min(drawdowns)
         # 收益风险比
-        if maxdrawdown == 0:
-            profit_risk_ratio = np.inf
-        else:
-            profit_risk_ratio = return_yr / np.abs(maxdrawdown)
-        # 盈利次数
-        win_count = (returns > 0).sum()
-        # 亏损次数
-        lose_count = (returns < 0).sum()
+        profit_risk_ratio = np.where(maxdrawdown == 0, np.inf, return_yr / np.abs(maxdrawdown))
         # 胜率
         win_rate = win_count / (win_count + lose_count)
         # 盈亏比
-        p_over_l = returns[returns > 0].mean() / np.abs(returns[returns < 0].mean())
-    return pd.Series({
-        '累计收益率': totalreturn,
-        '年化收益率': return_yr,
-        '年化波动率': volatility_yr,
-        '最大回撤率': maxdrawdown,
-        '胜率(' + freq + ')': win_rate,
-        '盈亏比': p_over_l,
-        '夏普比率': sharpe,
-        'Calmar比': profit_risk_ratio,
-    }, name='analysis')
+        p_over_l = win_mean / np.abs(lose_mean)
+    metrics = np.vstack([totalreturn, return_yr, volatility_yr, maxdrawdown, win_rate, p_over_l, sharpe,
+                         profit_risk_ratio])
+    # 波动率为0的分组不做统计；基准净值缺失或无穷时整组以其归一后无有效值
+    metrics[:, (volatility_yr == 0.0) | ~np.isfinite(init)] = np.nan
+    return metrics
+
+
+def resample_netvalue(netvalue) -> pd.Series:
+    """
+    日内净值降采样为日度，取每日最后一个净值
+    :param netvalue: pd.Series, 按时间排序的DatetimeIndex
+    :return: pd.Series, index为日期
+    """
+    days = _day_codes(netvalue.index)
+    last = np.flatnonzero(np.r_[days[1:] != days[:-1], True]) if len(days) else days
+    return pd.Series(np.asarray(netvalue, dtype='float64')[last],
+                     index=pd.DatetimeIndex(days[last], name=netvalue.index.name))
+
+
+def get_intraday_analysis(netvalue, freq, rf=0, period=None):
+    """
+    日内净值的指标统计: 降采样为日度净值后按日度统计，最大回撤与Calmar比使用全分辨率的净值
+    :param netvalue: pd.Series, 按时间排序的日内净值
+    :param freq: 净值频率, INTRADAY_BARS_PER_DAY中的频率
+    :param rf: 无风险利率
+    :param period: None时同get_netvalue_analysis返回pd.Series; 为D/W/M/Y时同get_period_analysis返回pd.DataFrame
+    :return: pd.Series / pd.DataFrame, 指标标签同日度
+    """
+    freq = freq.upper()
+    if freq not in INTRADAY_BARS_PER_DAY:
+        raise ValueError('get_intraday_analysis -- Not Right freq : ', freq)
+    if period is not None and period not in FREQ_TIME_FORMAT_REF:
+        raise ValueError('get_intraday_analysis -- Not Right period : ', period)
+    daily = resample_netvalue(netvalue)
+    if len(daily) == 0:
+        return get_netvalue_analysis(daily, 'D', rf) if period is None else pd.DataFrame()
+    # 分组在日度上计算，再按日广播到每个bar，不生成逐bar的时间对象
+    if period is None:
+        day_group, uniques = np.zeros(len(daily), dtype=np.intp), None
+    else:
+        day_group, uniques = pd.factorize(np.asarray(daily.index.strftime(FREQ_TIME_FORMAT_REF[period])))
+    days = _day_codes(netvalue.index)
+    bar_day = np.r_[0, np.cumsum(days[1:] != days[:-1])]
+    n_groups = 1 if uniques is None else len(uniques)
+    metrics = _netvalue_metrics(daily.to_numpy(), day_group, n_groups, FREQ_ONEYEAR_MAP['D'], rf)
+    # 全分辨率的分组内最大回撤，缺失值的处理同_netvalue_metrics
+    values = np.asarray(netvalue, dtype='float64')
+    bar_group = day_group[bar_day]
+    highpoints = pd.Series(values).groupby(bar_group, sort=False).cummax().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = values / highpoints - 1
+    drawdowns[values == highpoints] = 0
+    maxdrawdown = np.zeros(n_groups)
+    np.fmin.at(maxdrawdown, bar_group, drawdowns)
+    first_bar = np.flatnonzero(np.r_[True, bar_group[1:] != bar_group[:-1]])
+    maxdrawdown[np.isnan(drawdowns[first_bar])] = np.nan
+    # 不做统计的分组全部为NaN
+    valid = ~np.isnan(metrics).all(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics[3, valid] = maxdrawdown[valid]
+        metrics[7, valid] = np.where(maxdrawdown == 0, np.inf, metrics[1] / np.abs(maxdrawdown))[valid]
+    labels = _analysis_labels('D')
+    if period is None:
+        return pd.Series(dict(zip(labels, metrics[:, 0])), name='analysis')
+    return pd.DataFrame(metrics, index=labels, columns=pd.Index(uniques, dtype=object))
+
+
+def _day_codes(index) -> np.ndarray:
+    """
+    DatetimeIndex所属日期，datetime64[D]
+    """
+    return pd.DatetimeIndex(index).to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+
+
+def get_rolling_analysis(netvalue, freq, rf=0, windows=(60, 120, 250)) -> pd.DataFrame:
+    """
+    滚动窗口指标统计，指标同get_netvalue_analysis，每个窗口长度O(n)完成
+    窗口内的净值以窗口前一期净值为基准，同get_period_analysis
+    :param netvalue: pd.Series
+    :param freq: 收益率频率
+    :param rf: 无风险利率
+    :param windows: 窗口长度(期数)，可同时计算多个
+    :return: pd.DataFrame, index同netvalue, 列为(窗口长度, 指标)，不足一个窗口的期为NaN
+    """
+    freq = freq.upper()
+    if freq not in FREQ_ONEYEAR_MAP:
+        raise ValueError('get_rolling_analysis -- Not Right freq : ', freq)
+    windows = [int(w) for w in windows]
+    if any(w <= 0 for w in windows):
+        raise ValueError('get_rolling_analysis -- Not Right windows : ', windows)
+    labels = _analysis_labels(freq)
+    columns = pd.MultiIndex.from_product([windows, labels], names=['window', 'metric'])
+    values = np.asarray(netvalue, dtype='float64')
+    if len(values) == 0:
+        return pd.DataFrame(index=netvalue.index, columns=columns, dtype='float64')
+    data = np.hstack([_rolling_metrics(values, w, FREQ_ONEYEAR_MAP[freq], rf).T for w in windows])
+    return pd.DataFrame(data, index=netvalue.index, columns=columns)
+
+
+def _rolling_metrics(values, window, oneyear, rf) -> np.ndarray:
+    """
+    滚动窗口指标计算内核，累计和做差得到窗口内的和，回撤使用分块前后缀的单调聚合
+    :return: np.ndarray, shape为(指标数, n), 指标顺序同_analysis_labels
+    """
+    n = len(values)
+    metrics = np.full((8, n), np.nan)
+    if window > n:
+        return metrics
+    prev = np.empty(n)
+    prev[0] = 1.
+    prev[1:] = values[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = values / prev - 1
+    end = np.arange(window - 1, n)
+    start = end - window + 1
+
+    def window_count(mask):
+        cum = np.concatenate(([0], np.cumsum(mask)))
+        return cum[end + 1] - cum[start]
+
+    def window_sum(x):
+        x = np.asarray(x, dtype='float64')
+        finite = np.isfinite(x)
+        cum = np.concatenate(([0.], np.cumsum(np.where(finite, x, 0.))))
+        res = cum[end + 1] - cum[start]
+        if finite.all():
+            return res
+        # 非有限值单独计数，结果同窗口内直接求和，且不影响之后的窗口
+        pos, neg = window_count(x == np.inf) > 0, window_count(x == -np.inf) > 0
+        res[pos], res[neg] = np.inf, -np.inf
+        res[(window_count(np.isnan(x)) > 0) | (pos & neg)] = np.nan
+        return res
+
+    # 累计收益率
+    totalreturn = values[end] / prev[start] - 1
+    return_yr = (1 + totalreturn) ** (oneyear / window) - 1
+    # 年化波动率，以全局均值中心化减小累计和的误差；缺失的收益率不参与统计
+    valid = ~np.isnan(returns)
+    finite = np.isfinite(returns)
+    centered = np.where(valid, returns - (returns[finite].mean() if finite.any() else 0.), 0.)
+    valid_count = window_count(valid)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = window_sum(centered) / valid_count
+        var = np.maximum(window_sum(centered ** 2) / valid_count - mean ** 2, 0.)
+    # 窗口内只有一个有效收益率或收益率全部相同时方差严格为0，避免累计和的舍入误差
+    changes = np.concatenate(([0], np.cumsum(returns[1:] != returns[:-1])))
+    var[((valid_count == 1) | (changes[end] == changes[start])) & np.isfinite(var)] = 0.
+    volatility_yr = np.sqrt(var) * np.sqrt(oneyear)
+    # 窗口内最大回撤，缺失的净值不参与统计；窗口首期净值缺失时为NaN
+    maxdrawdown = np.minimum(_rolling_worst_ratio(values, window)[end] - 1, 0.)
+    maxdrawdown[np.isnan(values[start])] = np.nan
+    # 盈亏次数与平均盈亏
+    win = returns > 0
+    lose = returns < 0
+    win_count = window_sum(win)
+    lose_count = window_sum(lose)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        win_mean = window_sum(np.where(win, returns, 0.)) / win_count
+        lose_mean = window_sum(np.where(lose, returns, 0.)) / lose_count
+        sharpe = (return_yr - rf) / volatility_yr
+        profit_risk_ratio = np.where(maxdrawdown == 0, np.inf, return_yr / np.abs(maxdrawdown))
+        win_rate = win_count / (win_count + lose_count)
+        p_over_l = win_mean / np.abs(lose_mean)
+    res = np.vstack([totalreturn, return_yr, volatility_yr, maxdrawdown, win_rate, p_over_l, sharpe,
+                     profit_risk_ratio])
+    # 波动率为0的窗口不做统计；基准净值缺失或无穷时同get_period_analysis
+    res[:, (volatility_yr == 0.0) | ~np.isfinite(prev[start])] = np.nan
+    metrics[:, end] = res
+    return metrics
+
+
+def _rolling_worst_ratio(values, window) -> np.ndarray:
+    """
+    以每期为窗口末尾，窗口内 min(v_j / v_i), i <= j，即1 + 最大回撤
+    按窗口长度分块，窗口至多跨两个块，由前一块的后缀聚合与后一块的前缀聚合合并得到
+    聚合忽略缺失值，窗口内全部缺失时为NaN
+    :return: np.ndarray, 前window - 1期无意义
+    """
+    n = len(values)
+    n_blocks = -(-n // window)
+    # 以末值补齐，不改变任何聚合结果
+    v = np.concatenate((values, np.repeat(values[-1], n_blocks * window - n))).reshape(n_blocks, window)
+    # 块内前缀: 最小值, 最差比值
+    prefix_min = np.fmin.accumulate(v, axis=1)
+    prefix_worst = np.fmin.accumulate(_worst_ratio(v, np.fmax.accumulate(v, axis=1)), axis=1)
+    # 块内后缀: 最大值, 最差比值
+    rev = v[:, ::-1]
+    suffix_max = np.fmax.accumulate(rev, axis=1)[:, ::-1]
+    suffix_min = np.fmin.accumulate(rev, axis=1)[:, ::-1]
+    suffix_worst = np.fmin.accumulate(_worst_ratio(suffix_min, v)[:, ::-1], axis=1)[:, ::-1]
+    prefix_min, prefix_worst = prefix_min.ravel(), prefix_worst.ravel()
+    suffix_max, suffix_worst = suffix_max.ravel(), suffix_worst.ravel()
+
+    res = np.full(n, np.nan)
+    end = np.arange(window - 1, n)
+    start = end - window + 1
+    aligned = start % window == 0
+    res[end] = np.where(
+        aligned,
+        suffix_worst[start],
+        np.fmin(np.fmin(suffix_worst[start], prefix_worst[end]), _worst_ratio(prefix_min[end], suffix_max[start])),
+    )
+    return res
+
+
+def _worst_ratio(low, high) -> np.ndarray:
+    """
+    low / high，相等时为1(同get_maxdrawdown，净值等于前高时回撤为0)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(low == high, 1., low / high)
+
+
+def get_relative_analysis(netvalue, benchmarks, freq, rf=0, window=60, normalize=False) -> dict:
+    """
+    相对基准的指标统计，所有基准只对齐一次，在二维数组上一次计算
+    :param netvalue: pd.Series, 策略净值，缺失的收益率不参与统计，滚动beta中含缺失或无穷收益率的窗口为NaN
+    :param benchmarks: pd.DataFrame / {基准名: pd.Series}, 基准净值(期初基准为1，同netvalue)，按netvalue的日期向前填充对齐
+    :param freq: 收益率频率
+    :param rf: 无风险利率
+    :param window: 滚动beta的窗口长度(期数)
+    :param normalize: 基准为价格时设为True(或需要归一的基准名列表)，以对齐后的首个有效值归一，首期收益率为0
+    :return: {
+        'analysis': pd.DataFrame, 行为指标, 列为基准
+        'rolling_beta': pd.DataFrame, index同netvalue, 列为基准
+        'relative_drawdown': pd.DataFrame, 相对净值(策略净值/基准净值)的回撤, index同netvalue, 列为基准
+    }
+    """
+    freq = freq.upper()
+    if freq not in FREQ_ONEYEAR_MAP:
+        raise ValueError('get_relative_analysis -- Not Right freq : ', freq)
+    oneyear = FREQ_ONEYEAR_MAP[freq]
+    # 合并后各基准在其他基准的日期上为NaN，先向前填充再对齐
+    bench = pd.DataFrame(benchmarks).sort_index().ffill().reindex(netvalue.index, method='ffill')
+    names = bench.columns
+    nav = np.asarray(netvalue, dtype='float64')
+    bench_nav = bench.to_numpy(dtype='float64')
+    if normalize is not False and normalize is not None and len(bench_nav):
+        columns = names if normalize is True else pd.Index(normalize)
+        first_pos = np.argmax(~np.isnan(bench_nav), axis=0)
+        first = bench_nav[first_pos, np.arange(len(names))]
+        scale = np.where(names.isin(columns), first, 1.)
+        bench_nav = bench_nav / scale
+    # 基准开始前视为不变
+    bench_nav = np.where(np.isnan(bench_nav), 1., bench_nav)
+    n = len(nav)
+    prev = np.r_[1., nav[:-1]]
+    returns = nav / prev - 1
+    bench_prev = np.vstack((np.ones((1, bench_nav.shape[1])), bench_nav[:-1]))
+    bench_returns = bench_nav / bench_prev - 1
+
+    labels = ['超额收益率', '年化超额收益率', 'Alpha', 'Beta', '相关系数', '跟踪误差', '信息比率', '相对最大回撤']
+    metrics = np.full((len(labels), len(names)), np.nan)
+    rolling_beta = np.full(bench_nav.shape, np.nan)
+    relative_drawdown = np.zeros(bench_nav.shape)
+    if n:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative_nav = nav[:, None] / bench_nav
+            relative_high = np.fmax.accumulate(relative_nav, axis=0)
+            relative_drawdown = np.where(relative_nav >= relative_high, 0., relative_nav / relative_high - 1)
+        rolling_beta = _rolling_beta(returns, bench_returns, window)
+    # 缺失的策略收益率不参与统计
+    valid = ~np.isnan(returns)
+    if valid.any():
+        r, b = returns[valid][:, None], bench_returns[valid]
+        totalreturn = nav[-1] - 1
+        bench_totalreturn = bench_nav[-1] - 1
+        rf_period = rf / oneyear
+        with np.errstate(divide='ignore', invalid='ignore'):
+            excess = r - b
+            mean_r, mean_b = r.mean(), b.mean(axis=0)
+            cov = ((r - mean_r) * (b - mean_b)).mean(axis=0)
+            var_r = r.var()
+            var_b = b.var(axis=0)
+            tracking_error = excess.std(axis=0) * np.sqrt(oneyear)
+            beta = np.where(var_b > 0, cov / var_b, np.nan)
+            metrics[:] = np.vstack([
+                totalreturn - bench_totalreturn,
+                (1 + totalreturn) ** (oneyear / n) - (1 + bench_totalreturn) ** (oneyear / n),
+                (mean_r - rf_period - beta * (mean_b - rf_period)) * oneyear,
+                beta,
+                cov / np.sqrt(var_r * var_b),
+                tracking_error,
+                np.where(tracking_error > 0, excess.mean(axis=0) * oneyear / tracking_error, np.nan),
+                np.fmin.reduce(relative_drawdown, axis=0),
+            ])
+    return {
+        'analysis': pd.DataFrame(metrics, index=labels, columns=names),
+        'rolling_beta': pd.DataFrame(rolling_beta, index=netvalue.index, columns=names),
+        'relative_drawdown': pd.DataFrame(relative_drawdown, index=netvalue.index, columns=names),
+    }
+
+
+def _rolling_beta(returns, bench_returns, window) -> np.ndarray:
+    """
+    滚动beta，累计和做差得到窗口内的协方差与方差，O(n)
+    :param returns: np.ndarray, (n,)
+    :param bench_returns: np.ndarray, (n, 基准数)
+    :return: np.ndarray, (n, 基准数), 不足一个窗口的期为NaN
+    """
+    n, k = bench_returns.shape
+    res = np.full((n, k), np.nan)
+    window = int(window)
+    if window <= 1 or window > n:
+        return res
+    # 缺失或无穷的收益率置0后求累计和，含有这些期的窗口为NaN，不影响其他窗口
+    finite_r, finite_b = np.isfinite(returns), np.isfinite(bench_returns)
+    finite = finite_r[:, None] & finite_b
+    # 以全局均值中心化减小累计和的误差
+    center_r = returns[finite_r].mean() if finite_r.any() else 0.
+    center_b = np.where(finite_b, bench_returns, 0.).sum(axis=0) / np.maximum(finite_b.sum(axis=0), 1)
+    r = np.where(finite, returns[:, None] - center_r, 0.)
+    b = np.where(finite, bench_returns - center_b, 0.)
+
+    def window_mean(x):
+        cum = np.vstack((np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)))
+        return (cum[window:] - cum[:-window]) / window
+
+    mean_r, mean_b = window_mean(r), window_mean(b)
+    cov = window_mean(r * b) - mean_r * mean_b
+    var_b = window_mean(b * b) - mean_b ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res[window - 1:] = np.where(var_b > 1e-14 * window_mean(b * b), cov / var_b, np.nan)
+    res[window - 1:][window_mean(~finite) > 0] = np.nan
+    # 窗口内基准收益率全部相同时方差严格为0，避免累计和的舍入误差
+    changes = np.vstack((np.zeros((1, k), dtype=np.intp), np.cumsum(bench_returns[1:] != bench_returns[:-1], axis=0)))
+    res[window - 1:][changes[window - 1:] == changes[:n - window + 1]] = np.nan
+    return res
 
 
 def get_maxdrawdown(netvalue) -> pd.Series:
@@ -123,22 +508,70 @@ def get_maxdrawdown(netvalue) -> pd.Series:
     :param netvalue: pd.Series
     :return:
     """
-    maxdrawdowns = pd.Series(index=netvalue.index, dtype='float64')
-    for i in np.arange(len(netvalue.index)):
-        highpoint = netvalue.iloc[0:(i + 1)].max()
-        if highpoint == netvalue.iloc[i]:
-            maxdrawdowns.iloc[i] = 0
-        else:
-            maxdrawdowns.iloc[i] = netvalue.iloc[i] / highpoint - 1
+    _, drawdowns = _drawdown_arrays(netvalue)
+    return pd.Series(drawdowns, index=netvalue.index, dtype='float64')
+
 
-    return maxdrawdowns
+def get_drawdown_episodes(netvalue) -> pd.DataFrame:
+    """
+    回撤区间统计，一次遍历得到所有回撤区间
+    :param netvalue: pd.Series, 缺失值不参与统计
+    :return: pd.DataFrame, 每行一个回撤区间
+        peak_date: 回撤开始前的最高点日期
+        trough_date: 区间内最低点日期
+        recovery_date: 恢复至前高的日期，未恢复为NaT
+        depth: 区间最大回撤率
+        duration: 最高点至恢复(未恢复则至最后一期)的期数
+    """
+    columns = ['peak_date', 'trough_date', 'recovery_date', 'depth', 'duration']
+    netvalue = netvalue.dropna()
+    _, drawdowns = _drawdown_arrays(netvalue)
+    n = len(drawdowns)
+    underwater = drawdowns < 0
+    if not underwater.any():
+        return pd.DataFrame(columns=columns)
+    edges = np.diff(np.concatenate(([False], underwater, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    # 区间内最低点：按(区间编号, 回撤)排序后取每个区间的第一个
+    positions = np.flatnonzero(underwater)
+    episode_ids = np.repeat(np.arange(len(starts)), ends - starts)
+    order = np.lexsort((drawdowns[positions], episode_ids))
+    trough_pos = positions[order[np.concatenate(([0], np.cumsum(ends - starts)[:-1]))]]
+    # 首期回撤恒为0，故starts >= 1
+    peak_pos = starts - 1
+    recovered = ends < n
+    index = netvalue.index
+    return pd.DataFrame({
+        'peak_date': index[peak_pos],
+        'trough_date': index[trough_pos],
+        'recovery_date': index[np.minimum(ends, n - 1)].where(recovered),
+        'depth': drawdowns[trough_pos],
+        'duration': np.where(recovered, ends, n - 1) - peak_pos,
+    }, columns=columns)
+
+
+def _drawdown_arrays(netvalue):
+    """
+    基于累计最大值的回撤计算，O(n)
+    :param netvalue: pd.Series
+    :return: (highpoints, drawdowns), np.ndarray
+    """
+    values = np.asarray(netvalue, dtype='float64')
+    highpoints = np.fmax.accumulate(values) if len(values) else values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = values / highpoints - 1
+    drawdowns[values == highpoints] = 0
+    return highpoints, drawdowns
 
 
-def average_turnover(position_df: pd.DataFrame, transaction_df: pd.DataFrame, freq: str = 'Y') -> float:
+def average_turnover(position_df: pd.DataFrame, transaction_df: pd.DataFrame, freq: str = 'Y',
+                     engine: str = 'numpy') -> float:
     """
     :param position_df: 仓位表
     :param transaction_df: 交易表
     :param freq: 计算换手率的基准频率
+    :param engine: 换手率计算内核，同period_turnover_stats
     :return: 平均换手率
     计算平均换手率
     在基准频率(周度/阅读/年度)上，计算
@@ -148,37 +581,79 @@ def average_turnover(position_df: pd.DataFrame, transaction_df: pd.DataFrame, fr
     4. 计算该频率上的换手率, total_value/position_value*factor
     返回所有换手率的平均值
     """
+    return turnover_series(position_df, transaction_df, freq, engine).mean()
+
+
+def turnover_series(position_df: pd.DataFrame, transaction_df: pd.DataFrame, freq: str = 'Y',
+                    engine: str = 'numpy') -> pd.Series:
+    """
+    各期的年化换手率，口径同average_turnover
+    :param position_df: 仓位表
+    :param transaction_df: 交易表
+    :param freq: 计算换手率的基准频率
+    :param engine: 换手率计算内核，同period_turnover_stats
+    :return: pd.Series, index为有持仓的周期(pd.PeriodIndex)，首笔成交之前与末笔成交之后的周期为NaN
+    """
     if freq not in DAYS_IN_PERIOD or freq not in FREQ_GROUPER_MAP:
         raise ValueError('average_turnover -- Not Right freq : ', freq)
-    grouper_key = FREQ_GROUPER_MAP[freq]
-    position_df['sum'] = position_df.sum(axis=1) - position_df['cash']
-    transaction_df = transaction_df.reset_index()
-    position_df = position_df.reset_index()
-    transaction_info = transaction_df.groupby(pd.Grouper(key='date', freq=grouper_key)).agg(
-        total_value=pd.NamedAgg(column='value', aggfunc=lambda x: x.abs().sum()),
-    )
-    position_info = position_df.groupby(pd.Grouper(key='date', freq=grouper_key)).agg(
-        position_value=pd.NamedAgg(column='sum', aggfunc='last'),
-        total_days=pd.NamedAgg(column='date', aggfunc='nunique'),
-        start_date=pd.NamedAgg(column='date', aggfunc='min'),
-        end_date=pd.NamedAgg(column='date', aggfunc='max'),
-    )
-    merged_df = position_info.join(transaction_info)
-    merged_df = merged_df[~merged_df['position_value'].isna()].copy()
-    merged_df['turnover_rate'] = merged_df['total_value'] / merged_df['position_value']
-    return merged_df['turnover_rate'].mean() / DAYS_IN_PERIOD[freq] * 252
+    position_value = position_df.sum(axis=1) - position_df['cash']
+    return _turnover_series(position_value, transaction_df, freq, engine)
+
+
+def long_average_turnover(position_long: pd.DataFrame, dates, transaction_df: pd.DataFrame, freq: str = 'Y',
+                          engine: str = 'numpy') -> float:
+    """
+    由持仓长表计算平均换手率，口径同average_turnover
+    :param position_long: 持仓长表，列为date/position
+    :param dates: 回测的全部日期，无持仓的日期持仓市值为0
+    :param transaction_df: 交易表
+    :param freq: 计算换手率的基准频率
+    :param engine: 换手率计算内核，同period_turnover_stats
+    :return: 平均换手率
+    """
+    if freq not in DAYS_IN_PERIOD or freq not in FREQ_GROUPER_MAP:
+        raise ValueError('average_turnover -- Not Right freq : ', freq)
+    dates = pd.DatetimeIndex(dates, name='date')
+    codes = dates.get_indexer(position_long['date'])
+    position_value = pd.Series(
+        np.bincount(codes, weights=position_long['position'].to_numpy(dtype='float64'), minlength=len(dates)),
+        index=dates)
+    return _turnover_series(position_value, transaction_df, freq, engine).mean()
+
+
+def _turnover_series(position_value: pd.Series, transaction_df: pd.DataFrame, freq: str, engine: str) -> pd.Series:
+    """
+    :param position_value: 以date为index的每日持仓市值(不含现金)
+    """
+    stats = period_turnover_stats(position_value.index, position_value.to_numpy(dtype='float64'),
+                                  transaction_df.index, np.abs(transaction_df['value'].to_numpy(dtype='float64')),
+                                  freq, engine)
+    # 首末成交期之间无成交的期成交额为0，之外不参与平均
+    traded_pos = np.flatnonzero(stats['trades'].to_numpy() > 0)
+    total_value = stats['traded'].to_numpy().copy()
+    if len(traded_pos):
+        total_value[:traded_pos[0]] = np.nan
+        total_value[traded_pos[-1] + 1:] = np.nan
+    else:
+        total_value[:] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover_rate = total_value / stats['last_position'].to_numpy() / DAYS_IN_PERIOD[freq] * 252
+    has_position = stats['days'].to_numpy() > 0
+    return pd.Series(turnover_rate[has_position], index=stats.index[has_position], name='turnover_rate')
 
 
 def future_average_turnover(
         position_df: pd.DataFrame,
         transaction_df: pd.DataFrame,
         freq: str = 'Y',
-        mult_dict={}
+        mult_dict={},
+        engine: str = 'numpy'
 ) -> float:
     """
     :param transaction_df: 交易表
     :return: 平均换手率
     :param freq: 计算换手率的基准频率
+    :param engine: 换手率计算内核，同period_turnover_stats
     计算期货平均换手率
     基于交易数据，计算平均换手率
     1. 按年分组
@@ -187,38 +662,164 @@ def future_average_turnover(
     2. 成交金量/平均市值得日度换手率
     3. 计算平均换手率
     """
+    return future_turnover_series(position_df, transaction_df, freq, mult_dict, engine).mean()
+
+
+def future_turnover_series(
+        position_df: pd.DataFrame,
+        transaction_df: pd.DataFrame,
+        freq: str = 'Y',
+        mult_dict={},
+        engine: str = 'numpy'
+) -> pd.Series:
+    """
+    期货各期的年化换手率，口径同future_average_turnover
+    :return: pd.Series, index为有持仓的周期(pd.PeriodIndex)
+    """
     if freq not in DAYS_IN_PERIOD or freq not in FREQ_GROUPER_MAP:
         raise ValueError('average_turnover -- Not Right freq : ', freq)
-    grouper_key = FREQ_GROUPER_MAP[freq]
     column_mask = [c for c in position_df.columns if 'market_value' in c]
-    position_df = position_df[column_mask].copy()
-    position_df['sum'] = position_df.apply(lambda x: x.abs().sum(), axis=1)
-    position_df['sum'] = position_df['sum'].replace(0.0, np.nan)
-    transaction_df['value_with_mult'] = transaction_df.apply(lambda x: x['value'] * mult_dict.get(x['symbol'], 1.), axis=1)
-    # 交易按日做sum，持仓按日做平均
-    position_df = position_df.groupby(pd.Grouper(freq='D'))[['sum']].mean().dropna()
-    transaction_df = transaction_df.groupby(pd.Grouper(freq='D')).agg(
-        total_value=pd.NamedAgg(column='value_with_mult', aggfunc=lambda x: x.abs().sum()),
-    ).reindex(index=position_df.index)
-
-
-    # 按年计算平均换手率
-    position_df = position_df.reset_index()
-    transaction_df = transaction_df.reset_index()
-    transaction_info = transaction_df.groupby(pd.Grouper(key='date',freq=grouper_key)).agg(
-        total_value=pd.NamedAgg(column='total_value', aggfunc=lambda x: x.abs().sum()),
-    )
-    position_info = position_df.groupby(pd.Grouper(key='date',freq=grouper_key)).agg(
-        mean_position_value=pd.NamedAgg(column='sum', aggfunc='first'),
-        total_days=pd.NamedAgg(column='date', aggfunc='nunique'),
-        start_date=pd.NamedAgg(column='date', aggfunc='min'),
-        end_date=pd.NamedAgg(column='date', aggfunc='max'),
-    )
-    merged_df = position_info.join(transaction_info)
-    merged_df = merged_df[~merged_df['mean_position_value'].isna()].copy()
-    merged_df['turnover_rate'] = merged_df['total_value'] / merged_df['mean_position_value'] \
-                                 / merged_df['total_days'] * 250
-    return merged_df['turnover_rate'].mean()
+    position_sum = position_df[column_mask].abs().sum(axis=1).replace(0.0, np.nan)
+    traded = np.abs(value_with_mult(transaction_df, mult_dict).to_numpy(dtype='float64'))
+    # 交易按日做sum，持仓按日做平均，只保留有持仓的日期
+    daily = period_turnover_stats(position_sum.index, position_sum.to_numpy(dtype='float64'),
+                                  transaction_df.index, traded, 'D', engine)
+    daily = daily[daily['days'] > 0]
+    # 按周期计算平均换手率，以每期首日持仓为基准
+    days = daily.index.to_timestamp()
+    stats = period_turnover_stats(days, daily['mean_position'].to_numpy(), days, daily['traded'].to_numpy(),
+                                  freq, engine)
+    stats = stats[stats['days'] > 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover_rate = stats['traded'] / stats['first_position'] / stats['days'] * 250
+    return turnover_rate.rename('turnover_rate')
+
+
+TURNOVER_ENGINES = ('numpy', 'numba', 'auto')
+_JIT_PERIOD_STATS = None
+
+
+def period_turnover_stats(position_dates, position_value, trade_dates, traded_value, freq,
+                          engine='numpy') -> pd.DataFrame:
+    """
+    换手率计算内核：日期一次映射为周期编号，按周期统计成交额与持仓市值
+    :param position_dates: 持仓市值的时间，按时间排序
+    :param position_value: np.ndarray, 持仓市值，NaN不参与统计
+    :param trade_dates: 成交时间
+    :param traded_value: np.ndarray, 成交额
+    :param freq: 周期，FREQ_PERIOD_MAP中的频率
+    :param engine: numpy为bincount/searchsorted实现；numba为JIT编译的单次遍历，需安装numba；auto为numba可用时使用numba
+    :return: pd.DataFrame, index为持仓与成交覆盖的全部周期(pd.PeriodIndex),
+             列为traded(成交额)/trades(成交笔数)/first_position/last_position/mean_position(期初/期末/平均持仓市值)/days(持仓期数)
+    """
+    if engine not in TURNOVER_ENGINES:
+        raise ValueError('period_turnover_stats -- Not Right engine : ', engine)
+    period_freq = FREQ_PERIOD_MAP[freq]
+    position_ordinals = pd.DatetimeIndex(position_dates).to_period(period_freq).asi8
+    trade_ordinals = pd.DatetimeIndex(trade_dates).to_period(period_freq).asi8
+    ordinals = np.r_[position_ordinals, trade_ordinals]
+    if not len(ordinals):
+        return pd.DataFrame(columns=['traded', 'trades', 'first_position', 'last_position', 'mean_position', 'days'],
+                            index=pd.PeriodIndex([], freq=period_freq))
+    base = ordinals.min()
+    n_periods = int(ordinals.max() - base + 1)
+    kernel = _period_stats_numpy if engine == 'numpy' else _jit_period_stats(engine == 'numba')
+    traded, trades, first, last, position_sum, days = kernel(
+        (position_ordinals - base).astype(np.intp), np.asarray(position_value, dtype='float64'),
+        (trade_ordinals - base).astype(np.intp), np.asarray(traded_value, dtype='float64'), n_periods)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_position = position_sum / days
+    return pd.DataFrame({
+        'traded': traded,
+        'trades': trades,
+        'first_position': first,
+        'last_position': last,
+        'mean_position': mean_position,
+        'days': days,
+    }, index=pd.period_range(pd.Period(ordinal=base, freq=period_freq), periods=n_periods))
+
+
+def _period_stats_numpy(position_codes, position, trade_codes, traded, n_periods):
+    valid = ~np.isnan(position)
+    codes = position_codes[valid]
+    values = position[valid]
+    if len(codes) > 1 and (codes[1:] < codes[:-1]).any():
+        order = np.argsort(codes, kind='stable')
+        codes, values = codes[order], values[order]
+    days = np.bincount(codes, minlength=n_periods)
+    position_sum = np.bincount(codes, weights=values, minlength=n_periods)
+    # 编号有序，每期首末位置
+    ends = np.cumsum(days)
+    starts = ends - days
+    has_position = days > 0
+    first = np.full(n_periods, np.nan)
+    last = np.full(n_periods, np.nan)
+    first[has_position] = values[starts[has_position]]
+    last[has_position] = values[ends[has_position] - 1]
+    traded_sum = np.bincount(trade_codes, weights=traded, minlength=n_periods)
+    trades = np.bincount(trade_codes, minlength=n_periods)
+    return traded_sum, trades, first, last, position_sum, days
+
+
+def _period_stats_loop(position_codes, position, trade_codes, traded, n_periods):
+    """
+    _period_stats_numpy的逐元素实现，由numba编译
+    """
+    traded_sum = np.zeros(n_periods)
+    trades = np.zeros(n_periods, dtype=np.int64)
+    first = np.full(n_periods, np.nan)
+    last = np.full(n_periods, np.nan)
+    position_sum = np.zeros(n_periods)
+    days = np.zeros(n_periods, dtype=np.int64)
+    for i in range(len(position_codes)):
+        value = position[i]
+        if np.isnan(value):
+            continue
+        code = position_codes[i]
+        if days[code] == 0:
+            first[code] = value
+        last[code] = value
+        position_sum[code] += value
+        days[code] += 1
+    for i in range(len(trade_codes)):
+        code = trade_codes[i]
+        traded_sum[code] += traded[i]
+        trades[code] += 1
+    return traded_sum, trades, first, last, position_sum, days
+
+
+def _jit_period_stats(required):
+    """
+    :param required: numba不可用时是否报错，否则退回numpy实现
+    """
+    global _JIT_PERIOD_STATS
+    if _JIT_PERIOD_STATS is None:
+        try:
+            import numba
+        except ImportError:
+            if required:
+                raise ImportError("turnover engine numba requires numba, please install it by `pip install numba`")
+            return _period_stats_numpy
+        _JIT_PERIOD_STATS = numba.njit(cache=True)(_period_stats_loop)
+    return _JIT_PERIOD_STATS
+
+
+def value_with_mult(transaction_df, mult_dict) -> pd.Series:
+    """
+    计入合约乘数的成交金额
+    """
+    mult = transaction_df['symbol'].map(mult_dict).fillna(1.).to_numpy(dtype='float64')
+    return pd.Series(transaction_df['value'].to_numpy() * mult, index=transaction_df.index)
+
+
+def period_index(dates, freq) -> pd.PeriodIndex:
+    """
+    日期所属的周期，分组与FREQ_GROUPER_MAP一致
+    :param dates: 日期序列
+    :param freq: 频率
+    :return: pd.PeriodIndex
+    """
+    return pd.DatetimeIndex(dates).to_period(FREQ_PERIOD_MAP[freq])
 
 
 def get_yearly_analysis(netvalue, freq, rf=0) -> pd.DataFrame:
@@ -229,16 +830,4 @@ def get_yearly_analysis(netvalue, freq, rf=0) -> pd.DataFrame:
     :param rf: 无风险利率
     :return:pd.Series
     """
-    df = pd.DataFrame(netvalue.rename('npv'))
-    df['dt'] = df.index
-    df['year'] = df['dt'].apply(lambda x: str(x.year))
-    years = df['year'].unique()
-    ret = pd.DataFrame()
-    init_npv = 1
-    for y in years:
-        npv = df[df['year'] == y]['npv']
-        year_npv = npv / init_npv
-        init_npv = npv.iloc[-1]
-        r = get_netvalue_analysis(year_npv, freq=freq, rf=rf)
-        ret[y] = r
-    return ret
+    return get_period_analysis(netvalue, freq=freq, rf=rf, period='Y')
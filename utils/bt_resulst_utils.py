@@ -1,61 +1,136 @@
+import collections.abc
+import contextlib
+import itertools
+import logging
+
+import numpy as np
 import pandas as pd
 
+from . import analysis_util
+
+CONTRIBUTION_COLUMNS = ['period_key ', 'order_book_id', 'pnl_change', 'pnlcomm_change', 'rank', 'rank_str']
+
+
+class LazyResult(collections.abc.Mapping):
+    """
+    按需计算并缓存的结果dict，每个结果在首次访问时计算
+    builders中的函数以LazyResult为参数，可通过[]取得其他结果
+    以_开头的key为中间结果，可通过[]访问，但不出现在keys()/items()中
+    对外结果每次访问返回缓存的DataFrame/Series的副本，调用方原地修改不影响缓存与其他结果；中间结果返回缓存对象本身
+    只读，不支持赋值与删除，需要修改时先转为dict
+    builders引用analyzer的rets，pickle/跨进程传输时计算全部对外结果并转为dict
+    """
+
+    def __init__(self, builders, stage=None):
+        """
+        :param builders: {key: builder(LazyResult)}
+        :param stage: stage(key)返回计算该结果时使用的上下文，如profile_utils的耗时统计
+        """
+        self._builders = builders
+        self._stage = stage
+        self._values = {}
+
+    def __getitem__(self, key):
+        value = self._get(key)
+        if key.startswith('_'):
+            return value
+        return _copy_value(value)
+
+    def _get(self, key):
+        if key in self._values:
+            return self._values[key]
+        builder = self._builders[key]
+        with self._stage(key) if self._stage is not None else contextlib.nullcontext():
+            value = builder(self)
+        self._values[key] = value
+        return value
+
+    def __iter__(self):
+        return (k for k in self._builders if not k.startswith('_'))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return key in self._builders and not key.startswith('_')
+
+    def computed(self) -> list:
+        """
+        已计算的key
+        """
+        return list(self._values)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def __repr__(self):
+        return f"LazyResult(keys={list(self)}, computed={self.computed()})"
+
+
+def _copy_value(value):
+    """
+    复制LazyResult中的pandas结果，dict逐项复制，其他类型原样返回
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, dict):
+        return type(value)((k, _copy_value(v)) for k, v in value.items())
+    return value
+
 
 def build_position_value(ordered_list) -> pd.DataFrame:
-    head = ordered_list['Datetime']
-    res = []
-    for k, v in ordered_list.items():
-        if k == 'Datetime':
-            continue
-        data = {'date': k}
-        for i in range(len(head)):
-            order_book_id = head[i]
-            data[order_book_id] = v[i]
-        res.append(data)
-    if not res:
-        return pd.DataFrame()
-    df = pd.DataFrame(res)
-    df['date'] = pd.to_datetime(df['date'])
-    df['date'].dt.tz_localize(None)
-    return df.set_index('date')
+    return _build_frame(ordered_list, 'Datetime')
 
 
 def build_market_data(ordered_list) -> pd.DataFrame:
-    head = ordered_list['Datetime']
-    res = []
-    for k, v in ordered_list.items():
-        if k == 'Datetime':
-            continue
-        data = {'date': k}
-        for i in range(len(head)):
-            order_book_id = head[i]
-            data[order_book_id] = v[i]
-        res.append(data)
-    if not res:
-        return pd.DataFrame()
-    df = pd.DataFrame(res)
-    df['date'] = pd.to_datetime(df['date'])
-    df['date'].dt.tz_localize(None)
-    return df.set_index('date')
+    return _build_frame(ordered_list, 'Datetime')
 
 
 def build_transaction(ordered_list) -> pd.DataFrame:
-    head = ordered_list['date'][0]
-    res = []
-    for k, transaction_list in ordered_list.items():
-        if k == 'date':
-            continue
-        for transaction in transaction_list:
-            data = {'date': k}
-            for i in range(len(head)):
-                data[head[i]] = transaction[i]
-            res.append(data)
-    if not res:
+    return _build_frame(ordered_list, 'date', multi_rows=True)
+
+
+def _build_frame(ordered_list, header_key, multi_rows=False) -> pd.DataFrame:
+    """
+    由analyzer的OrderedDict直接构建以date为index的DataFrame
+    :param ordered_list: {header_key: 列名, date: 行值}
+    :param header_key: 列名所在的key
+    :param multi_rows: 每个date下为多行(如Transactions)
+    :return: pd.DataFrame
+    """
+    head = ordered_list[header_key]
+    if multi_rows:
+        head = head[0]
+    dates = [k for k in ordered_list.keys() if k != header_key]
+    rows = [ordered_list[k] for k in dates]
+    if multi_rows:
+        counts = [len(v) for v in rows]
+        rows = list(itertools.chain.from_iterable(rows))
+    if not rows:
         return pd.DataFrame()
-    df = pd.DataFrame(res)
-    df['date'] = pd.to_datetime(df['date'])
-    df['date'].dt.tz_localize(None)
-    return df.set_index('date')
+    index = pd.DatetimeIndex(pd.to_datetime(dates), name='date')
+    if multi_rows:
+        index = index.repeat(counts)
+        return pd.DataFrame(rows, index=index, columns=head)
+    return pd.DataFrame(np.asarray(rows), index=index, columns=head)
+
+
+def build_long_position(position_long, cash) -> pd.DataFrame:
+    """
+    由持仓长表生成position结果，只保留正持仓，现金作为order_book_id为cash的行附在每日最后
+    :param position_long: pd.DataFrame, 列为date/order_book_id/position，按日期排序
+    :param cash: pd.Series, 以date为index的现金
+    :return: pd.DataFrame, 列为date/order_book_id/position
+    """
+    cash_long = pd.DataFrame({
+        'date': cash.index,
+        'order_book_id': 'cash',
+        'position': cash.to_numpy(dtype='float64'),
+    })
+    df = pd.concat([position_long, cash_long], ignore_index=True)
+    df = df[df['position'] > 0]
+    # 同日内持仓在前、现金在后
+    return df.sort_values(by='date', kind='mergesort').reset_index(drop=True)
 
 
 def patch_future_position(
@@ -63,18 +138,20 @@ def patch_future_position(
         t_df: pd.DataFrame,
         market_data_df: pd.DataFrame,
         mult_dict) -> pd.DataFrame:
-    t_df['volume'] = t_df.groupby(['symbol'])['amount'].cumsum()
-    holding_df = t_df[['symbol', 'volume']].copy().reset_index()
-    holding_pivot_df = pd.pivot_table(holding_df, index=['date'], values=['volume'], columns=['symbol'], dropna=False)
-    holding_pivot_df.columns = holding_pivot_df.columns.droplevel()
-    market_value_df = holding_pivot_df * market_data_df
-    market_value_df = market_value_df.copy()
-    for c in market_value_df.columns:
-        if c not in mult_dict:
-            mult = 1
-        else:
-            mult = mult_dict[c]
-        market_value_df[c] = market_value_df[c] * mult
+    volume = future_volume(t_df)
+    # 成交日持仓量(同日多笔成交取均值)
+    date_codes, dates = pd.factorize(t_df.index, sort=True)
+    symbol_codes, symbols = pd.factorize(t_df['symbol'], sort=True)
+    flat_codes = date_codes * len(symbols) + symbol_codes
+    size = len(dates) * len(symbols)
+    counts = np.bincount(flat_codes, minlength=size)
+    sums = np.bincount(flat_codes, weights=volume.to_numpy(dtype='float64'), minlength=size)
+    with np.errstate(invalid='ignore'):
+        holding = (sums / counts).reshape(len(dates), len(symbols))
+    holding_df = pd.DataFrame(holding, index=pd.DatetimeIndex(dates, name='date'), columns=pd.Index(symbols, name='symbol'))
+    market_value_df = holding_df * market_data_df
+    mult = np.array([mult_dict.get(c, 1) for c in market_value_df.columns], dtype='float64')
+    market_value_df = market_value_df * mult
     margin_column_map = {c: f"{c}_margin" for c in p_df.columns if c != 'cash'}
     column_map = {c: f"{c}_market_value" for c in market_value_df.columns}
     p_df = p_df.rename(columns=margin_column_map)
@@ -82,16 +159,107 @@ def patch_future_position(
     return pd.concat([market_value_df, p_df], axis=1)
 
 
+def future_volume(t_df) -> pd.Series:
+    """
+    每笔成交后的累计持仓量
+    """
+    return t_df.groupby(['symbol'])['amount'].cumsum()
+
+
 def build_trade_history(df_in) -> pd.DataFrame:
     df_in['unrealized_pnl'] = (df_in['close'] - df_in['price']) * df_in['size']
-    groups = df_in.groupby(by=['ref'])
-    res = []
-    for _, group in groups:
-        mask = (group['date'] == group['dtclose']) | (group['status'] == 'Open')
-        group = group[mask].copy()
-        group['overall_pnl'] = group['pnl'] + group['unrealized_pnl']
-        group['overall_pnlcomm'] = group['overall_pnl'] - group['commission']
-        group['overall_pnl_change'] = group['overall_pnl'] - group['overall_pnl'].shift(1)
-        group['overall_pnlcomm_change'] = group['overall_pnlcomm'] - group['overall_pnlcomm'].shift(1)
-        res.append(group)
-    return pd.concat(res, axis=0)
+    mask = (df_in['date'] == df_in['dtclose']) | (df_in['status'] == 'Open')
+    # 按ref稳定排序，保持每笔交易内的时间顺序
+    df = df_in[mask].sort_values(by='ref', kind='mergesort')
+    df['overall_pnl'] = df['pnl'] + df['unrealized_pnl']
+    df['overall_pnlcomm'] = df['overall_pnl'] - df['commission']
+    shifted = df.groupby('ref')[['overall_pnl', 'overall_pnlcomm']].shift(1)
+    df['overall_pnl_change'] = df['overall_pnl'] - shifted['overall_pnl']
+    df['overall_pnlcomm_change'] = df['overall_pnlcomm'] - shifted['overall_pnlcomm']
+    return df
+
+
+def build_contribution_rank(df_trade, freq, k):
+    """
+    按周期统计每笔交易的收益贡献，取每期贡献最大/最小的k笔
+    每期内贡献相同的交易按ref顺序排列(逐期sort_values的快速排序不保证相同贡献的先后，也可能取到不同的交易)
+    :param df_trade: build_trade_history的结果
+    :param freq: 统计周期, FREQ_GROUPER_MAP中的频率
+    :param k: 每期取的交易数
+    :return: (df_top_k, df_bottom_k)
+    """
+    time_format = analysis_util.FREQ_TIME_FORMAT_REF[freq]
+    mask = (df_trade['date'] == df_trade['dtclose']) | (df_trade['status'] == 'Open')
+    df_trade = df_trade[mask]
+    if df_trade.empty:
+        return pd.DataFrame(columns=CONTRIBUTION_COLUMNS), pd.DataFrame(columns=CONTRIBUTION_COLUMNS)
+    # 周期编号，按时间排序
+    periods = analysis_util.period_index(df_trade['date'], freq)
+    period_codes, period_uniques = pd.factorize(periods, sort=True)
+    period_keys = period_uniques.end_time.strftime(time_format)
+    _log_empty_periods(period_uniques, time_format)
+    df_top_k, df_bottom_k, _, _ = contribution_rank(df_trade, period_codes, period_keys, k)
+    return df_top_k, df_bottom_k
+
+
+def contribution_rank(df_trade, group_codes, group_keys, k):
+    """
+    build_contribution_rank的计算内核，按任意分组统计
+    :param df_trade: build_trade_history的结果中需要统计的行
+    :param group_codes: np.ndarray, 每行所属分组，编号顺序即输出顺序
+    :param group_keys: 各分组在period_key列中的值
+    :param k: 每组取的交易数
+    :return: (df_top_k, df_bottom_k, df_top_k各行所属分组, df_bottom_k各行所属分组)
+    """
+    refs = df_trade['ref'].to_numpy()
+    # 按(分组, ref, 原顺序)排序后，取每个(分组, ref)的首末行
+    order = np.lexsort((np.arange(len(refs)), refs, group_codes))
+    period_sorted = group_codes[order]
+    ref_sorted = refs[order]
+    starts = np.flatnonzero(np.r_[True, (period_sorted[1:] != period_sorted[:-1]) | (ref_sorted[1:] != ref_sorted[:-1])])
+    ends = np.r_[starts[1:], len(order)] - 1
+    first, last = order[starts], order[ends]
+    group_period = period_sorted[starts]
+    res = {}
+    for c in ('pnl', 'pnlcomm'):
+        overall = df_trade['overall_' + c].to_numpy()
+        change_0 = df_trade['overall_' + c + '_change'].to_numpy()[first]
+        # 本期首次建仓时，贡献为期末累计收益
+        res[c + '_change'] = np.where(np.isnan(change_0), overall[last],
+                                      overall[last] - overall[first] + change_0)
+    df_period_pnl = pd.DataFrame({
+        'period_key ': np.asarray(group_keys, dtype=object)[group_period],
+        'order_book_id': df_trade['order_book_id'].to_numpy()[first],
+        'pnl_change': res['pnl_change'],
+        'pnlcomm_change': res['pnlcomm_change'],
+    }, index=_cumcount(group_period))
+    # 每期内按贡献降序，lexsort稳定，相同贡献保持ref顺序
+    rank_order = np.lexsort((-df_period_pnl['pnlcomm_change'].to_numpy(), group_period))
+    df_period_pnl = df_period_pnl.iloc[rank_order]
+    group_period = group_period[rank_order]
+    position = _cumcount(group_period)
+    size = np.bincount(group_period)[group_period]
+    top_mask = position < k
+    bottom_mask = position >= size - k
+    df_top_k = df_period_pnl[top_mask].copy()
+    df_top_k['rank'] = df_top_k['pnlcomm_change'].groupby(group_period[top_mask]).rank(ascending=False)
+    df_top_k['rank_str'] = 'top_' + df_top_k['rank'].astype(int).astype(str)
+    df_bottom_k = df_period_pnl[bottom_mask].copy()
+    df_bottom_k['rank'] = df_bottom_k['pnlcomm_change'].groupby(group_period[bottom_mask]).rank(ascending=True)
+    df_bottom_k['rank_str'] = 'bottom_' + df_bottom_k['rank'].astype(int).astype(str)
+    return df_top_k, df_bottom_k, group_period[top_mask], group_period[bottom_mask]
+
+
+def _cumcount(codes) -> np.ndarray:
+    """
+    已排序分组编号的组内序号
+    """
+    starts = np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1]
+    sizes = np.diff(np.r_[starts, len(codes)])
+    return np.arange(len(codes)) - np.repeat(starts, sizes)
+
+
+def _log_empty_periods(period_uniques, time_format):
+    full = pd.period_range(period_uniques[0], period_uniques[-1], freq=period_uniques.freq)
+    for p in full.difference(period_uniques):
+        logging.info("period_key:" + p.end_time.strftime(time_format) + "的交易为空")
@@ -0,0 +1,117 @@
+import collections.abc
+
+import numpy as np
+import pandas as pd
+
+from . import analysis_util
+
+
+def align_returns(results) -> pd.DataFrame:
+    """
+    将多个子策略的收益率对齐为一张表
+    :param results: {策略名: BktGeneraStatics.result() / result()['npv'] / 收益率pd.Series}
+    :return: pd.DataFrame, index为各策略日期的并集, 列为策略, 策略未运行的日期收益率为0
+    """
+    series = {}
+    for name, res in results.items():
+        if isinstance(res, collections.abc.Mapping):
+            res = res['npv']
+        if isinstance(res, pd.DataFrame):
+            res = res['r']
+        series[name] = res
+    return pd.DataFrame(series).sort_index().fillna(0.)
+
+
+def combine_npv(returns, weights, rebalance=True) -> pd.DataFrame:
+    """
+    按多组权重计算组合净值，所有组合在一次矩阵运算中完成
+    权重不做归一化，权重和不足1的部分视为收益为0的现金
+    :param returns: align_returns的结果
+    :param weights: 权重，pd.DataFrame(行为组合, 列为策略，缺失的策略权重为0) / 二维数组(列顺序同returns) / 一维数组
+    :param rebalance: True为每期再平衡至目标权重，False为期初按权重分配后买入持有
+    :return: pd.DataFrame, index同returns, 列为组合
+    """
+    w = _weight_frame(returns, weights)
+    navs = _combine(returns.to_numpy(dtype='float64'), w.to_numpy(dtype='float64'), rebalance)
+    return pd.DataFrame(navs, index=returns.index, columns=w.index)
+
+
+def get_portfolio_analysis(returns, weights, freq, rf=0., rebalance=True, chunksize=256) -> dict:
+    """
+    按多组权重计算组合净值的综合分析与分年度分析，指标同get_netvalue_analysis / get_yearly_analysis
+    :param returns: align_returns的结果
+    :param weights: 权重，同combine_npv
+    :param freq: 收益率频率
+    :param rf: 无风险利率
+    :param rebalance: 同combine_npv
+    :param chunksize: 每次计算的组合数，控制内存占用
+    :return: {
+        'analysis': pd.DataFrame, 行为组合, 列为指标
+        'yearly_analysis': pd.DataFrame, 行为(组合, 指标), 列为年度
+    }
+    """
+    freq = freq.upper()
+    if freq not in analysis_util.FREQ_ONEYEAR_MAP:
+        raise ValueError('get_portfolio_analysis -- Not Right freq : ', freq)
+    oneyear = analysis_util.FREQ_ONEYEAR_MAP[freq]
+    labels = analysis_util._analysis_labels(freq)
+    w = _weight_frame(returns, weights)
+    r = returns.to_numpy(dtype='float64')
+    years = pd.DatetimeIndex(returns.index).strftime(analysis_util.FREQ_TIME_FORMAT_REF['Y'])
+    year_codes, year_uniques = pd.factorize(np.asarray(years))
+    n_years = len(year_uniques)
+    whole = np.zeros(len(r), dtype=np.intp)
+    analysis, yearly = [], []
+    for start in range(0, len(w), max(int(chunksize), 1)):
+        navs = _combine(r, w.iloc[start:start + chunksize].to_numpy(dtype='float64'), rebalance)
+        analysis.append(_stacked_metrics(navs, whole, 1, oneyear, rf)[:, :, 0].T)
+        # (指标, 组合, 年度) -> (组合, 指标, 年度)
+        yearly.append(_stacked_metrics(navs, year_codes, n_years, oneyear, rf).transpose(1, 0, 2)
+                      .reshape(-1, n_years))
+    return {
+        'analysis': pd.DataFrame(np.vstack(analysis), index=w.index, columns=labels),
+        'yearly_analysis': pd.DataFrame(
+            np.vstack(yearly), index=pd.MultiIndex.from_product([w.index, labels], names=['portfolio', 'metric']),
+            columns=pd.Index(year_uniques, dtype=object)),
+    }
+
+
+def _weight_frame(returns, weights) -> pd.DataFrame:
+    if isinstance(weights, pd.Series):
+        weights = weights.to_frame().T
+    if isinstance(weights, pd.DataFrame):
+        unknown = weights.columns.difference(returns.columns)
+        if len(unknown):
+            raise ValueError(f"portfolio_utils - unknown strategies in weights:{list(unknown)}")
+        return weights.reindex(columns=returns.columns, fill_value=0.).astype('float64')
+    w = np.atleast_2d(np.asarray(weights, dtype='float64'))
+    if w.shape[1] != returns.shape[1]:
+        raise ValueError(f"portfolio_utils - weights shape {w.shape} does not match {returns.shape[1]} strategies")
+    return pd.DataFrame(w, columns=returns.columns)
+
+
+def _combine(r, w, rebalance) -> np.ndarray:
+    """
+    :param r: np.ndarray, (期数, 策略数)收益率
+    :param w: np.ndarray, (组合数, 策略数)权重
+    :return: np.ndarray, (期数, 组合数)净值
+    """
+    if rebalance:
+        return np.cumprod(1 + r @ w.T, axis=0)
+    # 买入持有：各策略净值按初始权重加权，剩余为现金
+    return np.cumprod(1 + r, axis=0) @ w.T + (1 - w.sum(axis=1))
+
+
+def _stacked_metrics(navs, codes, n_groups, oneyear, rf) -> np.ndarray:
+    """
+    多个净值序列按列堆叠后一次计算分组指标
+    :param navs: np.ndarray, (期数, 组合数)
+    :param codes: np.ndarray, 每期所属分组
+    :return: np.ndarray, (指标数, 组合数, n_groups)
+    """
+    n, k = navs.shape
+    prev = np.vstack((np.ones((1, k)), navs[:-1]))
+    stacked_codes = (np.arange(k)[:, None] * n_groups + codes[None, :]).ravel()
+    metrics = analysis_util._netvalue_metrics(navs.T.ravel(), stacked_codes, k * n_groups, oneyear, rf,
+                                              prev=prev.T.ravel())
+    return metrics.reshape(len(metrics), k, n_groups)
@@ -0,0 +1,106 @@
+import contextlib
+import sys
+import time
+
+
+class Instrumentation(object):
+    """
+    analyzer耗时统计，通过analyzer的instrument参数传入
+    记录next/stop每次调用及result各阶段的耗时，可选记录内存块净分配数
+    未传入时analyzer不做任何包装，无额外开销
+    """
+
+    def __init__(self, callback=None, trace_alloc=False):
+        """
+        :param callback: 每次记录时调用 callback(name, seconds, alloc_blocks)
+        :param trace_alloc: 是否记录sys.getallocatedblocks()的变化
+        """
+        self.callback = callback
+        self.trace_alloc = trace_alloc
+        self._stats = {}
+
+    def record(self, name, seconds, alloc_blocks=0):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = [0, 0., 0., 0]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        stats[3] += alloc_blocks
+        if self.callback is not None:
+            self.callback(name, seconds, alloc_blocks)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        alloc_start = sys.getallocatedblocks() if self.trace_alloc else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            alloc = sys.getallocatedblocks() - alloc_start if self.trace_alloc else 0
+            self.record(name, seconds, alloc)
+
+    def wrap(self, name, func):
+        """
+        包装函数，每次调用记录一次
+        """
+        perf_counter = time.perf_counter
+        record = self.record
+        if self.trace_alloc:
+            getallocatedblocks = sys.getallocatedblocks
+
+            def wrapper(*args, **kwargs):
+                alloc_start = getallocatedblocks()
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record(name, perf_counter() - start, getallocatedblocks() - alloc_start)
+        else:
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record(name, perf_counter() - start)
+        return wrapper
+
+    def report(self):
+        """
+        :return: pd.DataFrame, index为记录名, 列为calls/total_seconds/mean_seconds/max_seconds/alloc_blocks
+        """
+        # 只在生成报告时导入pandas，单独使用耗时统计时不加载
+        import pandas as pd
+        columns = ['calls', 'total_seconds', 'mean_seconds', 'max_seconds', 'alloc_blocks']
+        rows = {
+            name: [calls, total, total / calls, max_seconds, alloc]
+            for name, (calls, total, max_seconds, alloc) in self._stats.items()
+        }
+        return pd.DataFrame.from_dict(rows, orient='index', columns=columns).rename_axis('name')
+
+    def reset(self):
+        self._stats = {}
+
+
+def attach(analyzer, instrumentation, methods=('next', 'stop')):
+    """
+    在analyzer实例上包装需要统计的方法
+    :param analyzer: bt.Analyzer
+    :param instrumentation: Instrumentation，为None时不做任何处理
+    """
+    if instrumentation is None:
+        return
+    prefix = type(analyzer).__name__
+    for method in methods:
+        setattr(analyzer, method, instrumentation.wrap(f"{prefix}.{method}", getattr(analyzer, method)))
+
+
+def stage(instrumentation, name):
+    """
+    result中的阶段统计，instrumentation为None时为空上下文
+    """
+    if instrumentation is None:
+        return contextlib.nullcontext()
+    return instrumentation.stage(name)
@@ -0,0 +1,251 @@
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnBuffer(object):
+    """
+    固定schema的列式记录缓冲区，底层为按倍增扩容的np.ndarray
+    用于在analyzer中逐bar记录数据，避免每bar创建list/dict
+    schema: [(列名, dtype)] 或 [(列名, (dtype, 宽度))]，后者为二维列
+    """
+
+    def __init__(self, schema, capacity=1024):
+        self._names = []
+        self._columns = {}
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        for name, spec in schema:
+            if isinstance(spec, tuple):
+                dtype, width = spec
+                shape = (self._capacity, width)
+            else:
+                dtype = spec
+                shape = (self._capacity,)
+            self._names.append(name)
+            self._columns[name] = np.empty(shape, dtype=dtype)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    def append(self, *values):
+        """
+        按schema顺序追加一行
+        """
+        if self._size == self._capacity:
+            self._grow(self._capacity * 2)
+        i = self._size
+        for name, value in zip(self._names, values):
+            self._columns[name][i] = value
+        self._size += 1
+
+    def extend(self, rows):
+        """
+        按schema顺序批量追加多行，每列只做一次数组赋值
+        :param rows: list of tuple
+        """
+        if not rows:
+            return
+        n = len(rows)
+        if self._size + n > self._capacity:
+            capacity = self._capacity
+            while self._size + n > capacity:
+                capacity *= 2
+            self._grow(capacity)
+        i = self._size
+        for name, values in zip(self._names, zip(*rows)):
+            self._columns[name][i:i + n] = values
+        self._size += n
+
+    def column(self, name) -> np.ndarray:
+        """
+        返回已记录部分的视图，不复制
+        """
+        return self._columns[name][:self._size]
+
+    def to_frame(self, index=None, columns=None) -> pd.DataFrame:
+        """
+        转换为DataFrame，尽可能复用底层数组
+        :param index: 作为index的列名
+        :param columns: 二维列的列名，仅当schema中只有一个非index列且为二维时使用
+        """
+        names = [n for n in self._names if n != index]
+        idx = pd.Index(self.column(index), name=index) if index is not None else None
+        if len(names) == 1 and self._columns[names[0]].ndim == 2:
+            return pd.DataFrame(self.column(names[0]), index=idx, columns=columns, copy=False)
+        return pd.DataFrame({n: self.column(n) for n in names}, index=idx, columns=names, copy=False)
+
+    def clear(self):
+        """
+        清空已记录的行，保留已分配的数组
+        """
+        self._size = 0
+
+    def _grow(self, capacity):
+        for name, arr in self._columns.items():
+            new_arr = np.empty((capacity,) + arr.shape[1:], dtype=arr.dtype)
+            new_arr[:self._size] = arr[:self._size]
+            self._columns[name] = new_arr
+        self._capacity = capacity
+
+
+def make_buffer(schema, spill_dir=None, chunk_rows=65536, transform=None, prefix='spill_'):
+    """
+    spill_dir为None时返回ColumnBuffer，否则返回落盘至spill_dir的SpillBuffer(True为系统临时目录)
+    transform仅对SpillBuffer生效
+    """
+    if spill_dir is None:
+        return ColumnBuffer(schema)
+    return SpillBuffer(schema, spill_dir, chunk_rows=chunk_rows, transform=transform, prefix=prefix)
+
+
+class SpillBuffer(object):
+    """
+    按块落盘的列式记录缓冲区，接口同ColumnBuffer
+    内存中只保留一个chunk_rows行的块，写满后每列保存为directory下的.npy文件
+    读取时逐块内存映射，object列以pickle保存，读取时整块加载
+    创建子目录的SpillBuffer负责删除：remove()时删除，使用系统临时目录时回收时也删除
+    view()与pickle后的副本只读取，不删除目录；pickle过的SpillBuffer不再在回收时删除，避免副本读取时文件已不存在
+    """
+
+    def __init__(self, schema, directory=True, chunk_rows=65536, transform=None, prefix='spill_'):
+        """
+        :param schema: 同ColumnBuffer
+        :param directory: 落盘的根目录，每个SpillBuffer在其下创建独立的子目录
+                          True/None为系统临时目录并自动删除；指定目录时文件保留，由调用方管理
+        :param chunk_rows: 每块的行数
+        :param transform: 落盘前对每块的转换, transform({列名: np.ndarray}) -> {列名: np.ndarray}
+        :param prefix: 子目录名前缀
+        """
+        self.cleanup = directory is True or directory is None
+        if self.cleanup:
+            directory = tempfile.gettempdir()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=prefix, dir=directory)
+        self._owner = True
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True) if self.cleanup else None
+        self._chunk_rows = max(int(chunk_rows), 1)
+        self._buffer = ColumnBuffer(schema, capacity=self._chunk_rows)
+        self._transform = transform
+        self._n_chunks = 0
+        self._spilled = 0
+
+    def __len__(self):
+        return self._spilled + len(self._buffer)
+
+    @property
+    def names(self):
+        return self._buffer.names
+
+    def append(self, *values):
+        self._buffer.append(*values)
+        if len(self._buffer) >= self._chunk_rows:
+            self.flush()
+
+    def extend(self, rows):
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self._chunk_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        将内存中的块写入磁盘
+        """
+        size = len(self._buffer)
+        if size == 0:
+            return
+        columns = {n: self._buffer.column(n) for n in self._buffer.names}
+        if self._transform is not None:
+            columns = self._transform(columns)
+        for name, values in columns.items():
+            values = np.asarray(values)
+            np.save(self._chunk_path(self._n_chunks, name), values, allow_pickle=values.dtype == object)
+        self._n_chunks += 1
+        self._spilled += size
+        self._buffer.clear()
+
+    def chunks(self, columns=None):
+        """
+        逐块读取
+        :param columns: 需要的列，None为全部
+        :return: 迭代器，每块为{列名: np.ndarray}
+        """
+        self.flush()
+        names = self.names if columns is None else list(columns)
+        for i in range(self._n_chunks):
+            yield {n: self._load(i, n) for n in names}
+
+    def column(self, name) -> np.ndarray:
+        """
+        读取整列至内存
+        """
+        arrays = [chunk[name] for chunk in self.chunks([name])]
+        if not arrays:
+            return self._buffer.column(name)
+        return np.concatenate(arrays)
+
+    def to_frame(self, index=None, columns=None) -> pd.DataFrame:
+        """
+        读取全部数据为DataFrame，参数同ColumnBuffer.to_frame
+        """
+        names = [n for n in self.names if n != index]
+        idx = pd.Index(self.column(index), name=index) if index is not None else None
+        if len(names) == 1 and self._buffer._columns[names[0]].ndim == 2:
+            return pd.DataFrame(self.column(names[0]), index=idx, columns=columns, copy=False)
+        return pd.DataFrame({n: self.column(n) for n in names}, index=idx, columns=names, copy=False)
+
+    @property
+    def owner(self):
+        """
+        是否负责删除目录
+        """
+        return self._owner
+
+    def view(self) -> 'SpillBuffer':
+        """
+        读取同一目录的副本，不负责删除目录
+        """
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__, _owner=False, _finalizer=None)
+        return other
+
+    def remove(self):
+        """
+        删除落盘的文件，只对创建目录的SpillBuffer生效
+        """
+        if not self._owner:
+            return
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._n_chunks = 0
+        self._spilled = 0
+        self._buffer.clear()
+
+    def __getstate__(self):
+        # 副本可能在其他进程中读取，本身回收时不再删除目录
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        state = self.__dict__.copy()
+        state['_owner'] = False
+        state['_finalizer'] = None
+        return state
+
+    def _chunk_path(self, i, name):
+        return os.path.join(self.directory, f"{i:06d}_{name}.npy")
+
+    def _load(self, i, name):
+        path = self._chunk_path(i, name)
+        try:
+            return np.load(path, mmap_mode='r')
+        except ValueError:
+            # object列无法内存映射
+            return np.load(path, allow_pickle=True)
@@ -0,0 +1,123 @@
+import collections.abc
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from . import analysis_util
+
+RESAMPLE_METHODS = ('block', 'stationary')
+
+
+def bootstrap_analysis(returns, freq, rf=0., n_samples=10000, block_size=20, method='stationary', seed=None,
+                       quantiles=(0.05, 0.5, 0.95), chunksize=1000, max_workers=1, return_samples=False) -> dict:
+    """
+    收益率重抽样的稳健性分析，指标同get_netvalue_analysis
+    每块chunksize条样本构成(样本数, 期数)的收益率矩阵，所有样本的指标在一次数组运算中完成
+    各块使用由seed派生的独立随机数，结果与max_workers无关
+    :param returns: 收益率pd.Series / BktGeneraStatics.result() / result()['npv']
+    :param freq: 收益率频率
+    :param rf: 无风险利率
+    :param n_samples: 样本数
+    :param block_size: 块长度，stationary为平均块长度，1为逐期独立重抽样
+    :param method: block为循环块重抽样，stationary为平稳重抽样(块长度服从几何分布)
+    :param seed: 随机数种子
+    :param quantiles: 需要的分位数
+    :param chunksize: 每块的样本数，控制内存占用
+    :param max_workers: 进程数，1为在当前进程中计算，None为cpu核数
+    :param return_samples: 是否返回每个样本的指标
+    :return: {
+        'analysis': pd.DataFrame, 行为指标, 列为estimate(原序列的指标)/mean/std/各分位数
+        'samples': pd.DataFrame, 行为样本, 列为指标; return_samples为False时为None
+    }
+    """
+    freq = freq.upper()
+    if freq not in analysis_util.FREQ_ONEYEAR_MAP:
+        raise ValueError('bootstrap_analysis -- Not Right freq : ', freq)
+    if method not in RESAMPLE_METHODS:
+        raise ValueError('bootstrap_analysis -- Not Right method : ', method)
+    r = _to_returns(returns)
+    if len(r) == 0:
+        raise ValueError('bootstrap_analysis -- Not Right returns : empty')
+    labels = analysis_util._analysis_labels(freq)
+    oneyear = analysis_util.FREQ_ONEYEAR_MAP[freq]
+    values = r.to_numpy(dtype='float64')
+    chunksize = max(int(chunksize), 1)
+    sizes = [min(chunksize, n_samples - start) for start in range(0, n_samples, chunksize)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(values, size, int(block_size), method, s, oneyear, rf) for size, s in zip(sizes, seeds)]
+    if max_workers == 1:
+        chunks = [_resample_chunk(t) for t in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_resample_chunk, tasks))
+    samples = np.hstack(chunks).T if chunks else np.empty((0, len(labels)))
+    estimate = analysis_util.get_netvalue_analysis((1 + r).cumprod(), freq, rf)
+    with np.errstate(invalid='ignore'):
+        finite = np.where(np.isinf(samples), np.nan, samples)
+        analysis = pd.DataFrame({
+            'estimate': estimate.to_numpy(),
+            'mean': np.nanmean(finite, axis=0),
+            'std': np.nanstd(finite, axis=0),
+        }, index=labels)
+        for q in quantiles:
+            analysis[q] = np.nanquantile(samples, q, axis=0)
+    return {
+        'analysis': analysis,
+        'samples': pd.DataFrame(samples, columns=labels) if return_samples else None,
+    }
+
+
+def resample_index(n_bars, n_samples, block_size=20, method='stationary', rng=None) -> np.ndarray:
+    """
+    重抽样的位置矩阵
+    :param n_bars: 原序列长度
+    :param n_samples: 样本数
+    :param block_size: 块长度，stationary为平均块长度
+    :param method: block / stationary
+    :param rng: np.random.Generator
+    :return: np.ndarray, (n_samples, n_bars)
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError('resample_index -- Not Right method : ', method)
+    rng = np.random.default_rng(rng)
+    block_size = min(max(int(block_size), 1), n_bars)
+    steps = np.arange(n_bars)
+    if method == 'block':
+        # 循环块：每块起点均匀分布，块内连续，超出末尾回到开头
+        n_blocks = -(-n_bars // block_size)
+        starts = rng.integers(0, n_bars, size=(n_samples, n_blocks))
+        return (np.repeat(starts, block_size, axis=1)[:, :n_bars] + steps % block_size) % n_bars
+    # 平稳重抽样：每期以1/block_size的概率开始新块，块起点均匀分布
+    new_block = rng.random((n_samples, n_bars)) < 1. / block_size
+    new_block[:, 0] = True
+    block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    starts = rng.integers(0, n_bars, size=(n_samples, n_bars))
+    return (np.take_along_axis(starts, block_start, axis=1) + steps - block_start) % n_bars
+
+
+def _resample_chunk(task) -> np.ndarray:
+    values, size, block_size, method, seed, oneyear, rf = task
+    idx = resample_index(len(values), size, block_size, method, np.random.default_rng(seed))
+    return _sample_metrics(values[idx], oneyear, rf)
+
+
+def _sample_metrics(returns, oneyear, rf) -> np.ndarray:
+    """
+    每个样本作为一组，堆叠后由analysis_util._netvalue_metrics一次计算
+    :param returns: np.ndarray, (样本数, 期数)
+    :return: np.ndarray, (指标数, 样本数)
+    """
+    k, n = returns.shape
+    navs = np.cumprod(1 + returns, axis=1)
+    prev = np.hstack((np.ones((k, 1)), navs[:, :-1]))
+    codes = np.repeat(np.arange(k), n)
+    return analysis_util._netvalue_metrics(navs.ravel(), codes, k, oneyear, rf, prev=prev.ravel())
+
+
+def _to_returns(returns) -> pd.Series:
+    if isinstance(returns, collections.abc.Mapping):
+        returns = returns['npv']
+    if isinstance(returns, pd.DataFrame):
+        returns = returns['r']
+    return pd.Series(returns, dtype='float64').dropna()
@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+# 各结果在落盘时的行列形式
+# series: 单行，指标为列; transpose: 指标为行的表转置为周期/基准为行; frame: 原样, 非默认的index作为列保存
+RESULT_LAYOUT = {
+    'npv': 'frame',
+    'analysis': 'series',
+    'yearly_analysis': 'transpose',
+    'rolling_analysis': 'frame',
+    'drawdown_episodes': 'frame',
+    'relative_analysis': 'transpose',
+    'rolling_beta': 'frame',
+    'relative_drawdown': 'frame',
+    'position': 'frame',
+    'transaction': 'frame',
+    'df_top_k': 'frame',
+    'df_bottom_k': 'frame',
+    'df_daily_pnl': 'frame',
+}
+# transpose后行标签所在列的列名
+TRANSPOSE_INDEX_NAME = {
+    'yearly_analysis': 'period',
+    'relative_analysis': 'benchmark',
+}
+FORMAT_SUFFIX = {
+    'feather': '.feather',
+    'parquet': '.parquet',
+}
+RUNS_KEY = 'runs'
+
+
+class ResultStore(object):
+    """
+    BktGeneraStatics / DailyTradeStats结果的列式存储
+    目录结构为 root/<结果名>/<run_id>.<格式>，每个run单独一个文件，参数优化时逐个追加
+    读取基于pyarrow.dataset，只加载需要的列和run；feather格式使用内存映射
+    """
+
+    def __init__(self, root, fmt='feather'):
+        if fmt not in FORMAT_SUFFIX:
+            raise ValueError('ResultStore -- Not Right format : ', fmt)
+        self.root = root
+        self.fmt = fmt
+
+    def write(self, run_id, result, params=None):
+        """
+        写入一个run的结果，run_id已存在时覆盖
+        :param run_id: run标识
+        :param result: BktGeneraStatics.result() / DailyTradeStats.result()返回的dict，可合并传入
+        :param params: 参数dict，写入runs表
+        """
+        pa = _import_pyarrow()
+        run_id = str(run_id)
+        for key, value in result.items():
+            if value is None:
+                continue
+            if key not in RESULT_LAYOUT:
+                logging.warning(f"ResultStore - no layout for result key:{key}, skipped")
+                continue
+            frame = _to_store_frame(value, RESULT_LAYOUT[key], TRANSPOSE_INDEX_NAME.get(key, 'period'))
+            frame.insert(0, 'run_id', run_id)
+            self._write_table(key, run_id, pa.Table.from_pandas(frame, preserve_index=False))
+        runs = pd.DataFrame([{'run_id': run_id, **_flatten_params(params or {})}])
+        self._write_table(RUNS_KEY, run_id, pa.Table.from_pandas(runs, preserve_index=False))
+
+    def keys(self) -> list:
+        """
+        已保存的结果名
+        """
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(k for k in os.listdir(self.root) if k != RUNS_KEY and os.path.isdir(os.path.join(self.root, k)))
+
+    def run_ids(self) -> list:
+        suffix = FORMAT_SUFFIX[self.fmt]
+        path = os.path.join(self.root, RUNS_KEY)
+        if not os.path.isdir(path):
+            return []
+        return sorted(f[:-len(suffix)] for f in os.listdir(path) if f.endswith(suffix))
+
+    def dataset(self, key):
+        """
+        结果对应的pyarrow.dataset.Dataset，可用于自定义的过滤与投影
+        """
+        _import_pyarrow()
+        import pyarrow.dataset as ds
+        import pyarrow.fs as pafs
+        path = os.path.join(self.root, key)
+        if not os.path.isdir(path):
+            raise KeyError(f"ResultStore - no result stored for key:{key}")
+        filesystem = pafs.LocalFileSystem(use_mmap=self.fmt == 'feather')
+        return ds.dataset(path, format=self.fmt, filesystem=filesystem)
+
+    def load(self, key, columns=None, run_ids=None, expression=None) -> pd.DataFrame:
+        """
+        读取结果，只加载指定的列和run
+        :param key: 结果名，如npv/analysis/position
+        :param columns: 需要的列，None为全部，run_id总会返回
+        :param run_ids: 需要的run，None为全部
+        :param expression: 额外的pyarrow.dataset.Expression过滤条件
+        :return: pd.DataFrame
+        """
+        dataset = self.dataset(key)
+        import pyarrow.dataset as ds
+        if columns is not None:
+            columns = ['run_id'] + [c for c in columns if c != 'run_id']
+        expr = expression
+        if run_ids is not None:
+            run_filter = ds.field('run_id').isin([str(r) for r in run_ids])
+            expr = run_filter if expr is None else expr & run_filter
+        return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+    def runs(self, run_ids=None) -> pd.DataFrame:
+        """
+        run参数表
+        """
+        return self.load(RUNS_KEY, run_ids=run_ids)
+
+    def _write_table(self, key, run_id, table):
+        path = os.path.join(self.root, key)
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, run_id + FORMAT_SUFFIX[self.fmt])
+        if self.fmt == 'feather':
+            import pyarrow.feather as feather
+            # 不压缩，以便读取时内存映射
+            feather.write_feather(table, file_path, compression='uncompressed')
+        else:
+            import pyarrow.parquet as pq
+            pq.write_table(table, file_path)
+
+
+def _to_store_frame(value, layout, index_name='period') -> pd.DataFrame:
+    if layout == 'series':
+        return value.to_frame().T.reset_index(drop=True)
+    if layout == 'transpose':
+        frame = value.T
+        frame.index = frame.index.astype(str)
+        frame.columns = frame.columns.astype(str)
+        return frame.rename_axis(index_name).reset_index()
+    if isinstance(value.columns, pd.MultiIndex):
+        # 如rolling_analysis的(窗口, 指标)，合并为"窗口_指标"
+        value = value.copy()
+        value.columns = ['_'.join(map(str, c)) for c in value.columns]
+    # 未命名的整数index(RangeIndex/筛选排序后的行号/组内序号)不保存
+    if value.index.name is None and pd.api.types.is_integer_dtype(value.index.dtype):
+        return value.reset_index(drop=True)
+    return value.reset_index()
+
+
+def _flatten_params(params) -> dict:
+    """
+    标量参数原样保存，其余转为json字符串
+    """
+    res = {}
+    for k, v in params.items():
+        if v is None or isinstance(v, (bool, int, float, str, np.generic)):
+            res[k] = v
+        else:
+            res[k] = json.dumps(v, default=str, ensure_ascii=False)
+    return res
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("ResultStore requires pyarrow, please install it by `pip install pyarrow`")
+    return pyarrow
@@ -0,0 +1,356 @@
+import copy
+import datetime
+import math
+
+import numpy as np
+import pandas as pd
+
+from . import analysis_util
+
+
+class RunningNetvalueStats(object):
+    """
+    逐期更新的净值指标，每次更新O(1)，不保存历史
+    指标口径同analysis_util.get_netvalue_analysis
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.netvalue = 1.
+        self.peak = None
+        self.drawdown = 0.
+        self.maxdrawdown = 0.
+        # 收益率均值与离差平方和(Welford)
+        self.mean = 0.
+        self.m2 = 0.
+        self.win_count = 0
+        self.win_sum = 0.
+        self.lose_count = 0
+        self.lose_sum = 0.
+
+    def update(self, ret):
+        """
+        :param ret: 单期收益率
+        """
+        self.count += 1
+        self.netvalue *= 1 + ret
+        if self.peak is None or self.netvalue >= self.peak:
+            self.peak = self.netvalue
+            self.drawdown = 0.
+        else:
+            self.drawdown = self.netvalue / self.peak - 1
+            self.maxdrawdown = min(self.maxdrawdown, self.drawdown)
+        delta = ret - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (ret - self.mean)
+        if ret > 0:
+            self.win_count += 1
+            self.win_sum += ret
+        elif ret < 0:
+            self.lose_count += 1
+            self.lose_sum += ret
+
+    def update_many(self, returns):
+        """
+        按顺序批量更新，结果同逐个update
+        :param returns: np.ndarray, 多期收益率
+        """
+        returns = np.asarray(returns, dtype='float64')
+        m = len(returns)
+        if m == 0:
+            return
+        navs = self.netvalue * np.cumprod(1 + returns)
+        highpoints = np.maximum.accumulate(navs)
+        if self.peak is not None:
+            highpoints = np.maximum(highpoints, self.peak)
+        drawdowns = np.where(navs >= highpoints, 0., navs / highpoints - 1)
+        self.maxdrawdown = min(self.maxdrawdown, drawdowns.min())
+        self.drawdown = drawdowns[-1]
+        self.peak = highpoints[-1]
+        self.netvalue = navs[-1]
+        # 合并均值与离差平方和
+        mean = returns.mean()
+        m2 = ((returns - mean) ** 2).sum()
+        count = self.count + m
+        delta = mean - self.mean
+        self.mean += delta * m / count
+        self.m2 += m2 + delta ** 2 * self.count * m / count
+        self.count = count
+        win = returns > 0
+        lose = returns < 0
+        self.win_count += int(win.sum())
+        self.win_sum += returns[win].sum()
+        self.lose_count += int(lose.sum())
+        self.lose_sum += returns[lose].sum()
+
+    def updated(self, ret):
+        """
+        返回加入ret后的副本，自身不变
+        """
+        other = copy.copy(self)
+        other.update(ret)
+        return other
+
+    def analysis(self, freq, rf=0.) -> pd.Series:
+        """
+        当前指标
+        :param freq: 收益率频率
+        :param rf: 无风险利率
+        :return: pd.Series，同get_netvalue_analysis
+        """
+        freq = freq.upper()
+        labels = analysis_util._analysis_labels(freq)
+        if self.count == 0:
+            return pd.Series(dict.fromkeys(labels, np.nan), name='analysis')
+        if freq not in analysis_util.FREQ_ONEYEAR_MAP:
+            raise ValueError('RunningNetvalueStats -- Not Right freq : ', freq)
+        oneyear = analysis_util.FREQ_ONEYEAR_MAP[freq]
+        volatility_yr = math.sqrt(self.m2 / self.count) * math.sqrt(oneyear)
+        if volatility_yr == 0.0:
+            return pd.Series(dict.fromkeys(labels, np.nan), name='analysis')
+        totalreturn = self.netvalue - 1
+        return_yr = (1 + totalreturn) ** (oneyear / self.count) - 1
+        win_mean = self.win_sum / self.win_count if self.win_count else np.nan
+        lose_mean = self.lose_sum / self.lose_count if self.lose_count else np.nan
+        return pd.Series(dict(zip(labels, [
+            totalreturn,
+            return_yr,
+            volatility_yr,
+            self.maxdrawdown,
+            self.win_count / (self.win_count + self.lose_count),
+            win_mean / abs(lose_mean),
+            (return_yr - rf) / volatility_yr,
+            np.inf if self.maxdrawdown == 0 else return_yr / abs(self.maxdrawdown),
+        ])), name='analysis')
+
+
+class RunningTurnover(object):
+    """
+    逐bar更新的换手率，每次更新O(1)
+    口径同analysis_util.average_turnover: 每期成交额/期末持仓市值，取各期均值并年化
+    """
+
+    def __init__(self, freq='Y'):
+        if freq not in analysis_util.DAYS_IN_PERIOD or freq not in analysis_util.FREQ_GROUPER_MAP:
+            raise ValueError('RunningTurnover -- Not Right freq : ', freq)
+        self.freq = freq
+        self._key = None
+        self._traded_value = 0.
+        self._position_value = np.nan
+        self._has_trade = False
+        # 无成交的期数，待之后出现成交时计入(与average_turnover只统计首末成交之间的期间一致)
+        self._idle_periods = 0
+        self._rate_sum = 0.
+        self._rate_count = 0
+
+    def add_transaction(self, dt, value):
+        """
+        :param dt: 成交时间
+        :param value: 成交金额
+        """
+        self._roll(dt)
+        self._traded_value += abs(value)
+
+    def update(self, dt, position_value):
+        """
+        :param dt: bar时间
+        :param position_value: 当前持仓市值(不含现金)
+        """
+        self._roll(dt)
+        self._position_value = position_value
+
+    def turnover(self) -> float:
+        """
+        当前平均换手率(年化)，当期按已发生部分计入
+        """
+        rate_sum, rate_count = self._rate_sum, self._rate_count
+        if self._traded_value > 0:
+            rate_sum += self._period_rate()
+            rate_count += self._idle_periods + 1
+        if rate_count == 0:
+            return np.nan
+        return rate_sum / rate_count / analysis_util.DAYS_IN_PERIOD[self.freq] * 252
+
+    def _roll(self, dt):
+        key = period_key(dt, self.freq)
+        if key == self._key:
+            return
+        if self._key is not None:
+            self._close_period()
+        self._key = key
+        self._traded_value = 0.
+
+    def _close_period(self):
+        if self._traded_value > 0:
+            self._has_trade = True
+            self._rate_sum += self._period_rate()
+            self._rate_count += self._idle_periods + 1
+            self._idle_periods = 0
+        elif self._has_trade and self._position_value != 0 and not np.isnan(self._position_value):
+            self._idle_periods += 1
+
+    def _period_rate(self):
+        if self._position_value == 0 or np.isnan(self._position_value):
+            return np.inf
+        return self._traded_value / self._position_value
+
+
+def period_key(dt, freq):
+    """
+    dt所属的FREQ_GROUPER_MAP分组
+    :param dt: datetime.date / datetime.datetime
+    :param freq: 频率
+    """
+    if isinstance(dt, datetime.datetime):
+        dt = dt.date()
+    grouper = analysis_util.FREQ_GROUPER_MAP[freq]
+    if grouper == 'D':
+        return dt
+    if grouper == 'W-FRI':
+        return dt + datetime.timedelta(days=(4 - dt.weekday()) % 7)
+    if grouper == 'MS':
+        return dt.year, dt.month
+    return dt.year
+
+
+def chunked_netvalue_analysis(chunks, freq, rf=0., period=None):
+    """
+    逐块计算净值指标，内存占用与序列长度无关
+    日内频率(analysis_util.INTRADAY_BARS_PER_DAY)同analysis_util.get_intraday_analysis:
+    按日取最后净值计算日度指标，最大回撤与Calmar比使用逐bar净值
+    :param chunks: 迭代器，每块为(时间np.ndarray(datetime64), 收益率np.ndarray)，按时间排序
+    :param freq: 收益率频率
+    :param rf: 无风险利率
+    :param period: None时同get_netvalue_analysis返回pd.Series; 为D/W/M/Y时同get_period_analysis返回pd.DataFrame
+    :return: pd.Series / pd.DataFrame
+    """
+    freq = freq.upper()
+    if freq not in analysis_util.FREQ_ONEYEAR_MAP:
+        raise ValueError('chunked_netvalue_analysis -- Not Right freq : ', freq)
+    if period is not None and period not in analysis_util.FREQ_TIME_FORMAT_REF:
+        raise ValueError('chunked_netvalue_analysis -- Not Right period : ', period)
+    intraday = freq in analysis_util.INTRADAY_BARS_PER_DAY
+    stats = {}
+    bar_stats = {}
+    # 日内模式下未结束的一日: (日期, 所属分组, 上一日末净值, 当前净值)
+    pending = None
+    netvalue = 1.
+    for dates, returns in chunks:
+        returns = np.asarray(returns, dtype='float64')
+        if len(returns) == 0:
+            continue
+        days = np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]')
+        keys = _period_keys(days, period)
+        if not intraday:
+            for key, segment in _segments(keys, returns):
+                stats.setdefault(key, RunningNetvalueStats()).update_many(segment)
+            continue
+        for key, segment in _segments(keys, returns):
+            bar_stats.setdefault(key, RunningNetvalueStats()).update_many(segment)
+        # 逐日最后净值
+        navs = netvalue * np.cumprod(1 + returns)
+        netvalue = navs[-1]
+        last = np.flatnonzero(np.r_[days[1:] != days[:-1], True])
+        day_navs, day_keys, day_list = navs[last], keys[last], days[last]
+        if pending is not None and day_list[0] != pending[0]:
+            _close_day(stats, pending)
+            pending = (day_list[0], day_keys[0], pending[3], day_navs[0])
+        elif pending is not None:
+            pending = (pending[0], pending[1], pending[2], day_navs[0])
+        else:
+            pending = (day_list[0], day_keys[0], 1., day_navs[0])
+        for i in range(1, len(day_list)):
+            _close_day(stats, pending)
+            pending = (day_list[i], day_keys[i], pending[3], day_navs[i])
+    if pending is not None:
+        _close_day(stats, pending)
+    labels = analysis_util._analysis_labels('D' if intraday else freq)
+    res = {}
+    for key, st in stats.items():
+        values = st.analysis('D' if intraday else freq, rf)
+        if intraday and not np.isnan(values.iloc[2]):
+            maxdrawdown = bar_stats[key].maxdrawdown
+            values.iloc[3] = maxdrawdown
+            values.iloc[7] = np.inf if maxdrawdown == 0 else values.iloc[1] / abs(maxdrawdown)
+        res[key] = values.to_numpy()
+    if period is None:
+        return pd.Series(dict(zip(labels, res.get(None, np.full(len(labels), np.nan)))), name='analysis')
+    if not res:
+        return pd.DataFrame()
+    return pd.DataFrame(np.column_stack(list(res.values())), index=labels, columns=pd.Index(list(res), dtype=object))
+
+
+def _close_day(stats, day):
+    _, key, start, end = day
+    stats.setdefault(key, RunningNetvalueStats()).update(end / start - 1)
+
+
+def _period_keys(days, period) -> np.ndarray:
+    """
+    每期所属的分组标签，只对不同的日期做格式化
+    """
+    if period is None:
+        return np.full(len(days), None, dtype=object)
+    uniques, inverse = np.unique(days, return_inverse=True)
+    labels = np.asarray(pd.DatetimeIndex(uniques).strftime(analysis_util.FREQ_TIME_FORMAT_REF[period]), dtype=object)
+    return labels[inverse]
+
+
+def _segments(keys, values):
+    """
+    按连续相同的key切分
+    """
+    bounds = np.r_[0, np.flatnonzero(keys[1:] != keys[:-1]) + 1, len(keys)]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        yield keys[start], values[start:end]
+
+
+def chunked_average_turnover(dates, positions, transactions, freq='Y') -> float:
+    """
+    逐块计算平均换手率，口径同analysis_util.average_turnover，内存占用只与期数有关
+    :param dates: 迭代器，每块为回测的bar时间np.ndarray(datetime64)
+    :param positions: 迭代器，每块为(时间, 持仓市值)，同一时间可有多行(如持仓长表)，不含现金
+    :param transactions: 迭代器，每块为(时间, 成交金额)
+    :param freq: 计算换手率的基准频率
+    :return: 平均换手率
+    """
+    if freq not in analysis_util.DAYS_IN_PERIOD or freq not in analysis_util.FREQ_GROUPER_MAP:
+        raise ValueError('chunked_average_turnover -- Not Right freq : ', freq)
+    # 每期最后一个bar的时间
+    period_last = {}
+    for chunk in dates:
+        chunk = np.asarray(chunk, dtype='datetime64[ns]')
+        for key, values in _segments(_period_ordinals(chunk, freq), chunk):
+            period_last[key] = values[-1]
+    if not period_last:
+        return np.nan
+    periods = np.fromiter(period_last.keys(), dtype='int64', count=len(period_last))
+    last_dates = np.fromiter(period_last.values(), dtype='datetime64[ns]', count=len(period_last))
+    # 期末持仓市值
+    position_value = np.zeros(len(periods))
+    order = np.argsort(last_dates)
+    for chunk_dates, values in positions:
+        chunk_dates = np.asarray(chunk_dates, dtype='datetime64[ns]')
+        loc = np.searchsorted(last_dates[order], chunk_dates)
+        loc = np.minimum(loc, len(order) - 1)
+        hit = last_dates[order][loc] == chunk_dates
+        np.add.at(position_value, order[loc[hit]], np.asarray(values, dtype='float64')[hit])
+    # 各期成交额
+    traded = {}
+    for chunk_dates, values in transactions:
+        chunk_dates = np.asarray(chunk_dates, dtype='datetime64[ns]')
+        for key, segment in _segments(_period_ordinals(chunk_dates, freq), np.abs(np.asarray(values, dtype='float64'))):
+            traded[key] = traded.get(key, 0.) + segment.sum()
+    if not traded:
+        return np.nan
+    # 首末成交期之间无成交的期成交额为0
+    first_trade, last_trade = min(traded), max(traded)
+    in_range = (periods >= first_trade) & (periods <= last_trade)
+    total_value = np.array([traded.get(p, 0.) for p in periods[in_range]])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover_rate = total_value / position_value[in_range]
+    return pd.Series(turnover_rate, dtype='float64').mean() / analysis_util.DAYS_IN_PERIOD[freq] * 252
+
+
+def _period_ordinals(dates, freq) -> np.ndarray:
+    return analysis_util.period_index(dates, freq).asi8